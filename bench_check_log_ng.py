@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for check_log_ng.
+
+The log files are generated reproducibly from the seed, the number of lines,
+the number of patterns and the ratio of matched lines, and LogChecker.check()
+is run for each mode on them. The patterns are literal, anchored or heavy
+regular expressions, or the mix of them.
+Each case runs in a new process to measure its peak RSS, and the wall time of
+each phase of the check is also reported.
+
+Examples:
+    python bench_check_log_ng.py
+    python bench_check_log_ng.py --lines 1000000 --patterns 50 --mode single
+    python bench_check_log_ng.py --pattern-kind regex
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import multiprocessing
+import argparse
+
+from check_log_ng import LogChecker
+from check_log_ng import _ScanStats
+
+MODES = ['single', 'byte', 'multiline', 'trace_inode', 'multi']
+FORMATS = ['syslog', 'custom']
+PATTERN_KINDS = ['literal', 'anchored', 'regex', 'mixed']
+
+# The custom format, which is like the log of an application.
+# 2017-12-05T12:34:50.123 [12345] INFO message
+FORMAT_CUSTOM = r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3} \[\d+\] )(.*)$'
+
+_WORDS = [
+    'connection', 'session', 'opened', 'closed', 'user', 'request',
+    'completed', 'started', 'service', 'timeout', 'retry', 'queue',
+    'worker', 'cache', 'updated', 'client', 'server', 'response']
+_LEVELS = ['INFO', 'DEBUG', 'NOTICE']
+_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# time.process_time() is not available in python 2.
+_process_time = getattr(time, 'process_time', None) or time.clock
+
+
+def make_keywords(count):
+    """Return the list of the keywords at the head of the matched messages."""
+    return ["ERROR{0:04d}".format(i) for i in range(count)]
+
+
+def make_patterns(count, kind='mixed'):
+    """Return the list of the patterns matching the messages with the
+    keywords.
+
+    Args:
+        count (int): The number of the patterns.
+        kind (str, optional): 'literal', 'anchored' at the head of the
+            line, which is matched with the header, heavy 'regex', or 'mixed'
+            to cycle through them.
+
+    """
+    patterns = []
+    for i, keyword in enumerate(make_keywords(count)):
+        pattern_kind = kind
+        if kind == 'mixed':
+            pattern_kind = PATTERN_KINDS[i % 3]
+        if pattern_kind == 'anchored':
+            patterns.append("^.+ {0} ".format(keyword))
+        elif pattern_kind == 'regex':
+            patterns.append(
+                r"[Ee][Rr]{{2}}[Oo][Rr]{0}\s+\w+(?:\s+\w+)*$".format(
+                    keyword[len("ERROR"):]))
+        else:
+            patterns.append(keyword)
+    return patterns
+
+
+def _make_header(rand, index, log_format):
+    """Return the header of the line."""
+    second = index % 86400
+    if log_format == 'custom':
+        return "2017-12-05T{0:02d}:{1:02d}:{2:02d}.{3:03d} [{4}] ".format(
+            second // 3600, second // 60 % 60, second % 60,
+            rand.randint(0, 999), rand.randint(1000, 65535))
+    return "{0} {1:2d} {2:02d}:{3:02d}:{4:02d} hostname app[{5}]: ".format(
+        _MONTHS[11], 5, second // 3600, second // 60 % 60, second % 60,
+        rand.randint(1000, 65535))
+
+
+def _make_message(rand, keywords, match_ratio):
+    """Return the message of the line."""
+    words = ' '.join(rand.choice(_WORDS) for _ in range(rand.randint(4, 12)))
+    if keywords and rand.random() < match_ratio:
+        return "{0} {1}".format(rand.choice(keywords), words)
+    return "{0} {1}".format(rand.choice(_LEVELS), words)
+
+
+def generate_corpus(
+        filename, lines, keywords, match_ratio, seed=0,
+        log_format='syslog', multiline=False):
+    """Generate the log file.
+
+    Args:
+        filename (str): The file name of the log file.
+        lines (int): The number of the lines.
+        keywords (list): The keywords which are included in the matched lines.
+        match_ratio (float): The ratio of the matched lines.
+        seed (int, optional): The seed of the random numbers.
+        log_format (str, optional): 'syslog' or 'custom'.
+        multiline (bool, optional): If true, the messages are split into
+            the lines with the same header.
+
+    Returns:
+        The size of the log file.
+
+    """
+    rand = random.Random(seed)
+    with io.open(filename, mode='w', encoding='utf-8') as fileobj:
+        index = 0
+        while index < lines:
+            header = _make_header(rand, index, log_format)
+            message = _make_message(rand, keywords, match_ratio)
+            if multiline:
+                words = message.split(' ')
+                count = min(rand.randint(1, 4), lines - index)
+                size = len(words) // count + 1
+                for i in range(count):
+                    fileobj.write(header)
+                    fileobj.write(' '.join(words[i * size:(i + 1) * size]))
+                    fileobj.write('\n')
+                index += count
+            else:
+                fileobj.write(header)
+                fileobj.write(message)
+                fileobj.write('\n')
+                index += 1
+    return os.path.getsize(filename)
+
+
+def _make_config(args, mode, state_directory):
+    """Return the configuration of LogChecker."""
+    if args.format == 'custom':
+        logformat = FORMAT_CUSTOM
+    else:
+        logformat = LogChecker.FORMAT_SYSLOG
+    return {
+        "logformat": logformat,
+        "state_directory": state_directory,
+        "pattern_list": make_patterns(args.patterns, args.pattern_kind),
+        "negpattern_list": args.negpattern,
+        "critical_pattern_list": [],
+        "critical_negpattern_list": [],
+        "case_insensitive": args.case_insensitive,
+        "encoding": "utf-8",
+        "warning": 0,
+        "critical": 0,
+        "trace_inode": mode == 'trace_inode',
+        "multiline": mode == 'multiline',
+        "byte_scan": mode == 'byte',
+        "scantime": 86400,
+        "expiration": 691200,
+        "cachetime": 0,
+        "lock_timeout": 3,
+        "output_limit": 10,
+    }
+
+
+def _run_case(params):
+    """Run the case in the worker process, and return the result."""
+    args, mode, logfile_pattern, state_directory = params
+    config = _make_config(args, mode, state_directory)
+    results = []
+    for _ in range(args.repeat):
+        for filename in os.listdir(state_directory):
+            os.unlink(os.path.join(state_directory, filename))
+        wall_start = time.time()
+        cpu_start = _process_time()
+        log = LogChecker(config)
+        setup_time = time.time() - wall_start
+        log.check(logfile_pattern)
+        wall_time = time.time() - wall_start
+        cpu_time = _process_time() - cpu_start
+        results.append({
+            "wall": wall_time, "cpu": cpu_time, "setup": setup_time,
+            "found": len(log.found) + len(log.critical_found),
+            "phases": dict((name, wall_time)
+                           for name, (wall_time, _)
+                           in log.get_stats().phases.items())})
+    best = min(results, key=lambda result: result['wall'])
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss // 1024
+    best['maxrss'] = maxrss
+    return best
+
+
+def run(args):
+    """Generate the log files, run the benchmarks and print the results."""
+    workdir = tempfile.mkdtemp(prefix='bench_check_log_ng.')
+    try:
+        keywords = make_keywords(args.patterns)
+        logdir = os.path.join(workdir, 'log')
+        os.mkdir(logdir)
+        print("# lines={0} patterns={1} ({2}) match_ratio={3} format={4} seed={5}".format(
+            args.lines, args.patterns, args.pattern_kind, args.match_ratio,
+            args.format, args.seed))
+        print("{0:<12} {1:>10} {2:>10} {3:>12} {4:>9} {5:>9} {6:>9} {7:>10} {8:>8} {9}".format(
+            "mode", "lines", "MB", "lines/sec", "wall", "cpu", "setup",
+            "maxrss(KB)", "found",
+            " ".join("{0:>7}".format(name) for name in _ScanStats.PHASES)))
+        for mode in args.mode:
+            if mode == 'multi':
+                logfile_pattern = os.path.join(logdir, 'multi.log.*')
+                size = 0
+                lines = args.lines // args.files
+                for i in range(args.files):
+                    size += generate_corpus(
+                        os.path.join(logdir, 'multi.log.{0}'.format(i)),
+                        lines, keywords, args.match_ratio,
+                        seed=args.seed + i, log_format=args.format)
+                lines = lines * args.files
+            else:
+                logfile_pattern = os.path.join(logdir, mode + '.log')
+                lines = args.lines
+                size = generate_corpus(
+                    logfile_pattern, lines, keywords, args.match_ratio,
+                    seed=args.seed, log_format=args.format,
+                    multiline=(mode == 'multiline'))
+
+            state_directory = os.path.join(workdir, 'state.' + mode)
+            os.mkdir(state_directory)
+            pool = multiprocessing.Pool(1)
+            try:
+                result = pool.apply(
+                    _run_case, ((args, mode, logfile_pattern, state_directory),))
+            finally:
+                pool.close()
+                pool.join()
+            print("{0:<12} {1:>10} {2:>10.1f} {3:>12.0f} {4:>9.3f} {5:>9.3f} {6:>9.3f} {7:>10} {8:>8} {9}".format(
+                mode, lines, size / 1024 / 1024, lines / result['wall'],
+                result['wall'], result['cpu'], result['setup'],
+                result['maxrss'], result['found'],
+                " ".join("{0:>7.3f}".format(result['phases'][name])
+                         for name in _ScanStats.PHASES)))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir)
+
+
+def _make_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for check_log_ng.")
+    parser.add_argument(
+        "--lines", action="store", type=int, default=100000,
+        metavar="<lines>",
+        help="The number of lines in the log file (default: %(default)s).")
+    parser.add_argument(
+        "--patterns", action="store", type=int, default=10,
+        metavar="<number>",
+        help="The number of patterns (default: %(default)s).")
+    parser.add_argument(
+        "--pattern-kind", action="store", choices=PATTERN_KINDS,
+        default='mixed',
+        help=("The kind of the patterns: literal, anchored at the head of "
+              "the line, heavy regular expressions, or the mix of them "
+              "(default: %(default)s)."))
+    parser.add_argument(
+        "--negpattern", action="append", default=[],
+        metavar="<pattern>",
+        help="The negative pattern. Can be specified multiple times.")
+    parser.add_argument(
+        "--match-ratio", action="store", type=float, default=0.001,
+        metavar="<ratio>",
+        help="The ratio of the matched lines (default: %(default)s).")
+    parser.add_argument(
+        "--format", action="store", choices=FORMATS, default='syslog',
+        help="The format of the log file (default: %(default)s).")
+    parser.add_argument(
+        "--mode", action="append", choices=MODES,
+        help=("The mode to be run. Can be specified multiple times. "
+              "(default: all modes)"))
+    parser.add_argument(
+        "--files", action="store", type=int, default=4,
+        metavar="<number>",
+        help="The number of log files in the multi mode (default: %(default)s).")
+    parser.add_argument(
+        "--repeat", action="store", type=int, default=3,
+        metavar="<number>",
+        help="The number of runs for each mode. The best is reported (default: %(default)s).")
+    parser.add_argument(
+        "--seed", action="store", type=int, default=0,
+        metavar="<seed>",
+        help="The seed of the random numbers (default: %(default)s).")
+    parser.add_argument(
+        "-i", "--case-insensitive", action="store_true",
+        help="Do a case insensitive scan.")
+    return parser
+
+
+def main():
+    """Run the benchmarks."""
+    parser = _make_parser()
+    args = parser.parse_args()
+    if not args.mode:
+        args.mode = MODES
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: set ts=4 sw=4 et:
@@ -32,12 +32,50 @@ import glob
 import time
 import re
 import hashlib
+import itertools
 import base64
+import calendar
+import codecs
+import fnmatch
+import collections
+import contextlib
+import cProfile
 import fcntl
-import warnings
+import gzip
+import json
+import multiprocessing
+import select
+import shlex
+import signal
+import socket
+import stat
+import struct
+import tempfile
+import zlib
 
 FALLBACK_PATH = "/usr/local/hb-agent/bin"
 
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
 try:
     import argparse
 except ImportError as _ex:
@@ -51,6 +89,23 @@ except ImportError as _ex:
 
 # Globals
 __version__ = '2.0.8'
+_DAEMON_MAX_CHECKERS = 1024
+# The seconds to wait for the response of the daemon. It is below the default
+# timeout of check_nrpe (10 seconds), so that the client still has time to
+# check by itself.
+_DAEMON_TIMEOUT = 5
+
+# The maximum period for the watcher to wait for the events of log files.
+_WATCH_INTERVAL = 60
+# The period for the watcher to wait for the following writes.
+_WATCH_DELAY = 0.5
+
+# The states in order of severity, to return the worst state of the checks
+# defined by --check-definitions: OK, WARNING, UNKNOWN and CRITICAL.
+_STATE_SEVERITY = [0, 1, 3, 2]
+
+# time.process_time() is not available in python 2.
+_process_time = getattr(time, 'process_time', None) or time.clock
 
 
 class LogChecker(object):
@@ -69,12 +124,70 @@ class LogChecker(object):
         r'(?:[^ :\[\]]+(?:\[\d+?\])?:\s)?)'
         r'(.*)$')
     '''FORMAT_SYSLOG is `^(TIMESTAMP HOSTNAME (TAG )?)(MSG)$`.'''
+    FORMAT_RFC5424 = (
+        r'^(<\d{1,3}>\d{1,2} \S+ \S+ \S+ \S+ \S+ '
+        r'(?:-|(?:\[(?:[^\]\\]|\\.)*\])+) ?)'
+        r'(.*)$')
+    '''FORMAT_RFC5424 is `^(<PRI>VERSION TIMESTAMP HOSTNAME APP-NAME PROCID
+    MSGID STRUCTURED-DATA )(MSG)$`.'''
+    FORMAT_ISO8601 = r'^(%F[T ]%T\S*\s)(.*)$'
+    '''FORMAT_ISO8601 is `^(TIMESTAMP )(MSG)$`.'''
+    FORMAT_COMBINED = r'^(\S+ \S+ \S+ \[[^\]]+\] )(.*)$'
+    '''FORMAT_COMBINED is `^(HOST IDENT USER [TIMESTAMP] )(REQUEST ...)$` of
+    the combined log format of Apache and nginx.'''
+    NAMED_FORMATS = {
+        'syslog': FORMAT_SYSLOG,
+        'rfc5424': FORMAT_RFC5424,
+        'iso8601': FORMAT_ISO8601,
+        'combined': FORMAT_COMBINED,
+    }
+    '''The built-in log formats, which can be specified by the names.'''
 
     _SUFFIX_SEEK = ".seek"
     _SUFFIX_SEEK_WITH_INODE = ".inode.seek"
     _SUFFIX_CACHE = ".cache"
     _SUFFIX_LOCK = ".lock"
-    _RETRY_PERIOD = 0.5
+    _SUFFIX_LISTING = ".listing"
+    _SUFFIX_PENDING = ".pending"
+    _SUFFIX_MANIFEST = ".manifest"
+    _STATE_DATABASE = "check_log_ng.sqlite3"
+    _RETRY_PERIOD = 0.05
+    # The sizes of the head of the log file and the tail before the seek
+    # position to identify the log file.
+    _HEAD_SIZE = 1024
+    _TAIL_SIZE = 256
+    # The size to read at once to find the timestamps in the log file.
+    _TIMESTAMP_SEARCH_SIZE = 65536
+    # The number of lines matched at once for each check in the shared scan.
+    _SHARED_BATCH_LINES = 4096
+    # The size of the pending file to merge its entries for each log file,
+    # and the number of the first and the last found lines kept by merging
+    # them without output_limit.
+    _PENDING_COMPACT_SIZE = 4 * 1024 * 1024
+    _PENDING_MAX_LINES = 1000
+    _RE_TIMESTAMP_ISO8601 = re.compile(
+        r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,]\d+)?'
+        r'(Z|[+-]\d{2}:?\d{2})?')
+    _RE_TIMESTAMP_CLF = re.compile(
+        r'(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2})'
+        r'(?: ([+-]\d{4}))?')
+    _RE_TIMESTAMP_SYSLOG = re.compile(
+        r'([A-Z][a-z]{2}) +(\d{1,2}) (\d{2}):(\d{2}):(\d{2})(?: (\d{4}))?')
+    _MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    # The encodings in which every byte of a multibyte character is >= 0x80.
+    _RE_ASCII_COMPATIBLE_ENCODING = re.compile(
+        r'^(?:ascii|utf-8|iso8859-\d+|cp125\d|euc_\w+|gb2312)$')
+    _RE_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux]')
+    # Patterns which may match a line as unicode but not as bytes: non-ASCII
+    # characters and their escapes, and the constructs matching a character,
+    # which match only a byte of a multibyte character as bytes.
+    _RE_UNSAFE_FOR_BYTES = re.compile(
+        r'[^\x00-\x7f]|(?:^|[^\\])(?:\\\\)*(?:\.|\\[wWdDsSbBuUxN0-9])|\[\^')
+    # The ASCII letters which match non-ASCII letters case-insensitively.
+    _RE_UNSAFE_FOR_BYTES_IGNORECASE = re.compile(r'[iksIKS]')
+    _PATTERN_TYPES = [
+        'pattern', 'critical_pattern', 'negpattern', 'critical_negpattern']
     _LOGFORMAT_EXPANSION_LIST = [
         {'%%': '_PERCENT_'},
         {'%F': '%Y-%m-%d'},
@@ -97,7 +210,8 @@ class LogChecker(object):
 
         The keys of configuration parameters are::
 
-            logformat (str): Regular expression for log format.
+            logformat (str): Regular expression for log format, or the name
+                of the built-in log format in `NAMED_FORMATS`.
             state_directory (str): The directory to store seek files, cache
                 file and lock file.
             pattern_list (list): The list of regular expressions to scan for
@@ -115,12 +229,31 @@ class LogChecker(object):
             critical (int): The number of times found that be needed to return CRITICAL.
             trace_inode (bool): Trace the inode of the log file.
             multiline (bool): Treat multiple lines outputted at once as one message.
+            multiline_max_lines (int): The maximum number of lines of a
+                message held in memory with multiline. If 0, unlimited.
+            multiline_max_size (int): The maximum number of characters of
+                a message held in memory with multiline. If 0, unlimited.
             scantime (int): The range of time to scan.
             expiration (int): The expiration of seek files.
             cachetime (int): The period to cache the result.
             lock_timeout (int): The period to wait for if another process is running.
             output_header (bool): Suppress the output of the message on matched lines.
             quiet (bool): Suppress output of matched lines.
+            byte_scan (bool): Scan the log file as bytes and decode only the
+                matched lines.
+            jobs (int): The number of processes to scan multiple log files.
+            state_backend (str): The backend to store seek positions,
+                'file' or 'sqlite'.
+            output_limit (int): Output only the first and last this many
+                matched lines. If 0, output all matched lines.
+            perfdata (bool): Output the performance data of the check.
+            seek_by_time (bool): If the log file has no seek file, start
+                scanning at the first line newer than scantime.
+            listing_cache (bool): Cache the listings of the directories of
+                log files in the state directory, and support '**'
+                in the file names of log files.
+            trace (str): The file to append the trace events to as JSON
+                lines. If None, tracing is disabled.
 
         Args:
             config (dict): The dictionary of configuration parameters.
@@ -141,12 +274,22 @@ class LogChecker(object):
         self.config['critical'] = 0
         self.config['trace_inode'] = False
         self.config['multiline'] = False
+        self.config['multiline_max_lines'] = 10000
+        self.config['multiline_max_size'] = 1048576
         self.config['scantime'] = 86400
         self.config['expiration'] = 691200
         self.config['cachetime'] = 60
         self.config['lock_timeout'] = 3
         self.config['output_header'] = False
         self.config['output_quiet'] = False
+        self.config['byte_scan'] = False
+        self.config['jobs'] = 1
+        self.config['state_backend'] = 'file'
+        self.config['output_limit'] = 0
+        self.config['perfdata'] = False
+        self.config['seek_by_time'] = False
+        self.config['listing_cache'] = False
+        self.config['trace'] = None
 
         # overwrite values with user's values
         for key in self.config:
@@ -167,30 +310,70 @@ class LogChecker(object):
         if self.config['case_insensitive']:
             self.pattern_flags = re.IGNORECASE
 
+        # compile each pattern list once.
+        self.matchers = {}
+        for pattern_type in LogChecker._PATTERN_TYPES:
+            self.matchers[pattern_type] = _PatternMatcher(
+                self.config[pattern_type + '_list'], self.pattern_flags)
+
+        if self.config['logformat'] in LogChecker.NAMED_FORMATS:
+            self.config['logformat'] = LogChecker.NAMED_FORMATS[
+                self.config['logformat']]
         self.re_logformat = re.compile(LogChecker._expand_logformat_by_strftime(
             self.config['logformat']))
-        _debug("logformat='{0}'".format(self.re_logformat.pattern))
+
+        # The writer of the trace events. Check whether it is None before
+        # building an event, so that tracing costs nothing if disabled.
+        self.tracer = None
+        if self.config['trace']:
+            self.tracer = _Tracer(self.config['trace'])
+            self.tracer.emit('logformat', pattern=self.re_logformat.pattern)
+
+        # If the header and the message joined is equal to the line, the line
+        # is matched as it is, and split only if matched in the single line
+        # mode. With dry run, every line is split to validate the log format.
+        self.deferred_split = (
+            not self.config['dry_run'] and not self.config['multiline'] and
+            LogChecker._is_contiguous_logformat(self.re_logformat))
+
+        # The bytes matcher screens raw lines for the byte scanning mode.
+        self.byte_matcher = None
+        if self.config['byte_scan']:
+            self.byte_matcher = self._create_byte_matcher()
+
+        # The database of seek positions, opened at the first use.
+        self.seek_database = None
+
+        # The digests of search conditions keyed by the log file pattern.
+        self.digest_conditions = {}
 
         # status variables
         self.state = None
         self.message = None
         self.messages = []
-        self.found = []
+        self.found = self._create_found_list()
         self.found_messages = []
-        self.critical_found = []
+        self.critical_found = self._create_found_list()
         self.critical_found_messages = []
+        self.stats = _ScanStats()
+        self.found_by_logfile = []
+        self.pending = {}
+        self.pending_logfiles = []
 
-    def _check_updated(self, logfile, offset, filesize):
+    def _check_updated(self, logfile_stat, offset):
         """Check whether the log file is updated.
 
-        If updated, return True.
+        If updated, return True. If offset is None, only the modification
+        time is checked.
         """
-        if os.stat(logfile).st_mtime < time.time() - self.config['scantime']:
-            _debug("Skipped: mtime < curtime - scantime")
+        if logfile_stat.st_mtime < time.time() - self.config['scantime']:
+            if self.tracer is not None:
+                self.tracer.emit('skip', reason="mtime < curtime - scantime")
             return False
 
-        if filesize == offset:
-            _debug("Skipped: filesize == offset")
+        if offset is not None and logfile_stat.st_size == offset:
+            if self.tracer is not None:
+                self.tracer.emit('skip', reason="filesize == offset")
             return False
 
         return True
@@ -202,35 +385,35 @@ class LogChecker(object):
         """
         if negative:
             if critical:
-                pattern_list = self.config['critical_negpattern_list']
                 pattern_type = "critical_negpattern"
             else:
-                pattern_list = self.config['negpattern_list']
                 pattern_type = "negpattern"
         else:
             if critical:
-                pattern_list = self.config['critical_pattern_list']
                 pattern_type = "critical_pattern"
             else:
-                pattern_list = self.config['pattern_list']
                 pattern_type = "pattern"
 
-        if not pattern_list:
-            return False
-        for pattern in pattern_list:
-            if not pattern:
-                continue
-            matchobj = re.search(pattern, message, self.pattern_flags)
-            if matchobj:
-                _debug("{0}: '{1}' found".format(pattern_type, pattern))
-                return True
-        return False
+        return self.matchers[pattern_type].search(message) is not None
 
     def _remove_old_seekfile(self, logfile_pattern_list, tag=''):
         """Remove old seek files."""
         if self.config['dry_run']:
             return True
 
+        if self.config['state_backend'] == 'sqlite':
+            for logfile_pattern in logfile_pattern_list.split():
+                seekfile_pattern = (
+                    re.sub(r'[^-0-9A-Za-z*?]', '_', logfile_pattern) +
+                    tag + LogChecker._SUFFIX_SEEK)
+                rows = self._call_seek_database(
+                    'remove_old', seekfile_pattern,
+                    time.time() - self.config['expiration'])
+                if self.tracer is not None:
+                    self.tracer.emit(
+                        'remove', seekfile=seekfile_pattern, rows=rows)
+            return True
+
         cwd = os.getcwd()
         try:
             os.chdir(self.config['state_directory'])
@@ -252,7 +435,8 @@ class LogChecker(object):
                 if curtime - self.config['expiration'] <= os.stat(seekfile).st_mtime:
                     continue
                 try:
-                    _debug("remove seekfile: {0}".format(seekfile))
+                    if self.tracer is not None:
+                        self.tracer.emit('remove', seekfile=seekfile)
                     os.unlink(seekfile)
                 except OSError:
                     LogChecker.print_message("Unable to remove old seekfile: {0}".format(
@@ -276,6 +460,16 @@ class LogChecker(object):
         if self.config['trace_inode']:
             prefix = LogChecker.get_digest(logfile_pattern)
 
+        if self.config['state_backend'] == 'sqlite':
+            seekfile_pattern = "{0}.[0-9]*{1}{2}".format(
+                prefix, tag, LogChecker._SUFFIX_SEEK_WITH_INODE)
+            rows = self._call_seek_database(
+                'remove_old', seekfile_pattern,
+                time.time() - self.config['expiration'])
+            if self.tracer is not None:
+                self.tracer.emit('remove', seekfile=seekfile_pattern, rows=rows)
+            return True
+
         cwd = os.getcwd()
         try:
             os.chdir(self.config['state_directory'])
@@ -293,7 +487,8 @@ class LogChecker(object):
             if curtime - self.config['expiration'] <= os.stat(seekfile).st_mtime:
                 continue
             try:
-                _debug("remove seekfile: {0}".format(seekfile))
+                if self.tracer is not None:
+                    self.tracer.emit('remove', seekfile=seekfile)
                 os.unlink(seekfile)
             except OSError:
                 LogChecker.print_message("Unable to remove old seekfile: {0}".format(seekfile))
@@ -309,15 +504,46 @@ class LogChecker(object):
 
     def _get_logfile_list(self, filename_pattern_list):
         """Get the list of log files from pattern of filenames."""
-        logfile_list = []
+        return [logfile for logfile, _ in
+                self._get_logfile_stat_list(filename_pattern_list)]
+
+    def _get_logfile_stat_list(self, filename_pattern_list):
+        """Get the list of the tuples of the log file and its stat from
+        pattern of filenames, sorted by the modification time.
+
+        Each file is stat-ed only once, and the stat is reused later.
+        The files removed after globbing are skipped.
+        """
+        directory_index = None
+        if self.config['listing_cache']:
+            directory_index = _DirectoryIndex(os.path.join(
+                self.config['state_directory'],
+                LogChecker.get_digest(filename_pattern_list) +
+                LogChecker._SUFFIX_LISTING), tracer=self.tracer)
+
+        logfile_stat_list = []
         for filename_pattern in filename_pattern_list.split():
-            filename_list = glob.glob(filename_pattern)
-            if filename_list:
-                logfile_list.extend(filename_list)
-        if logfile_list:
-            logfile_list = sorted(
-                logfile_list, key=lambda x: os.stat(x).st_mtime)
-        return logfile_list
+            if directory_index is None:
+                filename_list = glob.glob(filename_pattern)
+            else:
+                filename_list = directory_index.glob(filename_pattern)
+            for logfile in filename_list:
+                try:
+                    logfile_stat = os.stat(logfile)
+                except OSError:
+                    continue
+                logfile_stat_list.append((logfile, logfile_stat))
+        logfile_stat_list.sort(key=lambda x: x[1].st_mtime)
+
+        if directory_index is not None and not self.config['dry_run']:
+            directory_index.save()
+        return logfile_stat_list
+
+    def _create_found_list(self):
+        """Create the list to store found lines."""
+        if self.config['output_limit'] > 0:
+            return _FoundList(self.config['output_limit'])
+        return []
 
     def _update_state(self):
         """Update the state of the result."""
@@ -367,94 +593,228 @@ class LogChecker(object):
         if self.state != LogChecker.STATE_OK:
             message = "{0}: {1}".format(state_string, ', '.join(self.messages))
             message = message.replace('|', '(pipe)')
+        if self.config['perfdata']:
+            message = "{0} | {1}".format(message, self._get_perfdata())
         self.message = message
         return
 
+    def _get_perfdata(self):
+        """Return the performance data of the match counts and the scan."""
+        scan_time = self.stats.phases['scan'][0]
+        lines = self.stats.lines
+        lines_per_sec = 0
+        if scan_time > 0:
+            lines_per_sec = lines / scan_time
+        return ("warning={0} critical={1} files={2} bytes={3}B lines={4} "
+                "duration={5:.6f}s lines_per_sec={6:.0f}").format(
+                    len(self.found), len(self.critical_found),
+                    len(self.stats.files), self.stats.bytes, lines,
+                    scan_time, lines_per_sec)
+
+    def _create_byte_matcher(self):
+        """Create the matcher of bytes for the byte scanning mode.
+
+        If the byte scanning mode is not available, return None.
+        """
+        if self.config['dry_run'] or self.config['multiline']:
+            return None
+        if not LogChecker.is_ascii_compatible(self.config['encoding']):
+            return None
+        if not LogChecker._is_contiguous_logformat(self.re_logformat):
+            return None
+        for pattern_type in LogChecker._PATTERN_TYPES:
+            for pattern in self.config[pattern_type + '_list']:
+                if not self._is_safe_for_bytes(pattern):
+                    return None
+        pattern_list = (self.config['pattern_list'] +
+                        self.config['critical_pattern_list'])
+        return _PatternMatcher(
+            pattern_list, self.pattern_flags,
+            encoding=self.config['encoding'])
+
+    def _is_safe_for_bytes(self, pattern):
+        """Whether the pattern as bytes matches all the lines matched by it
+        as unicode."""
+        if LogChecker._RE_UNSAFE_FOR_BYTES.search(pattern):
+            return False
+        if (self.pattern_flags & re.IGNORECASE and
+                LogChecker._RE_UNSAFE_FOR_BYTES_IGNORECASE.search(pattern)):
+            return False
+        return True
+
+    def _split_line(self, line):
+        """Split the line into the header and the message.
+
+        If the log format does not match, return None.
+        """
+        matchobj = self.re_logformat.match(line)
+        if not matchobj:
+            return None
+        if self.re_logformat.groups == 2:
+            # faster than group(1) and group(2).
+            return matchobj.groups()
+        return matchobj.group(1), matchobj.group(2)
+
     def _set_found(self, header, message, found, critical_found):
         """Set the found and critical_found if matching pattern is found."""
-        _debug("header='{0}', message='{1}'".format(header, message))
-        log_message = ''.join([header, message])
-        found_negpattern = self._find_pattern(log_message, negative=True)
-        found_critical_negpattern = self._find_pattern(
-            log_message, negative=True, critical=True)
+        is_found, is_critical_found = self._match(header, message)
+        if is_found:
+            found.append({"header": header, "message": message})
+        if is_critical_found:
+            critical_found.append({"header": header, "message": message})
+        return
 
-        if not found_negpattern and not found_critical_negpattern:
-            if self._find_pattern(log_message):
-                found.append({"header": header, "message": message})
-        if not found_critical_negpattern:
-            if self._find_pattern(log_message, critical=True):
-                critical_found.append({"header": header, "message": message})
+    def _match(self, header, message):
+        """Return the tuple of whether the pattern and the critical pattern
+        are found in the log message."""
+        return self._match_line(''.join([header, message]))
+
+    def _match_line(self, log_message):
+        """Return the tuple of whether the pattern and the critical pattern
+        are found in the line."""
+        found_pattern = self._find_pattern(log_message)
+        found_critical_pattern = self._find_pattern(log_message, critical=True)
+        if not found_pattern and not found_critical_pattern:
+            return False, False
+
+        # negative patterns are only evaluated for the candidate lines.
+        if self._find_pattern(log_message, negative=True, critical=True):
+            return False, False
+        is_found = False
+        if found_pattern:
+            is_found = not self._find_pattern(log_message, negative=True)
+        return is_found, bool(found_critical_pattern)
+
+    def _find_patterns(self, log_message):
+        """Return the list of whether each type of patterns is found in the
+        log message, in the order of `_PATTERN_TYPES`."""
+        return [self.matchers[pattern_type].search(log_message) is not None
+                for pattern_type in LogChecker._PATTERN_TYPES]
+
+    @staticmethod
+    def _judge(found_pattern, found_critical_pattern,
+               found_negpattern, found_critical_negpattern):
+        """Return the tuple of whether the pattern and the critical pattern
+        are found from the types of patterns found, in the same way as
+        `_match`."""
+        if not found_pattern and not found_critical_pattern:
+            return False, False
+        if found_critical_negpattern:
+            return False, False
+        return found_pattern and not found_negpattern, found_critical_pattern
+
+    def _set_found_line(
+            self, line, is_found, is_critical_found, found, critical_found):
+        """Split the matched line into the header and the message, and set
+        the found and critical_found."""
+        splitted = self._split_line(line)
+        if splitted:
+            header, message = splitted
+        else:
+            header = ''
+            message = line
+        if is_found:
+            found.append({"header": header, "message": message})
+        if is_critical_found:
+            critical_found.append({"header": header, "message": message})
+        return
+
+    def _set_found_record(self, record, found, critical_found):
+        """Set the found and critical_found if the multiline record
+        matches."""
+        message, is_found, is_critical_found = record.match()
+        if is_found:
+            found.append({"header": record.header, "message": message})
+        if is_critical_found:
+            critical_found.append({"header": record.header, "message": message})
         return
 
     def _check_each_multiple_lines(
-            self, logfile, start_position, found, critical_found):
-        """Match the pattern each multiple lines in the log file."""
-        messages = []
-        previous_header = None
-        header = None
-        message = None
+            self, fileobj, start_position, found, critical_found):
+        """Match the pattern each multiple lines in the log file.
+
+        Returns:
+            The tuple of the end position and the number of lines.
+        """
+        record = None
+        lines = 0
 
-        with io.open(logfile, mode='r', encoding=self.config['encoding'],
-                     errors='replace') as fileobj:
-            fileobj.seek(start_position, 0)
+        textobj = io.TextIOWrapper(
+            fileobj, encoding=self.config['encoding'], errors='replace')
+        try:
+            textobj.seek(start_position, 0)
 
-            for line in fileobj:
+            for line in textobj:
+                lines += 1
                 line = line.rstrip()
-                _debug("line='{0}'".format(line))
-
-                matchobj = self.re_logformat.match(line)
-                if matchobj:
-                    header = matchobj.group(1)
-                    message = matchobj.group(2)
-                    _debug("  logformat: header='{0}', message='{1}'".format(
-                        header, message))
+
+                splitted = self._split_line(line)
+                if splitted:
+                    header, message = splitted
                 else:
-                    _debug("  logformat: unmatched")
-                    if previous_header is None:
+                    if record is None:
                         if self.config['dry_run']:
                             LogChecker.print_message("[DRY RUN] Log format does not match. Set --format option.")
                             sys.exit(LogChecker.STATE_UNKNOWN)
                         else:
                             # If you do not enable dry run, ignore log format errors.
-                            previous_header = ''
-                    # assume it is continuation
-                    header = previous_header
+                            header = ''
+                    else:
+                        # assume it is continuation
+                        header = record.header
                     message = line
 
-                if previous_header is not None and previous_header != header:
+                if record is not None and record.header != header:
                     # The current line is a new log line.
-                    self._set_found(previous_header, ' '.join(messages), found, critical_found)
-                    messages = []
+                    self._set_found_record(record, found, critical_found)
+                    record = None
 
-                previous_header = header
-                messages.append(message)
-            end_position = fileobj.tell()
-            fileobj.close()
+                if record is None:
+                    record = _MultilineRecord(self, header)
+                record.append(message)
+            end_position = textobj.tell()
+        finally:
+            textobj.detach()
 
         # flush
-        if messages:
-            self._set_found(header, ' '.join(messages), found, critical_found)
-        return end_position
+        if record is not None:
+            self._set_found_record(record, found, critical_found)
+        return end_position, lines
 
     def _check_each_single_line(
-            self, logfile, start_position, found, critical_found):
-        """Match the pattern each a single line in the log file."""
-        with io.open(logfile, mode='r', encoding=self.config['encoding'],
-                     errors='replace') as fileobj:
-            fileobj.seek(start_position, 0)
+            self, fileobj, start_position, found, critical_found):
+        """Match the pattern each a single line in the log file.
 
-            for line in fileobj:
+        Returns:
+            The tuple of the end position and the number of lines.
+        """
+        lines = 0
+        textobj = io.TextIOWrapper(
+            fileobj, encoding=self.config['encoding'], errors='replace')
+        try:
+            textobj.seek(start_position, 0)
+
+            if self.deferred_split:
+                match_line = self._match_line
+                for line in textobj:
+                    lines += 1
+                    line = line.rstrip()
+                    is_found, is_critical_found = match_line(line)
+                    if is_found or is_critical_found:
+                        self._set_found_line(
+                            line, is_found, is_critical_found,
+                            found, critical_found)
+                end_position = textobj.tell()
+                return end_position, lines
+
+            for line in textobj:
+                lines += 1
                 line = line.rstrip()
-                _debug("line='{0}'".format(line))
-
-                matchobj = self.re_logformat.match(line)
-                if matchobj:
-                    header = matchobj.group(1)
-                    message = matchobj.group(2)
-                    _debug("  logformat: header='{0}', message='{1}'".format(
-                        header, message))
+
+                splitted = self._split_line(line)
+                if splitted:
+                    header, message = splitted
                 else:
-                    _debug("  logformat: unmatched")
                     if self.config['dry_run']:
                         LogChecker.print_message("[DRY RUN] Log format does not match. Set --format option.")
                         sys.exit(LogChecker.STATE_UNKNOWN)
@@ -464,15 +824,204 @@ class LogChecker(object):
                         message = line
 
                 self._set_found(header, message, found, critical_found)
-            end_position = fileobj.tell()
-            fileobj.close()
-        return end_position
+            end_position = textobj.tell()
+        finally:
+            textobj.detach()
+        return end_position, lines
+
+    def _check_each_traced(
+            self, fileobj, start_position, found, critical_found):
+        """Match the pattern in the log file with tracing the offsets of
+        each line and the matched records.
+
+        This is used instead of the other methods only if tracing is
+        enabled, so that they do not trace each line. Every line is decoded,
+        split and matched one by one even in the byte scanning mode, so the
+        matched records are the same, but the time is not.
+
+        Returns:
+            The tuple of the end position and the number of lines.
+        """
+        count = [0]
+        lines = self._trace_lines(
+            self._iter_decoded_lines(fileobj, start_position), count)
+        for (offset, end, header, message,
+             is_found, is_critical_found) in self._iter_records(lines):
+            self._trace_found(
+                offset, end, header, message, is_found, is_critical_found)
+            if is_found:
+                found.append({"header": header, "message": message})
+            if is_critical_found:
+                critical_found.append({"header": header, "message": message})
+        return fileobj.tell(), count[0]
+
+    def _trace_lines(self, lines, count):
+        """Yield the tuples of the decoded lines with tracing the offsets of
+        each line, and count the lines in count[0]."""
+        for offset, end, line in lines:
+            count[0] += 1
+            self.tracer.emit('line', offset=offset, end=end)
+            yield offset, end, line
+
+    def _trace_found(
+            self, offset, end, header, message, is_found, is_critical_found):
+        """Trace the matched record with the patterns found in it."""
+        log_message = ''.join([header, message])
+        patterns = {}
+        for pattern_type in LogChecker._PATTERN_TYPES:
+            pattern = self.matchers[pattern_type].search(log_message)
+            if pattern is not None:
+                patterns[pattern_type] = pattern
+        self.tracer.emit(
+            'found', offset=offset, end=end, header=header, message=message,
+            warning=is_found, critical=is_critical_found, patterns=patterns)
+
+    def _check_each_single_line_bytes(
+            self, fileobj, start_position, found, critical_found):
+        """Match the pattern each a single line in the log file as bytes.
+
+        The chunks of the log file are searched by the bytes matcher at once,
+        and only the lines including the matched positions are decoded and
+        matched again as the unicode string.
+        """
+        lines = 0
+        reader = _LineReader(fileobj, start_position)
+        chunk_screen = self.byte_matcher.chunk_screen
+
+        for _, data in reader.iter_chunks():
+            lines += data.count(b'\n')
+            if not data.endswith(b'\n'):
+                lines += 1
+            if chunk_screen is None:
+                line_list = data.split(b'\n')
+                if not line_list[-1]:
+                    line_list.pop()
+                for line in line_list:
+                    self._set_found_bytes(line, found, critical_found)
+                continue
+
+            start = 0
+            while True:
+                matchobj = chunk_screen.search(data, start)
+                if not matchobj:
+                    break
+                line_start = data.rfind(b'\n', 0, matchobj.start()) + 1
+                line_end = data.find(b'\n', matchobj.start())
+                if line_end < 0:
+                    line_end = len(data)
+                self._set_found_bytes(
+                    data[line_start:line_end], found, critical_found)
+                start = line_end + 1
+        end_position = reader.position
+        return end_position, lines
+
+    def _iter_found(self, fileobj, logfile, position):
+        """Yield the matched records in the log file.
+
+        Args:
+            fileobj (file): The binary file object of the log file.
+            logfile (str): The file name of the log file to be scanned.
+            position (list): The list which has the start position. It is
+                updated to the end position when the log file is scanned
+                to the end.
+
+        Yields:
+            The dict of the matched record. "end" is the position just after
+            the record.
+
+        """
+        lines = self._iter_decoded_lines(fileobj, position[0])
+        if self.tracer is not None:
+            lines = self._trace_lines(lines, [0])
+        for (offset, end, header, message,
+             is_found, is_critical_found) in self._iter_records(lines):
+            if self.tracer is not None:
+                self._trace_found(
+                    offset, end, header, message, is_found, is_critical_found)
+            if is_critical_found:
+                severity = LogChecker.STATE_CRITICAL
+            else:
+                severity = LogChecker.STATE_WARNING
+            yield {
+                "file": logfile, "offset": offset, "end": end,
+                "header": header, "message": message,
+                "severity": severity}
+        position[0] = fileobj.tell()
+
+    def _iter_records(self, lines):
+        """Yield the tuples of the offset, the end position, the header,
+        the message, and whether the pattern and the critical pattern are
+        found of each matched record from the tuples of the decoded lines."""
+        builder = _RecordBuilder(self)
+        for offset, end, line in lines:
+            record = builder.push(offset, end, line)
+            if record is not None:
+                yield record
+
+        # flush
+        record = builder.flush()
+        if record is not None:
+            yield record
+
+    def _iter_decoded_lines(self, fileobj, start_position):
+        """Yield the tuples of the offset, the end position and the decoded
+        line from the start position in the binary file object."""
+        encoding = self.config['encoding']
+        if LogChecker.is_ascii_compatible(encoding):
+            reader = _LineReader(fileobj, start_position)
+            for offset, data in reader.iter_chunks():
+                data_end = offset + len(data)
+                for line in data.split(b'\n'):
+                    if offset >= data_end:
+                        break
+                    end = min(offset + len(line) + 1, data_end)
+                    yield offset, end, line.decode(encoding, 'replace').rstrip()
+                    offset = end
+            fileobj.seek(reader.position, 0)
+            return
+
+        fileobj.seek(start_position, 0)
+        textobj = io.TextIOWrapper(fileobj, encoding=encoding, errors='replace')
+        offset = start_position
+        while True:
+            line = textobj.readline()
+            if not line:
+                break
+            end = textobj.tell()
+            yield offset, end, line.rstrip()
+            offset = end
+        textobj.detach()
+        fileobj.seek(offset, 0)
+
+    def _set_found_bytes(self, line, found, critical_found):
+        """Set the found and critical_found if the line as bytes matches."""
+        line = line.rstrip()
+        if self.byte_matcher.search(line) is None:
+            return
+        line = line.decode(self.config['encoding'], 'replace')
+
+        splitted = self._split_line(line)
+        if splitted:
+            header, message = splitted
+        else:
+            header = ''
+            message = line
+        self._set_found(header, message, found, critical_found)
+        return
 
     def _create_digest_condition(self, logfile_pattern):
-        """Create the digest of search conditions."""
+        """Create the digest of search conditions.
+
+        The digest is computed once for each log file pattern, because
+        the configuration is not changed.
+        """
+        digest_condition = self.digest_conditions.get(logfile_pattern)
+        if digest_condition is not None:
+            return digest_condition
         strings = []
         for key in sorted(self.config):
-            if key in ['expiration', 'cachetime', 'lock_timeout']:
+            if key in ['expiration', 'cachetime', 'lock_timeout', 'jobs',
+                       'listing_cache', 'trace']:
                 continue
             value = self.config[key]
             if isinstance(value, list):
@@ -488,15 +1037,23 @@ class LogChecker(object):
                 strings.append("{0}={1}".format(key, value))
         strings.append(logfile_pattern)
         digest_condition = LogChecker.get_digest('\n'.join(strings))
+        self.digest_conditions[logfile_pattern] = digest_condition
         return digest_condition
 
     def _create_seek_filename(
-            self, logfile_pattern, logfile, trace_inode=False, tag=''):
-        """Return the file name of seek file."""
+            self, logfile_pattern, logfile, trace_inode=False, tag='',
+            inode=None):
+        """Return the file name of seek file.
+
+        If inode is given, it is used instead of the inode of the log file
+        with trace_inode.
+        """
         prefix = None
         filename = None
         if trace_inode:
-            filename = (str(os.stat(logfile).st_ino) +
+            if inode is None:
+                inode = os.stat(logfile).st_ino
+            filename = (str(inode) +
                         tag + LogChecker._SUFFIX_SEEK_WITH_INODE)
             prefix = LogChecker.get_digest(logfile_pattern)
         else:
@@ -507,31 +1064,37 @@ class LogChecker(object):
         seekfile = os.path.join(self.config['state_directory'], filename)
         return seekfile
 
-    def _create_cache_filename(self, logfile_pattern, tag=''):
-        """Return the file name of cache file."""
+    def _create_state_filename(self, logfile_pattern, suffix, tag=''):
+        """Return the file name of the state file for the conditions."""
         digest_condition = self._create_digest_condition(logfile_pattern)
         filename_elements = []
         filename_elements.append(digest_condition)
         if tag:
             filename_elements.append(".")
             filename_elements.append(tag)
-        filename_elements.append(LogChecker._SUFFIX_CACHE)
-        cache_filename = os.path.join(
+        filename_elements.append(suffix)
+        return os.path.join(
             self.config['state_directory'], "".join(filename_elements))
-        return cache_filename
+
+    def _create_cache_filename(self, logfile_pattern, tag=''):
+        """Return the file name of cache file."""
+        return self._create_state_filename(
+            logfile_pattern, LogChecker._SUFFIX_CACHE, tag=tag)
 
     def _create_lock_filename(self, logfile_pattern, tag=''):
         """Return the file name of lock file."""
-        digest_condition = self._create_digest_condition(logfile_pattern)
-        filename_elements = []
-        filename_elements.append(digest_condition)
-        if tag:
-            filename_elements.append(".")
-            filename_elements.append(tag)
-        filename_elements.append(LogChecker._SUFFIX_LOCK)
-        lock_filename = os.path.join(
-            self.config['state_directory'], "".join(filename_elements))
-        return lock_filename
+        return self._create_state_filename(
+            logfile_pattern, LogChecker._SUFFIX_LOCK, tag=tag)
+
+    def _create_pending_filename(self, logfile_pattern, tag=''):
+        """Return the file name of the pending file kept by the watcher."""
+        return self._create_state_filename(
+            logfile_pattern, LogChecker._SUFFIX_PENDING, tag=tag)
+
+    def _create_manifest_filename(self, logfile_pattern, tag=''):
+        """Return the file name of the manifest of the log files last seen."""
+        return self._create_state_filename(
+            logfile_pattern, LogChecker._SUFFIX_MANIFEST, tag=tag)
 
     def check(
             self, logfile_pattern, seekfile=None,
@@ -539,6 +1102,8 @@ class LogChecker(object):
         """Check log files.
 
         If cache is enabled and exists, return cache.
+        If none of the log files is changed since the last check, return
+        OK without the lock.
 
         Args:
             logfile_pattern (str): The file names of log files to be scanned.
@@ -550,35 +1115,502 @@ class LogChecker(object):
         logfile_pattern = LogChecker.to_unicode(logfile_pattern)
         seekfile = LogChecker.to_unicode(seekfile)
         tag = LogChecker.to_unicode(tag)
-        cachefile = self._create_cache_filename(logfile_pattern, tag=tag)
-        lockfile = self._create_lock_filename(logfile_pattern, tag=tag)
+        session = self._begin_check(logfile_pattern, seekfile, tag)
+        if session is None:
+            return
+        self._scan(logfile_pattern, seekfile, remove_seekfile, tag,
+                   logfile_stat_list=session['logfile_stat_list'])
+        self._end_check(session)
+        return
 
-        locked = False
-        cur_time = time.time()
-        timeout_time = cur_time + self.config['lock_timeout']
-        while cur_time < timeout_time:
-            if self.config['cachetime'] > 0:
-                state, message = self._get_cache(cachefile)
-                if state != LogChecker.STATE_NO_CACHE:
-                    self.state = state
-                    self.message = message
+    @staticmethod
+    def check_shared(checks):
+        """Check log files for several checks, reading each log file once.
+
+        The log files of the checks are grouped by the file name and the
+        encoding, and each of them is read once from the minimum start
+        position among the checks, and matched with the patterns of every
+        check. Each check keeps its own seek files, cache file and lock file
+        as `check`, and the result is got by `get_state` and `get_message`.
+        The byte scanning mode and jobs are not used.
+        If a check exits by the error, such as the log format error of the
+        dry run, only the check is UNKNOWN and the other checks continue.
+
+        Args:
+            checks (list): The list of tuples of the instance of LogChecker,
+                and the arguments of `check`, that is, the file names of
+                log files to be scanned, the file name of the seek file,
+                whether to remove expired seek files, and the tag.
+
+        """
+        sessions = []
+        lockfiles = set()
+        for log, logfile_pattern, seekfile, remove_seekfile, tag in checks:
+            logfile_pattern = LogChecker.to_unicode(logfile_pattern)
+            seekfile = LogChecker.to_unicode(seekfile)
+            tag = LogChecker.to_unicode(tag)
+            lockfile = log._create_lock_filename(logfile_pattern, tag=tag)
+            if lockfile in lockfiles:
+                # The checks with the same conditions share the state files.
+                log.state = LogChecker.STATE_UNKNOWN
+                log.message = "UNKNOWN: The same check is defined more than once."
+                continue
+            lockfiles.add(lockfile)
+            try:
+                session = log._begin_check(logfile_pattern, seekfile, tag)
+            except SystemExit:
+                log._set_aborted()
+                continue
+            if session is not None:
+                sessions.append((log, session, remove_seekfile))
+
+        aborted = set()
+        logfile_keys = []
+        targets_by_logfile = {}
+        for log, session, _ in sessions:
+            try:
+                with log.stats.phase('glob'):
+                    targets = log._get_scan_targets(
+                        session['logfile_pattern'], session['seekfile'],
+                        session['tag'],
+                        logfile_stat_list=session['logfile_stat_list'])
+            except SystemExit:
+                aborted.add(log)
+                continue
+            for logfile, seekfile, listed_stat in targets:
+                key = (logfile, log.config['encoding'])
+                if key not in targets_by_logfile:
+                    targets_by_logfile[key] = []
+                    logfile_keys.append(key)
+                targets_by_logfile[key].append((log, seekfile, listed_stat))
+        for key in logfile_keys:
+            LogChecker._scan_shared(key[0], targets_by_logfile[key], aborted)
+
+        for log, session, remove_seekfile in sessions:
+            if log in aborted:
+                LogChecker.unlock(session['lockfile'], session['lockfileobj'])
+                log._set_aborted()
+                continue
+            try:
+                if (remove_seekfile and LogChecker.is_multiple_logfiles(
+                        session['logfile_pattern'])):
+                    log._remove_expired_seekfiles(
+                        session['logfile_pattern'], session['tag'])
+                log._end_check(session)
+            except SystemExit:
+                LogChecker.unlock(session['lockfile'], session['lockfileobj'])
+                log._set_aborted()
+        return
+
+    def _set_aborted(self):
+        """Set the result of the check aborted by the error in `check_shared`.
+        The error has been already printed."""
+        self.state = LogChecker.STATE_UNKNOWN
+        self.message = "UNKNOWN: The check is aborted by the error."
+
+    @staticmethod
+    def _scan_shared(logfile, targets, aborted):
+        """Scan the log file once for several checks.
+
+        The time to scan is added to the scan phase of each check.
+
+        Args:
+            logfile (str): The file name of the log file to be scanned.
+            targets (list): The list of tuples of the instance of LogChecker,
+                the seek file and the stat of the log file when listed.
+                The encodings of the instances are the same.
+            aborted (set): The set of the instances of LogChecker aborted by
+                the errors. The instances exiting while scanning are added,
+                and the others are scanned continuously.
+
+        """
+        stats_list = []
+        for log, _, _ in targets:
+            if log not in aborted and log.stats not in stats_list:
+                stats_list.append(log.stats)
+        with _ScanStats.shared_phase(stats_list, 'scan'):
+            LogChecker._scan_shared_logfile(logfile, targets, aborted)
+        return
+
+    @staticmethod
+    def _scan_shared_logfile(logfile, targets, aborted):
+        """Scan the log file once for several checks, as `_scan_shared`."""
+        start_time = time.time()
+        reader = targets[0][0]
+        fileobj, logfile_stat = reader._open_logfile(logfile)
+        if fileobj is None:
+            return
+
+        with fileobj:
+            scans = []
+            for log, seekfile, listed_stat in targets:
+                if log in aborted:
+                    continue
+                if log.tracer is not None:
+                    log.tracer.context['file'] = logfile
+                # With trace_inode, the seek file is named by the listed inode.
+                if (log.config['trace_inode'] and listed_stat is not None and
+                        listed_stat.st_ino != logfile_stat.st_ino):
+                    continue
+                try:
+                    start_position = log._get_start_position(
+                        seekfile, fileobj, logfile_stat)
+                except _IncompleteArchiveError:
+                    # The log file may be still being compressed.
                     return
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                lockfileobj = LogChecker.lock(lockfile)
-            if lockfileobj:
-                locked = True
+                except SystemExit:
+                    aborted.add(log)
+                    continue
+                if start_position is not None:
+                    scans.append(_SharedScan(log, seekfile, start_position))
+            if not scans:
+                return
+
+            groups = LogChecker._group_shared_scans(scans)
+            try:
+                lines = reader._iter_decoded_lines(
+                    fileobj, min(scan.start_position for scan in scans))
+                while True:
+                    # The lines are decoded once, and matched in batches
+                    # for each check.
+                    batch = list(itertools.islice(
+                        lines, LogChecker._SHARED_BATCH_LINES))
+                    if not batch:
+                        break
+                    for screen, group in groups:
+                        candidates = None
+                        if screen is not None:
+                            candidates = LogChecker._screen_lines(screen, batch)
+                        for scan in group:
+                            LogChecker._push_shared_scan(
+                                scan, aborted, batch, candidates)
+                for scan in scans:
+                    LogChecker._push_shared_scan(scan, aborted)
+                end_position = fileobj.tell()
+                signature = reader._create_signature(
+                    fileobj, logfile_stat, end_position)
+            except _IncompleteArchiveError:
+                # The log file may be still being compressed.
+                return
+
+        scan_time = time.time() - start_time
+        for scan in scans:
+            if scan.checker in aborted:
+                continue
+            file_stats = {
+                "bytes": end_position - scan.start_position,
+                "lines": scan.lines, "time": scan_time}
+            scan.checker._add_result(logfile, scan.seekfile, (
+                scan.found, scan.critical_found, end_position, file_stats,
+                logfile_stat, signature))
+        return
+
+    @staticmethod
+    def _push_shared_scan(scan, aborted, lines=None, candidates=None):
+        """Push the lines to the scan, or complete it if the lines are not
+        given. If the check exits, it is added to the aborted checks."""
+        if scan.checker in aborted:
+            return
+        try:
+            if lines is None:
+                scan.flush()
+            else:
+                scan.push_lines(lines, candidates)
+        except SystemExit:
+            aborted.add(scan.checker)
+        return
+
+    @staticmethod
+    def _group_shared_scans(scans):
+        """Group the scans by the regular expression to screen the lines.
+
+        The lines are screened at once for the scans in the single line
+        mode with the same flags, by the patterns and the critical patterns
+        of all of them.
+
+        Returns:
+            The list of tuples of the compiled regular expression to search
+            the chunks of lines, or None, and the list of the scans.
+
+        """
+        unscreened = []
+        scans_by_flags = {}
+        for scan in scans:
+            if scan.builder.deferred_split:
+                scans_by_flags.setdefault(
+                    scan.checker.pattern_flags, []).append(scan)
+            else:
+                unscreened.append(scan)
+
+        groups = []
+        if unscreened:
+            groups.append((None, unscreened))
+        for flags, group in scans_by_flags.items():
+            pattern_list = []
+            for scan in group:
+                pattern_list.extend(scan.checker.config['pattern_list'])
+                pattern_list.extend(scan.checker.config['critical_pattern_list'])
+            matcher = _PatternMatcher(pattern_list, flags, chunk=True)
+            groups.append((matcher.chunk_screen, group))
+        return groups
+
+    @staticmethod
+    def _screen_lines(screen, lines):
+        """Return the list of the tuples of the decoded lines which include
+        the positions matched by the regular expression to search the chunks
+        of lines."""
+        text = '\n'.join([line for _, _, line in lines])
+        candidates = []
+        index = 0
+        line_start = 0
+        start = 0
+        while True:
+            matchobj = screen.search(text, start)
+            if not matchobj:
                 break
-            cur_time = time.time()
-            time.sleep(LogChecker._RETRY_PERIOD)
-        if not locked:
+            previous_line_start = line_start
+            line_start = text.rfind('\n', 0, matchobj.start()) + 1
+            index += text.count('\n', previous_line_start, line_start)
+            candidates.append(lines[index])
+            line_end = text.find('\n', matchobj.start())
+            if line_end < 0:
+                break
+            start = line_end + 1
+        return candidates
+
+    def _begin_check(self, logfile_pattern, seekfile, tag):
+        """Begin the check, and lock it unless the result is determined
+        without scanning.
+
+        Returns:
+            The dict of the state of the check to be passed to `_end_check`
+            after scanning, which also has the list of the log files and
+            their stats listed for the manifest, to be scanned without
+            listing them again. If the result is determined, return None.
+
+        """
+        cachefile = self._create_cache_filename(logfile_pattern, tag=tag)
+        lockfile = self._create_lock_filename(logfile_pattern, tag=tag)
+
+        if self._get_cached_result(cachefile):
+            return None
+
+        # The found lines kept by the watcher are added to the result.
+        pendingfile = self._create_pending_filename(logfile_pattern, tag=tag)
+        manifestfile = self._create_manifest_filename(logfile_pattern, tag=tag)
+        with self.stats.phase('glob'):
+            logfile_stat_list = self._get_manifest_stat_list(logfile_pattern)
+        with self.stats.phase('stat'):
+            manifest = self._create_manifest(seekfile, logfile_stat_list)
+            if (self._is_unchanged(manifestfile, manifest, logfile_pattern, tag)
+                    and not os.path.exists(pendingfile)):
+                return None
+
+        with self.stats.phase('lock'):
+            lockfileobj = self._lock(lockfile)
+        if not lockfileobj:
             self.state = LogChecker.STATE_UNKNOWN
             self.message = "UNKNOWN: Lock timeout. Another process is running."
-            return
+            return None
+        # The process which had the lock may have published the result
+        # while waiting for the lock.
+        if self._get_cached_result(cachefile):
+            LogChecker.unlock(lockfile, lockfileobj)
+            return None
 
+        self._load_pending(pendingfile)
+        return {
+            "logfile_pattern": logfile_pattern, "seekfile": seekfile,
+            "tag": tag, "cachefile": cachefile, "lockfile": lockfile,
+            "lockfileobj": lockfileobj, "pendingfile": pendingfile,
+            "manifestfile": manifestfile, "manifest": manifest,
+            "logfile_stat_list": logfile_stat_list}
+
+    def _end_check(self, session):
+        """End the check after scanning, and unlock it."""
+        for logfile in self.pending_logfiles:
+            if logfile in self.pending:
+                self._add_found(
+                    logfile, self._create_found_list(),
+                    self._create_found_list())
+        self._remove_pending(session['pendingfile'])
+
+        try:
+            if self.seek_database is not None:
+                with self.stats.phase('seek'):
+                    self._call_seek_database('commit')
+
+            if self.config['cachetime'] > 0:
+                with self.stats.phase('cache'):
+                    self._update_cache(session['cachefile'])
+            with self.stats.phase('stat'):
+                manifest = dict(session['manifest'], seek=self._get_seek_state(
+                    session['logfile_pattern'], session['tag'],
+                    session['manifest']))
+                self._update_manifest(session['manifestfile'], manifest)
+        finally:
+            LogChecker.unlock(session['lockfile'], session['lockfileobj'])
+        return
+
+    def _get_manifest_stat_list(self, logfile_pattern):
+        """Return the list of the tuples of the log file and its stat for the
+        manifest. For multiple log files, it is also the list to be scanned.
+        """
+        if LogChecker.is_multiple_logfiles(logfile_pattern):
+            return self._get_logfile_stat_list(logfile_pattern)
+        try:
+            return [(logfile_pattern, os.stat(logfile_pattern))]
+        except OSError:
+            return []
+
+    @staticmethod
+    def _create_manifest(seekfile, logfile_stat_list):
+        """Return the manifest of the log files, which has the inode, the
+        size and the modification time of each log file.
+
+        It is created before scanning, so that the lines written while
+        scanning are regarded as changes in the next check.
+        """
+        files = {}
+        for logfile, logfile_stat in logfile_stat_list:
+            files[LogChecker.to_unicode(logfile)] = [
+                logfile_stat.st_ino, logfile_stat.st_size,
+                logfile_stat.st_mtime]
+        return {"seekfile": seekfile, "files": files}
+
+    def _get_seek_state(self, logfile_pattern, tag, manifest):
+        """Return the state of the seek positions of the log files in the
+        manifest, which tells whether they are removed or reset since the
+        last check.
+
+        It has the inode and the modification time of each seek file, or
+        None if it does not exist. With the sqlite state backend, it has the
+        inode of the database file instead, because the database file is
+        also updated by the other checks.
+        """
+        if self.config['state_backend'] == 'sqlite':
+            database = os.path.join(
+                self.config['state_directory'], LogChecker._STATE_DATABASE)
+            try:
+                return {"database": os.stat(database).st_ino}
+            except OSError:
+                return {"database": None}
+        seek_state = {}
+        for logfile, (inode, _, _) in manifest['files'].items():
+            seekfile = manifest['seekfile']
+            if not seekfile or LogChecker.is_multiple_logfiles(logfile_pattern):
+                seekfile = self._create_seek_filename(
+                    logfile_pattern, logfile,
+                    trace_inode=self.config['trace_inode'], tag=tag,
+                    inode=inode)
+            try:
+                seekfile_stat = os.stat(seekfile)
+                seek_state[seekfile] = [
+                    seekfile_stat.st_ino, seekfile_stat.st_mtime]
+            except OSError:
+                seek_state[seekfile] = None
+        return seek_state
+
+    def _is_unchanged(self, manifestfile, manifest, logfile_pattern, tag):
+        """Return True if the manifest is the same as the manifest file
+        written by the last check, and the seek positions are not removed
+        or reset since then."""
+        if self.config['dry_run']:
+            return False
+        try:
+            with io.open(manifestfile, mode='r', encoding='utf-8') as fileobj:
+                last_manifest = json.load(fileobj)
+        except (EnvironmentError, ValueError):
+            last_manifest = None
+        last_seek_state = None
+        if isinstance(last_manifest, dict):
+            last_seek_state = last_manifest.pop('seek', None)
+        unchanged = (
+            last_manifest == manifest and
+            last_seek_state == self._get_seek_state(
+                logfile_pattern, tag, manifest))
+        if self.tracer is not None:
+            self.tracer.emit(
+                'manifest', manifestfile=manifestfile, unchanged=unchanged)
+        return unchanged
+
+    def _update_manifest(self, manifestfile, manifest):
+        """Update the manifest file."""
+        if self.config['dry_run']:
+            return True
+
+        tmp_manifestfile = manifestfile + "." + str(os.getpid())
+        with io.open(tmp_manifestfile, mode='w', encoding='utf-8') as fileobj:
+            fileobj.write(LogChecker.to_unicode(
+                json.dumps(manifest, sort_keys=True)))
+            fileobj.flush()
+            fileobj.close()
+        os.rename(tmp_manifestfile, manifestfile)
+        return True
+
+    def accumulate(
+            self, logfile_pattern, seekfile=None,
+            remove_seekfile=False, tag=''):
+        """Scan log files, and keep the found lines for the following check.
+
+        The found lines are appended to the pending file in the state
+        directory, and `check` with the same configuration adds them to its
+        result. This is used by the watcher to scan log files as they grow.
+        The result of the previous check is cleared.
+
+        Args:
+            logfile_pattern (str): The file names of log files to be scanned.
+            seekfile (str, optional): The file name of the seek file.
+            remove_seekfile (bool, optional): If true, remove expired seek files.
+            tag (str, optional): The tag added in the file names of state files,
+                to prevent names collisions.
+
+        Returns:
+            True if the log files are scanned. If the lock is timed out,
+            return False.
+
+        """
+        logfile_pattern = LogChecker.to_unicode(logfile_pattern)
+        seekfile = LogChecker.to_unicode(seekfile)
+        tag = LogChecker.to_unicode(tag)
+        lockfile = self._create_lock_filename(logfile_pattern, tag=tag)
+
+        self.clear_state()
+        lockfileobj = self._lock(lockfile)
+        if not lockfileobj:
+            return False
+        try:
+            self._scan(logfile_pattern, seekfile, remove_seekfile, tag)
+            self._append_pending(
+                self._create_pending_filename(logfile_pattern, tag=tag))
+            if self.seek_database is not None:
+                self._call_seek_database('commit')
+        finally:
+            LogChecker.unlock(lockfile, lockfileobj)
+        return True
+
+    def _lock(self, lockfile):
+        """Lock the lock file with lock_timeout."""
+        start_time = time.time()
+        lockfileobj = LogChecker.lock(
+            lockfile, timeout=self.config['lock_timeout'])
+        if self.tracer is not None:
+            self.tracer.emit(
+                'lock', lockfile=lockfile, locked=lockfileobj is not None,
+                wait=round(time.time() - start_time, 6))
+        return lockfileobj
+
+    def _scan(self, logfile_pattern, seekfile, remove_seekfile, tag,
+              logfile_stat_list=None):
+        """Scan the log files, and update the seek files.
+
+        If the list of the log files and their stats is given, the multiple
+        log files are not listed again.
+        """
         if LogChecker.is_multiple_logfiles(logfile_pattern):
             self._check_log_multi(
-                logfile_pattern, remove_seekfile=remove_seekfile, tag=tag)
+                logfile_pattern, remove_seekfile=remove_seekfile, tag=tag,
+                logfile_stat_list=logfile_stat_list)
         else:
             # create seekfile
             if not seekfile:
@@ -586,13 +1618,204 @@ class LogChecker(object):
                     logfile_pattern, logfile_pattern,
                     trace_inode=self.config['trace_inode'], tag=tag)
             self._check_log(logfile_pattern, seekfile)
+        return
+
+    def _append_pending(self, pendingfile):
+        """Append the found lines of the last scan to the pending file.
+
+        The pending file is written only if any lines are found, so that the
+        check returns without the lock while the log files are not changed.
+        If it grows beyond `_PENDING_COMPACT_SIZE`, its entries are merged
+        into one for each log file, which keeps the first and the last
+        `output_limit` lines, or `_PENDING_MAX_LINES` lines without
+        output_limit.
+        """
+        if self.config['dry_run']:
+            return True
+
+        entries = [(logfile, found, critical_found)
+                   for logfile, found, critical_found in self.found_by_logfile
+                   if found or critical_found]
+        if not entries:
+            return True
+        LogChecker._write_pending(pendingfile, entries, mode='a')
+        if os.path.getsize(pendingfile) > LogChecker._PENDING_COMPACT_SIZE:
+            limit = self.config['output_limit'] or LogChecker._PENDING_MAX_LINES
+            entries = LogChecker._read_pending(
+                pendingfile, lambda: _FoundList(limit))
+            tmp_pendingfile = pendingfile + "." + str(os.getpid())
+            LogChecker._write_pending(tmp_pendingfile, entries, mode='w')
+            os.rename(tmp_pendingfile, pendingfile)
+        return True
+
+    @staticmethod
+    def _write_pending(pendingfile, entries, mode):
+        """Write the entries of the log file and the found lines to the
+        pending file."""
+        with io.open(pendingfile, mode=mode, encoding='utf-8') as fileobj:
+            for logfile, found, critical_found in entries:
+                fileobj.write(LogChecker.to_unicode(json.dumps({
+                    "logfile": logfile,
+                    "found": list(found),
+                    "found_count": len(found),
+                    "critical_found": list(critical_found),
+                    "critical_found_count": len(critical_found)})))
+                fileobj.write("\n")
+            fileobj.flush()
+            fileobj.close()
 
-        if self.config['cachetime'] > 0:
-            self._update_cache(cachefile)
+    @staticmethod
+    def _read_pending(pendingfile, create_found_list):
+        """Read the pending file, and return the list of the tuples of the
+        log file and the found lines merged for each log file.
+
+        Args:
+            pendingfile (str): The file name of the pending file.
+            create_found_list (callable): The function to create the list to
+                store found lines.
+
+        """
+        merged_list = []
+        indexes = {}
+        with io.open(pendingfile, mode='r', encoding='utf-8') as fileobj:
+            for line in fileobj:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the line being written when the watcher was killed.
+                    continue
+                logfile = entry['logfile']
+                if logfile not in indexes:
+                    indexes[logfile] = len(merged_list)
+                    merged_list.append(
+                        [logfile, create_found_list(), create_found_list()])
+                merged = merged_list[indexes[logfile]]
+                for index, key in [(1, 'found'), (2, 'critical_found')]:
+                    omitted = entry[key + '_count'] - len(entry[key])
+                    if omitted > 0 and not isinstance(merged[index], _FoundList):
+                        # The lines are omitted by merging the entries
+                        # without output_limit, so count them.
+                        merged[index] = LogChecker._to_found_list(
+                            merged[index], LogChecker._PENDING_MAX_LINES)
+                    merged[index].extend(entry[key])
+                    if isinstance(merged[index], _FoundList):
+                        merged[index].count += omitted
+            fileobj.close()
+        return [tuple(merged) for merged in merged_list]
 
-        LogChecker.unlock(lockfile, lockfileobj)
+    @staticmethod
+    def _to_found_list(items, limit):
+        """Return `_FoundList` of the found lines, which counts the lines not
+        stored."""
+        found_list = _FoundList(limit)
+        found_list.extend(items)
+        return found_list
+
+    def _load_pending(self, pendingfile):
+        """Load the found lines in the pending file for each log file."""
+        if not os.path.exists(pendingfile):
+            return
+        for logfile, found, critical_found in LogChecker._read_pending(
+                pendingfile, self._create_found_list):
+            self.pending[logfile] = (found, critical_found)
+            self.pending_logfiles.append(logfile)
         return
 
+    def _remove_pending(self, pendingfile):
+        """Remove the pending file."""
+        if self.config['dry_run']:
+            return True
+
+        if os.path.isfile(pendingfile):
+            os.unlink(pendingfile)
+        return True
+
+    def iter_matches(self, logfile_pattern, seekfile=None, tag=''):
+        """Iterate the matched records in log files.
+
+        The log files are scanned lazily, and the records are yielded while
+        scanning. The seek files are updated when the iterator is exhausted
+        or closed. If it is closed on the way, the seek position is set just
+        after the last yielded record, and the rest of records are yielded
+        next time. The cache file is not used.
+
+        Args:
+            logfile_pattern (str): The file names of log files to be scanned.
+            seekfile (str, optional): The file name of the seek file.
+            tag (str, optional): The tag added in the file names of state files,
+                to prevent names collisions.
+
+        Yields:
+            The dict of the matched record, which has "file", "offset",
+            "header", "message" and "severity". The severity is
+            LogChecker.STATE_CRITICAL if the critical pattern is found,
+            otherwise LogChecker.STATE_WARNING.
+
+        Raises:
+            IOError: If the lock is timed out.
+
+        """
+        logfile_pattern = LogChecker.to_unicode(logfile_pattern)
+        seekfile = LogChecker.to_unicode(seekfile)
+        tag = LogChecker.to_unicode(tag)
+        lockfile = self._create_lock_filename(logfile_pattern, tag=tag)
+
+        lockfileobj = self._lock(lockfile)
+        if not lockfileobj:
+            raise IOError("Lock timeout. Another process is running.")
+
+        try:
+            targets = self._get_scan_targets(logfile_pattern, seekfile, tag)
+            for logfile, seekfile, listed_stat in targets:
+                if self.tracer is not None:
+                    self.tracer.context['file'] = LogChecker.to_unicode(logfile)
+                fileobj, logfile_stat = self._open_logfile(logfile, listed_stat)
+                if fileobj is None:
+                    continue
+                with fileobj:
+                    start_position = self._get_start_position(
+                        seekfile, fileobj, logfile_stat)
+                    if start_position is None:
+                        continue
+                    position = [start_position]
+                    completed = False
+                    try:
+                        for record in self._iter_found(
+                                fileobj, logfile, position):
+                            position[0] = record['end']
+                            yield record
+                        completed = True
+                    finally:
+                        if completed or position[0] > start_position:
+                            self._update_seekfile(
+                                seekfile, position[0],
+                                logfile_stat=logfile_stat,
+                                signature=self._create_signature(
+                                    fileobj, logfile_stat, position[0]))
+        finally:
+            try:
+                if self.seek_database is not None:
+                    self._call_seek_database('commit')
+            finally:
+                LogChecker.unlock(lockfile, lockfileobj)
+
+    def _get_cached_result(self, cachefile):
+        """Set the result from the cache file if the cache is available.
+
+        Returns:
+            True if the result is set from the cache file.
+
+        """
+        if self.config['cachetime'] <= 0:
+            return False
+        with self.stats.phase('cache'):
+            state, message = self._get_cache(cachefile)
+        if state == LogChecker.STATE_NO_CACHE:
+            return False
+        self.state = state
+        self.message = message
+        return True
+
     def check_log(self, logfile, seekfile):
         """Check the log file.
 
@@ -602,41 +1825,454 @@ class LogChecker(object):
         self.check(logfile, seekfile=seekfile)
         return
 
-    def _check_log(self, logfile, seekfile):
+    def _check_log(self, logfile, seekfile, listed_stat=None):
         """Check the log file.
 
         Args:
             logfile (str): The file name of the log file to be scanned.
             seekfile (str): The file name of the seek file.
+            listed_stat (os.stat_result, optional): The stat of the log file
+                when listed.
 
         """
-        _debug("logfile='{0}', seekfile='{1}'".format(logfile, seekfile))
-        logfile = LogChecker.to_unicode(logfile)
-        if not os.path.exists(logfile):
+        result = self._scan_log(logfile, seekfile, listed_stat)
+        self._add_result(logfile, seekfile, result)
+        return
+
+    def _add_result(self, logfile, seekfile, result):
+        """Add the result of `_scan_log` and update the seek file."""
+        if result is None:
             return
+        (found, critical_found, end_position, file_stats, logfile_stat,
+         signature) = result
+        self.stats.add_file(logfile, file_stats)
+        self._add_found(logfile, found, critical_found)
+        with self.stats.phase('seek'):
+            self._update_seekfile(
+                seekfile, end_position, logfile_stat=logfile_stat,
+                signature=signature)
+        return
+
+    def _scan_log(self, logfile, seekfile, listed_stat=None):
+        """Scan the log file from the position in the seek file.
+
+        Args:
+            logfile (str): The file name of the log file to be scanned.
+            seekfile (str): The file name of the seek file.
+            listed_stat (os.stat_result, optional): The stat of the log file
+                when listed.
 
-        filesize = os.path.getsize(logfile)
+        Returns:
+            The tuple of the found list, the critical found list,
+            the end position, the dict of the bytes, the lines and the time
+            to scan, the stat of the log file and the signature of the log
+            file. If the log file is not scanned, return None.
+
+        """
+        logfile = LogChecker.to_unicode(logfile)
+        if self.tracer is not None:
+            self.tracer.context['file'] = logfile
+        start_time = time.time()
+        with self.stats.phase('stat'):
+            fileobj, logfile_stat = self._open_logfile(logfile, listed_stat)
+        if fileobj is None:
+            return None
+
+        with fileobj:
+            try:
+                with self.stats.phase('stat'):
+                    start_position = self._get_start_position(
+                        seekfile, fileobj, logfile_stat)
+            except _IncompleteArchiveError as ex:
+                # The log file may be still being compressed.
+                if self.tracer is not None:
+                    self.tracer.emit('skip', reason=LogChecker.to_unicode(
+                        "unable to decompress: {0}".format(ex)))
+                return None
+            if start_position is None:
+                return None
+
+            found = self._create_found_list()
+            critical_found = self._create_found_list()
+            try:
+                with self.stats.phase('scan'):
+                    if self.tracer is not None:
+                        end_position, lines = self._check_each_traced(
+                            fileobj, start_position, found, critical_found)
+                    elif self.config['multiline']:
+                        end_position, lines = self._check_each_multiple_lines(
+                            fileobj, start_position, found, critical_found)
+                    elif self.byte_matcher is not None:
+                        end_position, lines = self._check_each_single_line_bytes(
+                            fileobj, start_position, found, critical_found)
+                    else:
+                        end_position, lines = self._check_each_single_line(
+                            fileobj, start_position, found, critical_found)
+                signature = self._create_signature(
+                    fileobj, logfile_stat, end_position)
+            except _IncompleteArchiveError as ex:
+                # The log file may be still being compressed.
+                if self.tracer is not None:
+                    self.tracer.emit('skip', reason=LogChecker.to_unicode(
+                        "unable to decompress: {0}".format(ex)))
+                return None
+        file_stats = {
+            "bytes": end_position - start_position, "lines": lines,
+            "time": time.time() - start_time}
+        if self.tracer is not None:
+            self.tracer.emit(
+                'scan', seekfile=seekfile, start=start_position,
+                end=end_position, lines=lines,
+                found=len(found), critical_found=len(critical_found))
+        return (found, critical_found, end_position, file_stats, logfile_stat,
+                signature)
+
+    def _open_logfile(self, logfile, listed_stat=None):
+        """Open the log file, and take the stat of the opened file.
+
+        The stat is taken from the opened file descriptor, so that it is
+        consistent with the content to be scanned even if the log file is
+        rotated at the same time.
+
+        Args:
+            logfile (str): The file name of the log file.
+            listed_stat (os.stat_result, optional): The stat of the log file
+                when listed. With trace_inode, if the log file is replaced
+                since then, the log file is skipped, because the seek file
+                is named by the listed inode.
+
+        Returns:
+            The tuple of the binary file object and the stat.
+            If the log file is compressed, the file object reads the
+            decompressed content.
+            If the log file can not be opened, return (None, None).
+
+        """
+        try:
+            fileobj = io.open(logfile, mode='rb')
+        except EnvironmentError:
+            return None, None
+        logfile_stat = os.fstat(fileobj.fileno())
+        if (self.config['trace_inode'] and listed_stat is not None and
+                listed_stat.st_ino != logfile_stat.st_ino):
+            if self.tracer is not None:
+                self.tracer.emit('skip', reason="the log file is replaced")
+            fileobj.close()
+            return None, None
+        compression = _DecompressedFile.detect(fileobj)
+        if compression is not None:
+            try:
+                fileobj = _DecompressedFile(fileobj, compression)
+            except EnvironmentError as ex:
+                if self.tracer is not None:
+                    self.tracer.emit('skip', reason=LogChecker.to_unicode(
+                        "unable to decompress: {0}".format(ex)))
+                fileobj.close()
+                return None, None
+        return fileobj, logfile_stat
+
+    def _get_start_position(self, seekfile, fileobj, logfile_stat):
+        """Return the position to start scanning the log file.
+
+        The signature in the seek file tells whether the log file is
+        appended, or truncated or replaced since the last scan. If the head
+        of the log file and the bytes just before the seek position are the
+        same, the log file is scanned from the seek position even if it is
+        replaced by its copy. Otherwise it is scanned from the beginning.
+
+        The position in the compressed log file is the offset in the
+        decompressed content. The compressed log file is not changed once
+        written, so it is not scanned again while its size is the same.
+        If its size is changed, it is scanned from the seek position only if
+        it has the same head, such as the compressed data appended, and from
+        the position where the rotated log file was scanned with trace_inode.
+
+        Args:
+            seekfile (str): The file name of the seek file.
+            fileobj (file): The binary file object of the log file.
+            logfile_stat (os.stat_result): The stat of the log file.
+
+        Returns:
+            The start position. If the log file is not updated, return None.
+
+        """
         # define seek positions.
-        start_position = LogChecker._read_seekfile(seekfile)
-        end_position = 0
-        if not self._check_updated(logfile, start_position, filesize):
-            return
+        start_position, signature = self._read_seek(seekfile)
+        if isinstance(fileobj, _DecompressedFile):
+            if not self._check_updated(logfile_stat, None):
+                return None
+            if signature.get('size') == str(logfile_stat.st_size):
+                if self.tracer is not None:
+                    self.tracer.emit(
+                        'skip', reason="the compressed log file is not changed")
+                return None
+            position = self._find_continued_position(
+                seekfile, fileobj, logfile_stat)
+            if (start_position > position and
+                    self._match_signature(fileobj, start_position, signature)):
+                position = start_position
+            return position
+
+        if not self._check_updated(logfile_stat, start_position):
+            return None
+
+        if not signature and start_position == 0:
+            start_position = self._find_continued_position(
+                seekfile, fileobj, logfile_stat)
+            if start_position == 0 and self.config['seek_by_time']:
+                start_position = self._find_position_by_time(
+                    fileobj, logfile_stat)
+            return start_position
 
         # if log was rotated, set start_position.
-        if filesize < start_position:
-            start_position = 0
-
-        found = []
-        critical_found = []
-        if self.config['multiline']:
-            end_position = self._check_each_multiple_lines(
-                logfile, start_position, found, critical_found)
+        if logfile_stat.st_size < start_position:
+            if self.tracer is not None:
+                self.tracer.emit('rotate', offset=start_position,
+                                 reason="filesize < offset")
+            return 0
+        if not self._match_signature(fileobj, start_position, signature):
+            if self.tracer is not None:
+                self.tracer.emit(
+                    'rotate', offset=start_position,
+                    reason="the log file is truncated or replaced")
+            return 0
+        return start_position
+
+    def _find_continued_position(self, seekfile, fileobj, logfile_stat):
+        """Return the position in the log file which is the continuation of
+        the log file already scanned, such as the rotated and compressed log
+        file. With trace_inode, the seek files of the other inodes are
+        searched for the same head of the log file.
+        If not found, return 0.
+
+        The head shorter than _HEAD_SIZE is not compared, because it may be
+        shared by the unrelated log files, such as a banner line written
+        first. The compressed log file continues the other compressed log
+        file only if they have the same size, such as its copy.
+        """
+        if not self.config['trace_inode']:
+            return 0
+        directory, basename = os.path.split(seekfile)
+        matchobj = re.match(r'^([^.]+)\.[0-9]+(.*)$', basename)
+        if not matchobj:
+            return 0
+        seekfile_pattern = os.path.join(
+            directory, matchobj.group(1) + '.[0-9]*' + matchobj.group(2))
+
+        position = 0
+        for other_seekfile, offset, signature in self._find_seek(seekfile_pattern):
+            if other_seekfile == seekfile or 'head' not in signature:
+                continue
+            if int(signature['head'].split(':')[0]) < LogChecker._HEAD_SIZE:
+                continue
+            if ('size' in signature and
+                    signature['size'] != str(logfile_stat.st_size)):
+                continue
+            if position < offset and self._match_signature(
+                    fileobj, offset, signature):
+                if self.tracer is not None:
+                    self.tracer.emit('seek', offset=offset,
+                                     continued_from=other_seekfile)
+                position = offset
+        return position
+
+    def _find_position_by_time(self, fileobj, logfile_stat):
+        """Return the offset of the first line newer than scantime in the log
+        file, by binary search on the timestamps in the headers.
+
+        The lines are assumed to be in order of time. The lines without
+        timestamps are skipped. If the timestamps are not found, return 0.
+        """
+        if not LogChecker.is_ascii_compatible(self.config['encoding']):
+            return 0
+        threshold = time.time() - self.config['scantime']
+        search_size = LogChecker._TIMESTAMP_SEARCH_SIZE
+
+        lower, timestamp = self._find_timestamp(fileobj, 0)
+        if timestamp is None or timestamp >= threshold:
+            return 0
+        upper = logfile_stat.st_size
+        while upper - lower > search_size:
+            middle = (lower + upper) // 2
+            offset, timestamp = self._find_timestamp(fileobj, middle)
+            if timestamp is None or offset >= upper:
+                upper = middle
+            elif timestamp < threshold:
+                lower = offset
+            else:
+                upper = offset
+
+        for offset, timestamp in self._iter_timestamps(
+                fileobj, lower, upper - lower + search_size):
+            if timestamp >= threshold:
+                if self.tracer is not None:
+                    self.tracer.emit('seek', offset=offset, by_time=True)
+                return offset
+        return lower
+
+    def _find_timestamp(self, fileobj, position):
+        """Return the tuple of the offset and the timestamp of the first line
+        with the timestamp after the position. If not found, return
+        (None, None)."""
+        for offset, timestamp in self._iter_timestamps(
+                fileobj, position, LogChecker._TIMESTAMP_SEARCH_SIZE):
+            return offset, timestamp
+        return None, None
+
+    def _iter_timestamps(self, fileobj, position, size):
+        """Yield the tuples of the offset and the timestamp of the lines which
+        start at or after the position and end within the size."""
+        start = max(position - 1, 0)
+        fileobj.seek(start, 0)
+        data = fileobj.read(size + 1)
+        index = 0
+        if position > 0:
+            # skip the line including the position.
+            index = data.find(b'\n') + 1
+            if index == 0:
+                return
+        while True:
+            end = data.find(b'\n', index)
+            if end < 0:
+                return
+            splitted = self._split_line(
+                data[index:end].decode(self.config['encoding'], 'replace'))
+            if splitted:
+                timestamp = LogChecker._parse_timestamp(splitted[0])
+                if timestamp is not None:
+                    yield start + index, timestamp
+            index = end + 1
+
+    @staticmethod
+    def _parse_timestamp(string):
+        """Return the epoch time of the first timestamp in the string.
+
+        The timestamps of ISO 8601, the common log format and syslog are
+        supported. The timestamp without the year is assumed to be in the
+        last 12 months. If not found, return None.
+        """
+        zone = None
+        guess_year = False
+        matchobj = LogChecker._RE_TIMESTAMP_ISO8601.search(string)
+        if matchobj:
+            year, month, day, hour, minute, second = [
+                int(x) for x in matchobj.group(1, 2, 3, 4, 5, 6)]
+            zone = matchobj.group(7)
         else:
-            end_position = self._check_each_single_line(
-                logfile, start_position, found, critical_found)
+            matchobj = LogChecker._RE_TIMESTAMP_CLF.search(string)
+            if matchobj:
+                month_name = matchobj.group(2)
+                year, day, hour, minute, second = [
+                    int(x) for x in matchobj.group(3, 1, 4, 5, 6)]
+                zone = matchobj.group(7)
+            else:
+                matchobj = LogChecker._RE_TIMESTAMP_SYSLOG.search(string)
+                if not matchobj:
+                    return None
+                month_name = matchobj.group(1)
+                day, hour, minute, second = [
+                    int(x) for x in matchobj.group(2, 3, 4, 5)]
+                year = matchobj.group(6)
+                if year is None:
+                    guess_year = True
+                    year = time.localtime().tm_year
+                year = int(year)
+            if month_name not in LogChecker._MONTHS:
+                return None
+            month = LogChecker._MONTHS.index(month_name) + 1
+
+        date_time = (year, month, day, hour, minute, second, 0, 0, -1)
+        try:
+            if zone is None:
+                timestamp = time.mktime(date_time)
+                if guess_year and timestamp > time.time() + 86400:
+                    # The timestamp in December is read in January.
+                    timestamp = time.mktime((year - 1,) + date_time[1:])
+            else:
+                timestamp = calendar.timegm(date_time)
+                if zone != 'Z':
+                    zone = zone.replace(':', '')
+                    offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+                    if zone[0] == '-':
+                        offset = -offset
+                    timestamp -= offset
+        except (ValueError, OverflowError):
+            return None
+        return timestamp
+
+    def _create_signature(self, fileobj, logfile_stat, position):
+        """Create the signature of the log file scanned up to the position,
+        which is stored with the seek position to identify the log file.
+
+        The signature has the fingerprints of the head and of the tail just
+        before the position. The compressed log file has its size instead of
+        the tail, because seeking backward in it decompresses it again.
+        """
+        fingerprints = {}
+        if position > 0:
+            fingerprints['head'] = LogChecker._get_fingerprint(
+                fileobj, 0, min(position, LogChecker._HEAD_SIZE))
+        if isinstance(fileobj, _DecompressedFile):
+            fingerprints['size'] = str(logfile_stat.st_size)
+        elif position > 0:
+            size = min(position, LogChecker._TAIL_SIZE)
+            fingerprints['tail'] = LogChecker._get_fingerprint(
+                fileobj, position - size, size)
+        # The log file may be truncated while scanned.
+        return dict((key, value) for key, value in fingerprints.items()
+                    if value is not None)
+
+    @staticmethod
+    def _match_signature(fileobj, position, signature):
+        """Return True if the log file has the same head and tail as the
+        signature created at the position."""
+        for key in ['head', 'tail']:
+            if key not in signature:
+                continue
+            size = int(signature[key].split(':')[0])
+            if key == 'head':
+                start = 0
+            else:
+                start = position - size
+            if start < 0:
+                return False
+            if LogChecker._get_fingerprint(fileobj, start, size) != signature[key]:
+                return False
+        return True
+
+    @staticmethod
+    def _get_fingerprint(fileobj, position, size):
+        """Return the fingerprint of the bytes in the log file.
+
+        Args:
+            fileobj (file): The binary file object of the log file.
+            position (int): The offset of the bytes.
+            size (int): The size of the bytes.
 
+        Returns:
+            The string of the size and the hash of the bytes. If the log file
+            does not have the bytes, return None.
+
+        """
+        fileobj.seek(position, 0)
+        data = fileobj.read(size)
+        if len(data) < size:
+            return None
+        return "{0}:{1}".format(
+            size, hashlib.sha1(data).hexdigest()[:16])
+
+    def _add_found(self, logfile, found, critical_found):
+        """Add the found lines in the log file to the result."""
+        # The found lines kept by the watcher precede the new ones.
+        if logfile in self.pending:
+            pending_found, pending_critical_found = self.pending.pop(logfile)
+            pending_found.extend(found)
+            pending_critical_found.extend(critical_found)
+            found = pending_found
+            critical_found = pending_critical_found
+        self.found_by_logfile.append((logfile, found, critical_found))
         if found:
-            self.found.extend(found)
+            self.found = LogChecker._extend_found(self.found, found)
             if self.config['output_quiet']:
                 self.found_messages.append(
                     "at {0}".format(logfile))
@@ -647,7 +2283,8 @@ class LogChecker(object):
                 self.found_messages.append(
                     "{0} at {1}".format(LogChecker._join_header_and_message(found) , logfile))
         if critical_found:
-            self.critical_found.extend(critical_found)
+            self.critical_found = LogChecker._extend_found(
+                self.critical_found, critical_found)
             if self.config['output_quiet']:
                 self.critical_found_messages.append(
                     "at {0}".format(logfile))
@@ -657,10 +2294,23 @@ class LogChecker(object):
             else:
                 self.critical_found_messages.append(
                     "{0} at {1}".format(LogChecker._join_header_and_message(critical_found), logfile))
-
-        self._update_seekfile(seekfile, end_position)
         return
 
+    @staticmethod
+    def _extend_found(found_list, found):
+        """Extend the found list by the found lines, and return it.
+
+        If the found lines omit some lines, such as those kept by the watcher
+        without output_limit, the list becomes `_FoundList` large enough for
+        all the stored lines, so that the omitted lines are also counted.
+        """
+        if (isinstance(found, _FoundList) and
+                not isinstance(found_list, _FoundList)):
+            found_list = LogChecker._to_found_list(
+                found_list, len(found_list) + len(found))
+        found_list.extend(found)
+        return found_list
+
     def check_log_multi(
             self, logfile_pattern, state_directory,
             remove_seekfile=False, tag=''):
@@ -672,7 +2322,8 @@ class LogChecker(object):
         state_directory = state_directory  # not used
         self.check(logfile_pattern, remove_seekfile=remove_seekfile, tag=tag)
 
-    def _check_log_multi(self, logfile_pattern, remove_seekfile=False, tag=''):
+    def _check_log_multi(self, logfile_pattern, remove_seekfile=False, tag='',
+                         logfile_stat_list=None):
         """Check the multiple log files.
 
         Args:
@@ -680,35 +2331,122 @@ class LogChecker(object):
             remove_seekfile (bool, optional): If true, remove expired seek files.
             tag (str, optional): The tag added in the file names of state files,
                 to prevent names collisions.
+            logfile_stat_list (list, optional): The list of the tuples of the
+                log file and its stat already listed.
 
         """
-        logfile_list = self._get_logfile_list(logfile_pattern)
-        for logfile in logfile_list:
-            if not os.path.isfile(logfile):
-                continue
-            seekfile = self._create_seek_filename(
-                logfile_pattern, logfile,
-                trace_inode=self.config['trace_inode'], tag=tag)
-            self._check_log(logfile, seekfile)
+        with self.stats.phase('glob'):
+            targets = self._get_targets(
+                logfile_pattern, tag=tag, logfile_stat_list=logfile_stat_list)
+        if (self.config['jobs'] > 1 and len(targets) > 1 and
+                not self.config['dry_run']):
+            with self.stats.phase('scan'):
+                results = self._scan_log_parallel(targets)
+            for (logfile, seekfile, _), result in zip(targets, results):
+                self._add_result(logfile, seekfile, result)
+        else:
+            for logfile, seekfile, listed_stat in targets:
+                self._check_log(logfile, seekfile, listed_stat)
 
         if remove_seekfile:
+            self._remove_expired_seekfiles(logfile_pattern, tag)
+        return
+
+    def _remove_expired_seekfiles(self, logfile_pattern, tag):
+        """Remove the expired seek files of the multiple log files."""
+        with self.stats.phase('seek'):
             if self.config['trace_inode']:
                 self._remove_old_seekfile_with_inode(logfile_pattern, tag)
             else:
                 self._remove_old_seekfile(logfile_pattern, tag)
-        return
+
+    def _get_scan_targets(self, logfile_pattern, seekfile, tag,
+                          logfile_stat_list=None):
+        """Return the list of the tuples of the log file, the seek file and
+        the stat of the log file when listed, for the arguments of `check`.
+        The stat is None for a single log file."""
+        if LogChecker.is_multiple_logfiles(logfile_pattern):
+            return self._get_targets(
+                logfile_pattern, tag=tag, logfile_stat_list=logfile_stat_list)
+        if not seekfile:
+            seekfile = self._create_seek_filename(
+                logfile_pattern, logfile_pattern,
+                trace_inode=self.config['trace_inode'], tag=tag)
+        return [(logfile_pattern, seekfile, None)]
+
+    def _get_targets(self, logfile_pattern, tag='', logfile_stat_list=None):
+        """Return the list of the tuples of the log file, the seek file and
+        the stat of the log file.
+
+        If the list of the tuples of the log file and its stat is not given,
+        the log files are listed.
+        """
+        if logfile_stat_list is None:
+            logfile_stat_list = self._get_logfile_stat_list(logfile_pattern)
+        targets = []
+        for logfile, logfile_stat in logfile_stat_list:
+            if not stat.S_ISREG(logfile_stat.st_mode):
+                continue
+            seekfile = self._create_seek_filename(
+                logfile_pattern, logfile,
+                trace_inode=self.config['trace_inode'], tag=tag,
+                inode=logfile_stat.st_ino)
+            targets.append((logfile, seekfile, logfile_stat))
+        return targets
+
+    def _scan_log_parallel(self, targets):
+        """Scan the log files in the worker processes.
+
+        Args:
+            targets (list): The list of tuples of the log file, the seek file
+                and the stat of the log file.
+
+        Returns:
+            The list of results of `_scan_log` in the order of targets.
+
+        """
+        processes = min(self.config['jobs'], len(targets))
+        pool = multiprocessing.Pool(
+            processes, _init_scan_worker, (self.config,))
+        try:
+            results = pool.map(_scan_log_worker, targets, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        return results
 
     def clear_state(self):
         """Clear the state of the result."""
         self.state = None
         self.message = None
         self.messages = []
-        self.found = []
+        self.found = self._create_found_list()
         self.found_messages = []
-        self.critical_found = []
+        self.critical_found = self._create_found_list()
         self.critical_found_messages = []
+        self.stats = _ScanStats()
+        self.found_by_logfile = []
+        self.pending = {}
+        self.pending_logfiles = []
         return
 
+    def get_stats(self):
+        """Get the statistics of the check, such as the time of each phase."""
+        return self.stats
+
+    def close(self):
+        """Close the trace file and the state database.
+
+        The state database is opened again if the instance is used again,
+        but the trace events are not written any longer.
+        """
+        if self.tracer is not None:
+            self.tracer.close()
+            self.tracer = None
+        if self.seek_database is not None:
+            self.seek_database.connection.close()
+            self.seek_database = None
+
     def get_state(self):
         """Get the state of the result.
 
@@ -737,15 +2475,22 @@ class LogChecker(object):
             return LogChecker.STATE_NO_CACHE, None
 
         if not os.path.exists(cachefile):
+            if self.tracer is not None:
+                self.tracer.emit('cache', cachefile=cachefile, hit=False,
+                                 reason="not found")
             return LogChecker.STATE_NO_CACHE, None
         if os.stat(cachefile).st_mtime < time.time() - self.config['cachetime']:
-            _debug("Cache is expired: mtime < curtime - cachetime")
+            if self.tracer is not None:
+                self.tracer.emit('cache', cachefile=cachefile, hit=False,
+                                 reason="mtime < curtime - cachetime")
             return LogChecker.STATE_NO_CACHE, None
         with io.open(cachefile, mode='r', encoding='utf-8') as fileobj:
             line = fileobj.readline()
             fileobj.close()
         state, message = line.split("\t", 1)
-        _debug("cache: state={0}, message='{1}'".format(state, message))
+        if self.tracer is not None:
+            self.tracer.emit('cache', cachefile=cachefile, hit=True,
+                             state=int(state))
         return int(state), message
 
     def _update_cache(self, cachefile):
@@ -817,6 +2562,127 @@ class LogChecker(object):
                 sys.exit(LogChecker.STATE_UNKNOWN)
         return pattern_list
 
+    @staticmethod
+    def _is_contiguous_logformat(re_logformat):
+        """Whether the log format is '^(HEADER)(.*)$' covering the whole line.
+
+        In this case, HEADER and MSG joined is equal to the line.
+
+        Args:
+            re_logformat (re.RegexObject): The compiled log format.
+
+        Returns:
+            True if the groups of the log format cover the whole line.
+
+        """
+        logformat = re_logformat.pattern
+        suffix = ')(.*)$'
+        if re_logformat.groups != 2:
+            return False
+        if not logformat.startswith('^(') or logformat.startswith('^(?'):
+            return False
+        if not logformat.endswith(suffix):
+            return False
+        depth = 0
+        in_class = False
+        index = 1
+        while index < len(logformat):
+            char = logformat[index]
+            if char == '\\':
+                index += 2
+                continue
+            if in_class:
+                if char == ']':
+                    in_class = False
+            elif char == '[':
+                in_class = True
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0:
+                    return index == len(logformat) - len(suffix)
+            index += 1
+        return False
+
+    @staticmethod
+    def get_required_literal(pattern):
+        """Extract the longest literal string required by the pattern.
+
+        The extraction is conservative. Only the literals outside of groups
+        are used, and the patterns with alternations or inline flags have
+        no required literal.
+
+        Args:
+            pattern (str): The regular expression.
+
+        Returns:
+            The literal string which is found in every matched string,
+            or None.
+
+        """
+        if LogChecker._RE_INLINE_FLAGS.search(pattern):
+            return None
+        literals = []
+        current = []
+        depth = 0
+        index = 0
+        length = len(pattern)
+        while index < length:
+            char = pattern[index]
+            if char == '\\':
+                if index + 1 >= length:
+                    return None
+                escaped = pattern[index + 1]
+                if escaped in 'xuUN0123456789':
+                    # character codes and backreferences
+                    return None
+                index += 2
+                if depth == 0 and not escaped.isalnum():
+                    current.append(escaped)
+                    continue
+                literals.append(''.join(current))
+                current = []
+                continue
+            if char == '[':
+                # skip the character class.
+                index += 1
+                if index < length and pattern[index] == '^':
+                    index += 1
+                if index < length and pattern[index] == ']':
+                    index += 1
+                while index < length and pattern[index] != ']':
+                    if pattern[index] == '\\':
+                        index += 1
+                    index += 1
+                char = '.'
+            elif char == '{':
+                # skip the quantifier.
+                while index < length and pattern[index] != '}':
+                    index += 1
+            if char == '|':
+                return None
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char in '*?{':
+                # the previous character is optional.
+                if current:
+                    current.pop()
+            elif depth == 0 and char not in '.^$+':
+                current.append(char)
+                index += 1
+                continue
+            literals.append(''.join(current))
+            current = []
+            index += 1
+        literals.append(''.join(current))
+        literal = max(literals, key=len)
+        if not literal:
+            return None
+        return literal
+
     @staticmethod
     def _expand_logformat_by_strftime(logformat):
         """Expand log format by strftime variables.
@@ -833,14 +2699,86 @@ class LogChecker(object):
             logformat = logformat.replace(key, item[key])
         return logformat
 
-    def _update_seekfile(self, seekfile, position):
+    def _get_seek_database(self):
+        """Get the database of seek positions, opening it if necessary."""
+        if self.seek_database is None:
+            if sqlite3 is None:
+                LogChecker.print_message("Unable to use the sqlite state backend: sqlite3 module is not found.")
+                sys.exit(LogChecker.STATE_UNKNOWN)
+            filename = os.path.join(
+                self.config['state_directory'], LogChecker._STATE_DATABASE)
+            try:
+                self.seek_database = _SeekDatabase(filename)
+            except sqlite3.Error as ex:
+                LogChecker.print_message("Unable to open the state database: {0}: {1}".format(
+                    filename, ex))
+                sys.exit(LogChecker.STATE_UNKNOWN)
+        return self.seek_database
+
+    def _call_seek_database(self, method, *args):
+        """Call the method of the database of seek positions.
+
+        The database errors, such as the timeout to wait for the lock held by
+        the concurrent check, exit with UNKNOWN.
+        """
+        seek_database = self._get_seek_database()
+        try:
+            return getattr(seek_database, method)(*args)
+        except sqlite3.Error as ex:
+            # Discard the updates not committed, and reopen it at next time.
+            self.seek_database = None
+            seek_database.connection.close()
+            LogChecker.print_message("Unable to access the state database: {0}: {1}".format(
+                seek_database.filename, ex))
+            sys.exit(LogChecker.STATE_UNKNOWN)
+
+    def _read_seek(self, seekfile):
+        """Read the offset and the signature of the log file from the state
+        backend."""
+        if self.config['state_backend'] == 'sqlite':
+            offset, signature = self._call_seek_database('read', seekfile)
+        else:
+            offset, signature = LogChecker._read_seekfile_with_signature(
+                seekfile)
+        return offset, LogChecker._parse_signature(signature)
+
+    def _find_seek(self, seekfile_pattern):
+        """Return the list of the tuples of the seek file, the offset and
+        the signature matched by the glob pattern of seek files."""
+        if self.config['state_backend'] == 'sqlite':
+            rows = self._call_seek_database('find', seekfile_pattern)
+        else:
+            rows = []
+            for seekfile in glob.glob(seekfile_pattern):
+                offset, signature = LogChecker._read_seekfile_with_signature(
+                    seekfile)
+                rows.append((seekfile, offset, signature))
+        return [(seekfile, offset, LogChecker._parse_signature(signature))
+                for seekfile, offset, signature in rows]
+
+    def _update_seekfile(
+            self, seekfile, position, logfile_stat=None, signature=None):
         """Update the seek file for the log file."""
         if self.config['dry_run']:
             return True
 
+        signature = LogChecker._format_signature(signature)
+        if self.config['state_backend'] == 'sqlite':
+            inode = None
+            mtime = None
+            if logfile_stat is not None:
+                inode = logfile_stat.st_ino
+                mtime = logfile_stat.st_mtime
+            self._call_seek_database(
+                'update', seekfile, position, inode, mtime, signature)
+            return True
+
         tmp_seekfile = seekfile + "." + str(os.getpid())
         with io.open(tmp_seekfile, mode='w', encoding='utf-8') as fileobj:
             fileobj.write(LogChecker.to_unicode(str(position)))
+            if signature:
+                fileobj.write("\n")
+                fileobj.write(signature)
             fileobj.flush()
             fileobj.close()
         os.rename(tmp_seekfile, seekfile)
@@ -849,12 +2787,38 @@ class LogChecker(object):
     @staticmethod
     def _read_seekfile(seekfile):
         """Read the offset of the log file from its seek file."""
+        return LogChecker._read_seekfile_with_signature(seekfile)[0]
+
+    @staticmethod
+    def _read_seekfile_with_signature(seekfile):
+        """Read the offset and the signature of the log file from its seek
+        file. The signature is in the second line, which is not written by
+        the older versions."""
         if not os.path.exists(seekfile):
-            return 0
+            return 0, None
         with io.open(seekfile, mode='r', encoding='utf-8') as fileobj:
             offset = int(fileobj.readline())
+            signature = fileobj.readline().strip()
             fileobj.close()
-        return offset
+        return offset, signature
+
+    @staticmethod
+    def _format_signature(signature):
+        """Format the dict of the signature as `key=value` separated by
+        spaces."""
+        if not signature:
+            return None
+        return ' '.join(
+            "{0}={1}".format(key, signature[key]) for key in sorted(signature))
+
+    @staticmethod
+    def _parse_signature(string):
+        """Parse the string of the signature into the dict."""
+        signature = {}
+        for item in (string or '').split():
+            key, _, value = item.partition('=')
+            signature[key] = value
+        return signature
 
     @staticmethod
     def _join_header(found):
@@ -865,6 +2829,7 @@ class LogChecker(object):
                 headers.append(item['header'])
             else:
                 headers.append(item['message'])
+        LogChecker._insert_omission(found, headers)
         return ','.join(headers)
 
     @staticmethod
@@ -873,28 +2838,108 @@ class LogChecker(object):
         log_messages = []
         for item in found:
             log_messages.append(''.join([item['header'], item['message']]))
+        LogChecker._insert_omission(found, log_messages)
         return ','.join(log_messages)
 
     @staticmethod
-    def lock(lockfile):
+    def _insert_omission(found, strings):
+        """Insert the number of omitted lines between the first and last lines."""
+        if isinstance(found, _FoundList) and found.omitted > 0:
+            strings.insert(
+                len(found.head), "({0} lines omitted)".format(found.omitted))
+
+    @staticmethod
+    def lock(lockfile, timeout=0):
         """Lock.
 
+        If timeout is given, block until the lock is released by the other
+        process, so that the waiting process gets the lock at once.
+
         Args:
             lockfile (str): The file name of the lock file.
+            timeout (float, optional): The seconds to wait for the lock.
+                If 0, do not wait.
 
         Returns:
             The instance of the object of the lock file.
             If lock fails, return None.
 
         """
-        lockfileobj = io.open(lockfile, mode='w')
-        try:
-            fcntl.flock(lockfileobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except IOError:
-            return None
+        timeout_time = time.time() + timeout
+        while True:
+            lockfileobj = io.open(lockfile, mode='w')
+            if not LogChecker._flock(lockfileobj, timeout_time - time.time()):
+                lockfileobj.close()
+                return None
+            # The lock file may be removed by the previous owner
+            # while waiting, then lock the new lock file again.
+            try:
+                if (os.fstat(lockfileobj.fileno()).st_ino ==
+                        os.stat(lockfile).st_ino):
+                    break
+            except OSError:
+                pass
+            lockfileobj.close()
+            if time.time() >= timeout_time:
+                return None
         lockfileobj.flush()
         return lockfileobj
 
+    @staticmethod
+    def _flock(lockfileobj, timeout):
+        """Lock the file exclusively, and wait for the timeout if given.
+
+        The blocking lock is interrupted by SIGALRM at the timeout.
+        If the alarm is not available, in the threads other than the main
+        thread or while another timer is running, poll the lock.
+
+        Returns:
+            True if lock successes.
+
+        """
+        if timeout > 0 and signal.getitimer(signal.ITIMER_REAL)[0] == 0:
+            try:
+                previous_handler = signal.signal(
+                    signal.SIGALRM, _raise_lock_timeout)
+            except ValueError:
+                # not in the main thread
+                previous_handler = None
+            if previous_handler is not None:
+                locked = False
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+                try:
+                    try:
+                        fcntl.flock(lockfileobj, fcntl.LOCK_EX)
+                        locked = True
+                    finally:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                except _LockTimeout:
+                    # SIGALRM may be delivered just after the lock is
+                    # acquired, which is told by locking it again without
+                    # blocking.
+                    try:
+                        fcntl.flock(lockfileobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        locked = True
+                    except IOError:
+                        pass
+                except IOError:
+                    pass
+                finally:
+                    # Restore the handler after the timer is cleared.
+                    signal.signal(signal.SIGALRM, previous_handler)
+                return locked
+
+        timeout_time = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(lockfileobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except IOError:
+                pass
+            if time.time() >= timeout_time:
+                return False
+            time.sleep(LogChecker._RETRY_PERIOD)
+
     @staticmethod
     def unlock(lockfile, lockfileobj):
         """Unlock.
@@ -909,9 +2954,11 @@ class LogChecker(object):
         """
         if lockfileobj is None:
             return False
-        lockfileobj.close()
+        # Remove the lock file before releasing the lock, so that the waiting
+        # processes notice that it is removed.
         if os.path.isfile(lockfile):
             os.unlink(lockfile)
+        lockfileobj.close()
         return True
 
     @staticmethod
@@ -936,14 +2983,37 @@ class LogChecker(object):
         """Whether the pattern of the log file names is multiple files.
 
         Args:
-            logfile_pattern (str): The pattern of the file names of log files.
+            logfile_pattern (str): The pattern of the file names of log files.
+
+        Returns:
+            True if the string of the log file pattern is multiple log files.
+
+        """
+        matchobj = re.search('[*? ]', logfile_pattern)
+        if matchobj:
+            return True
+        return False
+
+    @staticmethod
+    def is_ascii_compatible(encoding):
+        """Whether the encoding is compatible with ASCII.
+
+        In the compatible encodings, every byte of multibyte characters is
+        greater than 0x7f. Then ASCII characters and newlines can be found
+        in the bytes without decoding.
+
+        Args:
+            encoding (str): The character encoding.
 
         Returns:
-            True if the string of the log file pattern is multiple log files.
+            True if the encoding is compatible with ASCII.
 
         """
-        matchobj = re.search('[*? ]', logfile_pattern)
-        if matchobj:
+        try:
+            name = codecs.lookup(encoding).name
+        except LookupError:
+            return False
+        if LogChecker._RE_ASCII_COMPATIBLE_ENCODING.match(name):
             return True
         return False
 
@@ -1005,15 +3075,1098 @@ class LogChecker(object):
 
     @staticmethod
     def print_message(string):
-        with io.open(sys.stdout.fileno(), mode='w', encoding='utf-8') as fileobj:
+        with io.open(sys.stdout.fileno(), mode='w', encoding='utf-8',
+                     closefd=False) as fileobj:
             fileobj.write(string)
             fileobj.write('\n')
             fileobj.close()
 
 
-def _debug(string):
-    if not __debug__:
-        print("DEBUG: {0}".format(string))
+class _PatternMatcher(object):
+    """The compiled matcher for a list of regular expressions.
+
+    The patterns are compiled once and combined into one alternation,
+    so that a line is scanned by a single regular expression.
+    If the patterns can not be combined safely (e.g. backreferences or
+    global inline flags), each pattern is tried in turn.
+
+    If every pattern contains a required literal string, the lines are
+    screened by the literals before any regular expression is tried.
+    """
+
+    # Patterns which change their meaning in an alternation.
+    _RE_UNSAFE_TO_COMBINE = re.compile(
+        r'\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)')
+    # Patterns which may not match a line in a chunk of lines, because of
+    # anchors, lookarounds or possessive quantifiers.
+    _RE_UNSAFE_FOR_CHUNK = re.compile(
+        r'\$|\\[AZ]|\(\?<|\(\?!|\(\?>|[*+?}]\+')
+    _MAX_LITERAL_LENGTH = 32
+
+    def __init__(self, pattern_list, flags=0, encoding=None, chunk=False):
+        """Constructor.
+
+        Args:
+            pattern_list (list): The list of regular expressions.
+            flags (int): The flags of regular expressions.
+            encoding (str, optional): If set, the patterns are encoded by
+                this encoding and compiled to match bytes.
+            chunk (bool, optional): If true, create the regular expression
+                to search chunks of lines. It is always created if the
+                encoding is set.
+
+        """
+        self.pattern_list = [pattern for pattern in pattern_list if pattern]
+        self.encoding = encoding
+        self.compiled_list = [
+            re.compile(self._encode(pattern), flags)
+            for pattern in self.pattern_list]
+        self.combined = None
+        self.screen = None
+        if len(self.compiled_list) > 1:
+            self.combined = self._combine(self.pattern_list, flags)
+            self.screen = self._create_screen(self.pattern_list, flags)
+        self.chunk_screen = None
+        if chunk or encoding is not None:
+            self.chunk_screen = self._create_chunk_screen(flags)
+
+    def __bool__(self):
+        return bool(self.compiled_list)
+
+    __nonzero__ = __bool__
+
+    def _encode(self, pattern):
+        """Encode the pattern if the encoding is set."""
+        if self.encoding is None:
+            return pattern
+        return pattern.encode(self.encoding)
+
+    def _combine(self, pattern_list, flags):
+        """Return the compiled alternation of patterns, or None."""
+        for pattern in pattern_list:
+            if _PatternMatcher._RE_UNSAFE_TO_COMBINE.search(pattern):
+                return None
+        try:
+            return re.compile(self._encode(
+                '|'.join(['(?:{0})'.format(pattern) for pattern in pattern_list])),
+                flags)
+        except re.error:
+            return None
+
+    def _create_screen(self, pattern_list, flags):
+        """Return the compiled regular expression of required literals.
+
+        If any pattern has no required literal, return None.
+        """
+        trie = {}
+        for pattern in pattern_list:
+            literal = LogChecker.get_required_literal(pattern)
+            if not literal:
+                return None
+            node = trie
+            for char in literal[:_PatternMatcher._MAX_LITERAL_LENGTH]:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        return re.compile(self._encode(_PatternMatcher._trie_to_regex(trie)), flags)
+
+    def _create_chunk_screen(self, flags):
+        """Return the compiled regular expression to search chunks of lines.
+
+        Every line matched by the patterns includes a position matched by
+        it in the chunk. If no such regular expression, return None.
+        """
+        if not self.compiled_list:
+            return None
+        if self.screen is not None:
+            return self.screen
+        for pattern in self.pattern_list:
+            if _PatternMatcher._RE_UNSAFE_FOR_CHUNK.search(pattern):
+                return None
+        if self.combined is not None:
+            return re.compile(self.combined.pattern, flags | re.MULTILINE)
+        if len(self.compiled_list) == 1:
+            return re.compile(self.compiled_list[0].pattern, flags | re.MULTILINE)
+        return None
+
+    @staticmethod
+    def _trie_to_regex(trie):
+        """Convert the trie of literals to a regular expression.
+
+        The literals which share a prefix share their branches, so the
+        regular expression engine follows the literals like an automaton.
+        """
+        if '' in trie:
+            # A shorter literal is enough to be found.
+            return ''
+        alternatives = []
+        for char in sorted(trie):
+            alternatives.append(
+                re.escape(char) + _PatternMatcher._trie_to_regex(trie[char]))
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:{0})'.format('|'.join(alternatives))
+
+    def search(self, string):
+        """Search the string.
+
+        Returns:
+            The pattern which matched first, or None.
+
+        """
+        if self.screen is not None and not self.screen.search(string):
+            return None
+        if self.combined is not None and not self.combined.search(string):
+            return None
+        for index, compiled in enumerate(self.compiled_list):
+            if compiled.search(string):
+                return self.pattern_list[index]
+        return None
+
+
+class _LineReader(object):
+    """The reader of lines as bytes from the offset to the end of the file.
+
+    The file is read in large chunks which end with a newline. It is not
+    memory-mapped, because the access to the mapped region truncated by the
+    log rotation while scanned is killed by SIGBUS.
+    The lines do not include newlines.
+    """
+
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, fileobj, start_position=0):
+        """Constructor.
+
+        Args:
+            fileobj (file): The file object opened in binary mode.
+            start_position (int): The offset to start reading.
+
+        """
+        self.fileobj = fileobj
+        self.position = start_position
+        '''The offset after the chunks read.'''
+
+    def __iter__(self):
+        for _, data in self.iter_chunks():
+            lines = data.split(b'\n')
+            if not lines[-1]:
+                lines.pop()
+            for line in lines:
+                yield line
+
+    def iter_chunks(self):
+        """Iterate the chunks.
+
+        Yields:
+            The tuple of the offset of the chunk and the bytes of the chunk.
+            After the chunk is consumed, `position` is set to the offset
+            of the next chunk.
+
+        """
+        try:
+            filesize = os.fstat(self.fileobj.fileno()).st_size
+        except (AttributeError, io.UnsupportedOperation, EnvironmentError):
+            filesize = None
+        if filesize is not None and filesize <= self.position:
+            return
+        self.fileobj.seek(self.position, 0)
+        remainder = b''
+        while True:
+            data = self.fileobj.read(_LineReader.CHUNK_SIZE)
+            if not data:
+                break
+            if remainder:
+                data = remainder + data
+            newline = data.rfind(b'\n')
+            if newline < 0:
+                remainder = data
+                continue
+            remainder = data[newline + 1:]
+            yield self.position, data[:newline + 1]
+            self.position += newline + 1
+        if remainder:
+            yield self.position, remainder
+            self.position += len(remainder)
+
+
+class _DecompressedFile(io.BufferedIOBase):
+    """The binary file object of the decompressed content of the compressed
+    log file.
+
+    The content is decompressed as a stream, and the offsets are those in the
+    decompressed content. It has no file descriptor, so that the size of the
+    compressed data is not taken for that of the content by `_LineReader`.
+    The errors of the decompression are raised as IOError, and those of the
+    compressed data ended halfway as `_IncompleteArchiveError`.
+    """
+
+    _MAGIC_SIZE = 10
+    _BZ2_BLOCK_MAGICS = [b'1AY&SY', b'\x17rE8P\x90']
+
+    def __init__(self, fileobj, compression):
+        """Constructor.
+
+        Args:
+            fileobj (file): The binary file object of the compressed log file.
+            compression (str): 'gzip', 'bz2' or 'xz'.
+
+        """
+        io.BufferedIOBase.__init__(self)
+        self.raw_fileobj = fileobj
+        if compression == 'gzip':
+            self.decompressed = gzip.GzipFile(fileobj=fileobj, mode='rb')
+        elif compression == 'bz2' and bz2 is not None:
+            self.decompressed = bz2.BZ2File(fileobj, mode='rb')
+        elif compression == 'xz' and lzma is not None:
+            self.decompressed = lzma.LZMAFile(fileobj, mode='rb')
+        else:
+            raise IOError(
+                "{0} module is not found.".format(
+                    'lzma' if compression == 'xz' else compression))
+
+    @staticmethod
+    def detect(fileobj):
+        """Return the compression of the file by its magic number, or None."""
+        data = fileobj.read(_DecompressedFile._MAGIC_SIZE)
+        fileobj.seek(0, 0)
+        if data.startswith(b'\x1f\x8b\x08'):
+            return 'gzip'
+        if (data.startswith(b'BZh') and
+                data[4:10] in _DecompressedFile._BZ2_BLOCK_MAGICS):
+            return 'bz2'
+        if data.startswith(b'\xfd7zXZ\x00'):
+            return 'xz'
+        return None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        with _decompression_errors(self.raw_fileobj):
+            return self.decompressed.read(size)
+
+    def read1(self, size=-1):
+        try:
+            with _decompression_errors(self.raw_fileobj):
+                return self.decompressed.read1(size)
+        except io.UnsupportedOperation:
+            # GzipFile of Python 2 does not support read1.
+            return self.read(size)
+
+    def seek(self, offset, whence=0):
+        with _decompression_errors(self.raw_fileobj):
+            return self.decompressed.seek(offset, whence)
+
+    def tell(self):
+        return self.decompressed.tell()
+
+    def close(self):
+        if not self.closed:
+            self.decompressed.close()
+            self.raw_fileobj.close()
+        io.BufferedIOBase.close(self)
+
+
+class _IncompleteArchiveError(IOError):
+    """The compressed data is ended halfway, which may be still being
+    written."""
+
+
+@contextlib.contextmanager
+def _decompression_errors(fileobj):
+    """Raise the errors of the decompression as IOError.
+
+    Args:
+        fileobj (file): The binary file object of the compressed log file.
+            GzipFile of Python 2 raises IOError or struct.error instead of
+            EOFError for the compressed data ended halfway, which is told by
+            the error at the end of the file.
+
+    """
+    try:
+        yield
+    except EOFError as ex:
+        raise _IncompleteArchiveError(ex)
+    except io.UnsupportedOperation:
+        raise
+    except (EnvironmentError, struct.error) as ex:
+        if fileobj.tell() >= os.fstat(fileobj.fileno()).st_size:
+            raise _IncompleteArchiveError(ex)
+        if isinstance(ex, EnvironmentError):
+            raise
+        raise IOError(ex)
+    except zlib.error as ex:
+        raise IOError(ex)
+    except Exception as ex:  # pylint: disable=broad-except
+        if lzma is not None and isinstance(ex, lzma.LZMAError):
+            raise IOError(ex)
+        raise
+
+
+class _MultilineRecord(object):
+    """The record of the multiple lines with the same header.
+
+    The lines are joined into the message when the record is matched.
+    If the record exceeds `multiline_max_lines` or `multiline_max_size`,
+    the lines so far are matched as a segment and released, and only the head
+    of the message is kept for output, so that a runaway record such as
+    a stack trace or the lines unmatched with the log format is not held
+    in memory at once. A pattern across the segments is not found.
+    """
+
+    def __init__(self, checker, header):
+        self.checker = checker
+        self.header = header
+        self.messages = []
+        self.size = 0
+        self.lines = 0
+        self.max_lines = checker.config['multiline_max_lines']
+        self.max_size = checker.config['multiline_max_size']
+        self.found_patterns = None
+        '''The list of whether each type of patterns is found in the released
+        segments.'''
+        self.head_message = None
+
+    def append(self, message):
+        """Append the message of the line."""
+        self.messages.append(message)
+        self.size += len(message) + 1
+        self.lines += 1
+        if ((self.max_lines and len(self.messages) >= self.max_lines) or
+                (self.max_size and self.size >= self.max_size)):
+            self._release()
+
+    def _release(self):
+        """Match the lines so far as a segment, and release them."""
+        message = ' '.join(self.messages)
+        found_patterns = self.checker._find_patterns(self.header + message)  # pylint: disable=protected-access
+        if self.found_patterns is None:
+            self.found_patterns = found_patterns
+            self.head_message = message[:self.max_size or None]
+        else:
+            self.found_patterns = [
+                x or y for x, y in zip(self.found_patterns, found_patterns)]
+        self.messages = []
+        self.size = 0
+
+    def match(self):
+        """Return the tuple of the message for output, and whether the pattern
+        and the critical pattern are found in the record."""
+        if self.found_patterns is None:
+            message = ' '.join(self.messages)
+            return (message,) + self.checker._match(self.header, message)  # pylint: disable=protected-access
+        if self.messages:
+            self._release()
+        message = "{0} ... (truncated, {1} lines)".format(
+            self.head_message, self.lines)
+        return (message,) + LogChecker._judge(*self.found_patterns)  # pylint: disable=protected-access
+
+
+class _RecordBuilder(object):
+    """The builder of the records from the decoded lines pushed one by one.
+
+    The lines of a log file read once can be pushed to the builders of
+    several checks, each of which keeps its own multiline record.
+    """
+
+    def __init__(self, checker):
+        self.checker = checker
+        self.multiline = checker.config['multiline']
+        self.deferred_split = checker.deferred_split
+        self.record = None
+        self.record_offset = None
+        self.end = None
+
+    def push(self, offset, end, line):
+        """Push the line.
+
+        Returns:
+            The tuple of the offset, the end position, the header, the
+            message, and whether the pattern and the critical pattern are
+            found of the record completed by the line, if it is matched.
+            Otherwise, None.
+
+        """
+        checker = self.checker
+        self.end = end
+        if self.deferred_split:
+            is_found, is_critical_found = checker._match_line(line)  # pylint: disable=protected-access
+            if not is_found and not is_critical_found:
+                return None
+            header, message = checker._split_line(line) or ('', line)  # pylint: disable=protected-access
+            return offset, end, header, message, is_found, is_critical_found
+
+        splitted = checker._split_line(line)  # pylint: disable=protected-access
+        if splitted:
+            header, message = splitted
+        else:
+            if self.record is None or not self.multiline:
+                if checker.config['dry_run']:
+                    LogChecker.print_message("[DRY RUN] Log format does not match. Set --format option.")
+                    sys.exit(LogChecker.STATE_UNKNOWN)
+                # If you do not enable dry run, ignore log format errors.
+                header = ''
+            else:
+                # assume it is continuation
+                header = self.record.header
+            message = line
+
+        if not self.multiline:
+            is_found, is_critical_found = checker._match(header, message)  # pylint: disable=protected-access
+            if not is_found and not is_critical_found:
+                return None
+            return offset, end, header, message, is_found, is_critical_found
+
+        completed = None
+        if self.record is not None and self.record.header != header:
+            # The current line is a new log line.
+            completed = self._complete(offset)
+        if self.record is None:
+            self.record = _MultilineRecord(checker, header)
+            self.record_offset = offset
+        self.record.append(message)
+        return completed
+
+    def push_lines(self, lines):
+        """Push the list of the lines, and return the list of the records
+        completed by them in the same way as `push`.
+
+        It is faster than `push` for each line in the single line mode.
+        """
+        if not self.deferred_split:
+            records = []
+            push = self.push
+            for offset, end, line in lines:
+                record = push(offset, end, line)
+                if record is not None:
+                    records.append(record)
+            return records
+
+        records = []
+        match_line = self.checker._match_line  # pylint: disable=protected-access
+        split_line = self.checker._split_line  # pylint: disable=protected-access
+        for offset, end, line in lines:
+            is_found, is_critical_found = match_line(line)
+            if is_found or is_critical_found:
+                header, message = split_line(line) or ('', line)
+                records.append((offset, end, header, message,
+                                is_found, is_critical_found))
+        self.end = lines[-1][1]
+        return records
+
+    def flush(self):
+        """Complete the last record, and return it in the same way as
+        `push`."""
+        if self.record is None:
+            return None
+        return self._complete(self.end)
+
+    def _complete(self, end):
+        """Complete the record, and return it if it is matched."""
+        record = self.record
+        self.record = None
+        message, is_found, is_critical_found = record.match()
+        if not is_found and not is_critical_found:
+            return None
+        return (self.record_offset, end, record.header, message,
+                is_found, is_critical_found)
+
+
+class _SharedScan(object):
+    """The scan of a log file for a check, to which the lines read once for
+    several checks are pushed."""
+
+    def __init__(self, checker, seekfile, start_position):
+        self.checker = checker
+        self.seekfile = seekfile
+        self.start_position = start_position
+        self.builder = _RecordBuilder(checker)
+        self.found = checker._create_found_list()  # pylint: disable=protected-access
+        self.critical_found = checker._create_found_list()  # pylint: disable=protected-access
+        self.lines = 0
+
+    def push_lines(self, lines, candidates=None):
+        """Push the list of the tuples of the offset, the end position and
+        the decoded line. The lines before the start position are skipped.
+
+        If the candidates are given, only they are pushed instead of all the
+        lines. They must include all the lines which may be matched.
+        """
+        start_position = self.start_position
+        if lines[-1][0] < start_position:
+            return
+        if lines[0][0] < start_position:
+            self.lines += sum(1 for x in lines if x[0] >= start_position)
+        else:
+            self.lines += len(lines)
+        if candidates is not None:
+            lines = candidates
+        if lines and lines[0][0] < start_position:
+            lines = [x for x in lines if x[0] >= start_position]
+        if not lines:
+            return
+        for record in self.builder.push_lines(lines):
+            self._add(record)
+
+    def flush(self):
+        """Complete the last record."""
+        self._add(self.builder.flush())
+
+    def _add(self, record):
+        """Add the matched record to the found lists."""
+        if record is None:
+            return
+        offset, end, header, message, is_found, is_critical_found = record
+        if self.checker.tracer is not None:
+            self.checker._trace_found(  # pylint: disable=protected-access
+                offset, end, header, message, is_found, is_critical_found)
+        if is_found:
+            self.found.append({"header": header, "message": message})
+        if is_critical_found:
+            self.critical_found.append({"header": header, "message": message})
+
+
+class _FoundList(object):
+    """The list of found lines which keeps only the first and last lines.
+
+    The number of found lines is counted exactly, but only the first and
+    the last `limit` lines are stored in a fixed-size ring.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.head = []
+        self.tail = collections.deque(maxlen=limit)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for item in self.head:
+            yield item
+        for item in self.tail:
+            yield item
+
+    @property
+    def omitted(self):
+        """The number of lines not stored."""
+        return self.count - len(self.head) - len(self.tail)
+
+    def append(self, item):
+        """Append the found line."""
+        self.count += 1
+        if len(self.head) < self.limit:
+            self.head.append(item)
+        else:
+            self.tail.append(item)
+
+    def extend(self, items):
+        """Extend by the found lines, including the omitted lines."""
+        for item in items:
+            self.append(item)
+        if isinstance(items, _FoundList):
+            self.count += items.omitted
+
+
+class _SeekDatabase(object):
+    """The database of seek positions in the state directory.
+
+    This holds the seek positions of all log files in a single SQLite file
+    instead of seek files. The rows are keyed by the base names of seek
+    files, so that the glob patterns of seek files also select the rows.
+    The updates and the removals are kept in memory and written at once by
+    `commit` in a short transaction, so that the write lock of the database
+    is not held while scanning and the concurrent checks are not blocked.
+    """
+
+    _TIMEOUT = 10
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.updates = {}
+        self.removals = {}
+        self.connection = sqlite3.connect(
+            filename, timeout=_SeekDatabase._TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS seek ("
+            "name TEXT PRIMARY KEY, "
+            "offset INTEGER NOT NULL, "
+            "inode INTEGER, "
+            "mtime REAL, "
+            "updated REAL NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS seek_updated ON seek (updated)")
+        # The signature column is added after the first release.
+        columns = [row[1] for row in
+                   self.connection.execute("PRAGMA table_info(seek)")]
+        if 'signature' not in columns:
+            self.connection.execute(
+                "ALTER TABLE seek ADD COLUMN signature TEXT")
+        self.connection.commit()
+
+    def read(self, seekfile):
+        """Read the offset and the signature. If not found, return 0 and
+        None."""
+        name = os.path.basename(seekfile)
+        if name in self.updates:
+            return self.updates[name][0], self.updates[name][4]
+        if name in self.removals:
+            return 0, None
+        row = self.connection.execute(
+            "SELECT offset, signature FROM seek WHERE name = ?",
+            (name,)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], row[1]
+
+    def find(self, seekfile_pattern):
+        """Return the list of the tuples of the seek file, the offset and
+        the signature matched by the glob pattern."""
+        directory, pattern = os.path.split(seekfile_pattern)
+        rows = dict(
+            (name, (offset, signature)) for name, offset, signature in
+            self.connection.execute(
+                "SELECT name, offset, signature FROM seek WHERE name GLOB ?",
+                (pattern,)))
+        for name in self.removals:
+            rows.pop(name, None)
+        for name, update in self.updates.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                rows[name] = (update[0], update[4])
+        return [(os.path.join(directory, name), offset, signature)
+                for name, (offset, signature) in sorted(rows.items())]
+
+    def update(self, seekfile, position, inode=None, mtime=None,
+               signature=None):
+        """Update the offset with the inode and mtime of the log file."""
+        self.updates[os.path.basename(seekfile)] = (
+            position, inode, mtime, time.time(), signature)
+
+    def remove_old(self, seekfile_pattern, expired_time):
+        """Remove the rows matched by the glob pattern and older than the
+        time, and return the number of the removed rows."""
+        names = [row[0] for row in self.connection.execute(
+            "SELECT name FROM seek WHERE updated < ? AND name GLOB ?",
+            (expired_time, seekfile_pattern))
+                 if row[0] not in self.updates]
+        for name in names:
+            self.removals[name] = expired_time
+        return len(names)
+
+    def commit(self):
+        """Write and commit the updates and the removals."""
+        if not self.updates and not self.removals:
+            return
+        try:
+            self.connection.executemany(
+                "DELETE FROM seek WHERE name = ? AND updated < ?",
+                sorted(self.removals.items()))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO seek "
+                "(name, offset, inode, mtime, updated, signature) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(name,) + update
+                 for name, update in sorted(self.updates.items())])
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        finally:
+            self.updates = {}
+            self.removals = {}
+
+
+class _ScanStats(object):
+    """The statistics of a check.
+
+    The wall time and the CPU time are recorded for each phase, and the bytes,
+    the lines and the time to scan are recorded for each log file.
+    The CPU time of the worker processes of --jobs is not included.
+    """
+
+    PHASES = ['lock', 'cache', 'glob', 'stat', 'scan', 'seek']
+
+    def __init__(self):
+        self.phases = dict((name, [0.0, 0.0]) for name in self.PHASES)
+        self.files = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the wall time and the CPU time of the phase."""
+        start_time = time.time()
+        start_cpu_time = _process_time()
+        try:
+            yield
+        finally:
+            self.phases[name][0] += time.time() - start_time
+            self.phases[name][1] += _process_time() - start_cpu_time
+
+    @staticmethod
+    @contextlib.contextmanager
+    def shared_phase(stats_list, name):
+        """Record the wall time and the CPU time of the phase shared by
+        several checks to each of them."""
+        start_time = time.time()
+        start_cpu_time = _process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.time() - start_time
+            cpu_time = _process_time() - start_cpu_time
+            for stats in stats_list:
+                stats.phases[name][0] += wall_time
+                stats.phases[name][1] += cpu_time
+
+    def add_file(self, logfile, file_stats):
+        """Add the statistics of the scanned log file."""
+        self.files.append((logfile, file_stats))
+
+    @property
+    def bytes(self):
+        """The total bytes read from the log files."""
+        return sum(file_stats['bytes'] for _, file_stats in self.files)
+
+    @property
+    def lines(self):
+        """The total lines read from the log files."""
+        return sum(file_stats['lines'] for _, file_stats in self.files)
+
+    def format(self):
+        """Return the summary as a string."""
+        strings = ["{0:<6} {1:>10} {2:>10}".format("phase", "wall(s)", "cpu(s)")]
+        for name in self.PHASES:
+            wall_time, cpu_time = self.phases[name]
+            strings.append("{0:<6} {1:>10.3f} {2:>10.3f}".format(
+                name, wall_time, cpu_time))
+        strings.append("files={0} bytes={1} lines={2}".format(
+            len(self.files), self.bytes, self.lines))
+        for logfile, file_stats in self.files:
+            strings.append("{0}: bytes={1} lines={2} time={3:.3f}s".format(
+                logfile, file_stats['bytes'], file_stats['lines'],
+                file_stats['time']))
+        return "\n".join(strings)
+
+
+class _Tracer(object):
+    """The writer of the trace events as JSON lines.
+
+    Each event has "time", "pid" and "event", the fields in `context`, such
+    as the log file being scanned, and its own fields. An event is written
+    by a single write to the file opened in the append mode, so that the
+    events of the worker processes of --jobs are not mixed up.
+    The callers check whether the tracer exists before building the event,
+    so tracing costs nothing if it is disabled.
+    """
+
+    def __init__(self, filename):
+        self.fileobj = io.open(filename, mode='ab', buffering=0)
+        self.context = {}
+
+    def emit(self, event, **fields):
+        """Write the event with the fields."""
+        record = {"time": round(time.time(), 6), "pid": os.getpid(),
+                  "event": event}
+        record.update(self.context)
+        record.update(fields)
+        self.fileobj.write(LogChecker.to_bytes(
+            json.dumps(record, sort_keys=True) + "\n"))
+
+    def close(self):
+        """Close the trace file."""
+        self.fileobj.close()
+
+
+class _LockTimeout(Exception):
+    """The lock is timed out."""
+
+
+def _raise_lock_timeout(signum, frame):
+    """Interrupt the blocking lock at the timeout."""
+    raise _LockTimeout()
+
+
+class _DirectoryIndex(object):
+    """The cache of the listings of directories in the state directory.
+
+    The listing of a directory is reused while the modification time of
+    the directory is not changed. The directories modified within
+    `_GUARD_PERIOD` seconds are not cached, because the modification time
+    may not be changed by the following updates in the same period.
+    `glob` supports '**', which matches any files and zero or more
+    directories. Each directory under '**' is still stat-ed, but only the
+    changed directories are listed again.
+    """
+
+    _GUARD_PERIOD = 2
+    _RE_MAGIC = re.compile(r'[*?[]')
+    # The types of entries
+    _FILE = 'f'
+    _DIRECTORY = 'd'
+    _LINK_TO_DIRECTORY = 'l'
+
+    def __init__(self, filename, tracer=None):
+        self.filename = filename
+        self.tracer = tracer
+        self.listings = {}
+        self.visited = {}
+        # The entries listed by this instance, which '**' looks up twice.
+        self.entries = {}
+        try:
+            with io.open(filename, mode='r', encoding='utf-8') as fileobj:
+                listings = json.load(fileobj)
+            if isinstance(listings, dict):
+                self.listings = listings
+        except (EnvironmentError, ValueError):
+            pass
+
+    def glob(self, pattern):
+        """Return the list of the file names matching the pattern."""
+        if not self._RE_MAGIC.search(pattern):
+            if os.path.lexists(pattern):
+                return [pattern]
+            return []
+        parts = pattern.split(os.sep)
+        index = 0
+        while not self._RE_MAGIC.search(parts[index]):
+            index += 1
+        directory = os.sep.join(parts[:index])
+        if not directory and pattern.startswith(os.sep):
+            directory = os.sep
+        results = []
+        self._glob(directory, parts[index:], results)
+        # remove the duplicates by multiple '**'
+        filename_list = []
+        filename_set = set()
+        for filename in results:
+            if filename not in filename_set:
+                filename_set.add(filename)
+                filename_list.append(filename)
+        return filename_list
+
+    def _glob(self, directory, parts, results):
+        """Append the file names matching the parts under the directory."""
+        part = parts[0]
+        rest = parts[1:]
+        if part == '**':
+            entries = self.listdir(directory)
+            if rest:
+                self._glob(directory, rest, results)
+            for name in sorted(entries):
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(directory, name)
+                if not rest:
+                    results.append(path)
+                # Do not follow the symbolic links to avoid loops.
+                if entries[name] == self._DIRECTORY:
+                    self._glob(path, parts, results)
+            return
+
+        if not self._RE_MAGIC.search(part):
+            path = os.path.join(directory, part)
+            if rest:
+                if os.path.isdir(path):
+                    self._glob(path, rest, results)
+            elif os.path.lexists(path):
+                results.append(path)
+            return
+
+        entries = self.listdir(directory)
+        for name in sorted(fnmatch.filter(entries, part)):
+            if name.startswith('.') and not part.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            if not rest:
+                results.append(path)
+            elif entries[name] != self._FILE:
+                self._glob(path, rest, results)
+
+    def listdir(self, directory):
+        """Return the dict of the names and the types of the entries."""
+        key = directory or os.curdir
+        if key in self.entries:
+            return self.entries[key]
+        try:
+            directory_stat = os.stat(key)
+        except OSError:
+            return {}
+        listing = self.listings.get(key)
+        if (listing and listing[0] == directory_stat.st_mtime and
+                listing[1] == directory_stat.st_ino):
+            self.visited[key] = listing
+            self.entries[key] = listing[2]
+            return listing[2]
+
+        if self.tracer is not None:
+            self.tracer.emit('listdir', directory=key)
+        entries = {}
+        try:
+            names = os.listdir(key)
+        except OSError:
+            return {}
+        for name in names:
+            path = os.path.join(key, name)
+            try:
+                mode = os.lstat(path).st_mode
+            except OSError:
+                continue
+            if stat.S_ISDIR(mode):
+                entries[name] = self._DIRECTORY
+            elif stat.S_ISLNK(mode) and os.path.isdir(path):
+                entries[name] = self._LINK_TO_DIRECTORY
+            else:
+                entries[name] = self._FILE
+        if directory_stat.st_mtime < time.time() - self._GUARD_PERIOD:
+            self.visited[key] = [
+                directory_stat.st_mtime, directory_stat.st_ino, entries]
+        self.entries[key] = entries
+        return entries
+
+    def save(self):
+        """Save the listings of the directories visited."""
+        if self.visited == self.listings:
+            return
+        tmp_filename = self.filename + "." + str(os.getpid())
+        with io.open(tmp_filename, mode='w', encoding='utf-8') as fileobj:
+            fileobj.write(LogChecker.to_unicode(json.dumps(self.visited)))
+            fileobj.flush()
+            fileobj.close()
+        os.rename(tmp_filename, self.filename)
+
+
+class _Inotify(object):
+    """The minimal interface of Linux inotify by ctypes.
+
+    Only whether any events occur in the watched directories is notified,
+    because the log files are scanned by the seek files anyway.
+    """
+
+    _IN_MODIFY = 0x00000002
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_MOVE_SELF = 0x00000800
+    _MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+             _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+    _BUFFER_SIZE = 65536
+
+    def __init__(self):
+        if ctypes is None:
+            raise OSError("ctypes module is not found.")
+        libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init'):
+            raise OSError("inotify is not available.")
+        self._inotify_add_watch = libc.inotify_add_watch
+        self._inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def watch(self, directory):
+        """Watch the directory. Watching the same directory again is
+        harmless."""
+        wd = self._inotify_add_watch(
+            self.fd, LogChecker.to_bytes(directory), self._MASK)
+        if wd < 0:
+            return False
+        return True
+
+    def wait(self, timeout):
+        """Wait for the events, and return True if any events occur."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        os.read(self.fd, self._BUFFER_SIZE)
+        return True
+
+    def close(self):
+        """Close the inotify instance."""
+        os.close(self.fd)
+
+
+def _get_watch_directories(log, logfile_pattern):
+    """Return the list of directories to be watched for the log files."""
+    directories = []
+    for filename_pattern in logfile_pattern.split():
+        # the directory without the magic characters of glob
+        directory = os.path.dirname(filename_pattern)
+        while re.search(r'[*?[]', directory):
+            directory = os.path.dirname(directory)
+        directories.append(directory or os.curdir)
+    if LogChecker.is_multiple_logfiles(logfile_pattern):
+        for logfile in log._get_logfile_list(logfile_pattern):  # pylint: disable=protected-access
+            directories.append(os.path.dirname(logfile) or os.curdir)
+    return sorted(set(directories))
+
+
+def _serve_watch(args):
+    """Scan the log files as they grow, and keep the found lines for the
+    following checks with the same options.
+
+    The log files are scanned when their directories are modified, or every
+    `_WATCH_INTERVAL` seconds if inotify is not available.
+    """
+    config = _generate_config(args)
+    log = LogChecker(config)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(LogChecker.STATE_OK))
+    try:
+        inotify = _Inotify()
+    except OSError as ex:
+        if log.tracer is not None:
+            log.tracer.emit('watch', inotify=False, reason=LogChecker.to_unicode(
+                str(ex)))
+        inotify = None
+    try:
+        while True:
+            log.accumulate(
+                args.logfile_pattern, seekfile=args.seekfile,
+                remove_seekfile=args.remove_seekfile, tag=args.tag)
+            if inotify is None:
+                time.sleep(_WATCH_INTERVAL)
+                continue
+            for directory in _get_watch_directories(log, args.logfile_pattern):
+                inotify.watch(directory)
+            if inotify.wait(_WATCH_INTERVAL):
+                # Scan the lines written at once together.
+                time.sleep(_WATCH_DELAY)
+                while inotify.wait(0):
+                    pass
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+
+# The instance of LogChecker in the worker process.
+_WORKER_CHECKER = None
+
+
+def _init_scan_worker(config):
+    """Initialize the worker process to scan log files."""
+    global _WORKER_CHECKER  # pylint: disable=global-statement
+    _WORKER_CHECKER = LogChecker(config)
+
+
+def _scan_log_worker(target):
+    """Scan the log file in the worker process."""
+    logfile, seekfile, listed_stat = target
+    return _WORKER_CHECKER._scan_log(logfile, seekfile, listed_stat)  # pylint: disable=protected-access
 
 
 def _make_parser():
@@ -1039,7 +4192,6 @@ def _make_parser():
         "-l", "--logfile",
         action="store",
         dest="logfile_pattern",
-        required=True,
         metavar="<filename>",
         help=("The file names of log files to be scanned. "
               "The metacharacters * and ? are available. "
@@ -1057,6 +4209,8 @@ def _make_parser():
               "HEADER includes TIMESTAMP, HOSTNAME, TAG and so on. "
               "Also, it may use %%%%, %%Y, %%y, %%a, %%b, %%m, %%d, %%e, %%H, "
               "%%M, %%S, %%F and %%T of strftime(3). "
+              "The built-in formats can be specified by the names: "
+              "'syslog', 'rfc5424', 'iso8601' and 'combined'. "
               "(default: regular expression for syslog.")
     )
     parser.add_argument(
@@ -1233,6 +4387,30 @@ def _make_parser():
               "If the log format is not syslog, set --format option. "
               "See also --format.")
     )
+    parser.add_argument(
+        "--multiline-max-lines",
+        action="store",
+        type=int,
+        dest="multiline_max_lines",
+        default=10000,
+        metavar="<lines>",
+        help=("The maximum number of lines of a message held in memory "
+              "with --multiline. The longer message is matched in segments "
+              "and truncated in the output. "
+              "To set unlimited, set '0'. (default: %(default)s)")
+    )
+    parser.add_argument(
+        "--multiline-max-size",
+        action="store",
+        type=int,
+        dest="multiline_max_size",
+        default=1048576,
+        metavar="<characters>",
+        help=("The maximum number of characters of a message held in memory "
+              "with --multiline. The longer message is matched in segments "
+              "and truncated in the output. "
+              "To set unlimited, set '0'. (default: %(default)s)")
+    )
     parser.add_argument(
         "--cachetime",
         action="store",
@@ -1272,16 +4450,173 @@ def _make_parser():
         default=False,
         help=("QUIET mode: Suppress the output of matched lines.")
     )
+    parser.add_argument(
+        "--output-limit",
+        action="store",
+        type=int,
+        dest="output_limit",
+        default=0,
+        metavar="<number>",
+        help=("Output only the first and last this many matched lines "
+              "for each of warning and critical. "
+              "The matched lines are still counted. "
+              "To output all matched lines, set '0'. "
+              "(default: %(default)s)")
+    )
+    parser.add_argument(
+        "--perfdata",
+        action="store_true",
+        dest="perfdata",
+        default=False,
+        help=("Output the performance data: the numbers of matched lines, "
+              "the files scanned, the bytes and lines read since the last "
+              "check, the scan duration and the lines per second.")
+    )
+    parser.add_argument(
+        "--seek-by-time",
+        action="store_true",
+        dest="seek_by_time",
+        default=False,
+        help=("If the log file has no seek file, start scanning at the first "
+              "line newer than --scantime, by binary search on the "
+              "timestamps of syslog, ISO 8601 or the common log format "
+              "in the headers. The lines must be in order of time.")
+    )
+    parser.add_argument(
+        "--listing-cache",
+        action="store_true",
+        dest="listing_cache",
+        default=False,
+        help=("Cache the listings of the directories of log files in the "
+              "state directory, and list a directory again only if it is "
+              "modified. '**' in --logfile matches any files and zero or "
+              "more directories.")
+    )
+    parser.add_argument(
+        "--byte-scan",
+        action="store_true",
+        dest="byte_scan",
+        default=False,
+        help=("Scan the log file as bytes and decode only the matched lines. "
+              "It is available for ASCII compatible encodings "
+              "such as utf-8, euc-jp and latin-1, and not for --multiline. "
+              "If the patterns include non-ASCII characters, '.', '\\w', "
+              "'\\d', '\\s', '\\b' or negated character sets, which "
+              "may not match multibyte characters as bytes, or 'i', 'k' "
+              "and 's' with -i, the log file is scanned as text.")
+    )
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        type=int,
+        dest="jobs",
+        default=1,
+        metavar="<number>",
+        help=("The number of processes to scan multiple log files in parallel. "
+              "(default: %(default)s)")
+    )
+    parser.add_argument(
+        "--state-backend",
+        action="store",
+        dest="state_backend",
+        choices=["file", "sqlite"],
+        default="file",
+        metavar="<backend>",
+        help=("The backend to store seek positions: 'file' or 'sqlite'. "
+              "'file' creates a seek file per log file. "
+              "'sqlite' stores them in a database file in the state directory. "
+              "(default: %(default)s)")
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store",
+        dest="daemon",
+        metavar="<socket>",
+        help=("Run as a daemon which serves checks on the UNIX domain socket. "
+              "The compiled patterns are kept for the following checks. "
+              "See also --socket.")
+    )
+    parser.add_argument(
+        "--socket",
+        action="store",
+        dest="socket",
+        metavar="<socket>",
+        help=("Forward the check to the daemon on the UNIX domain socket. "
+              "If the daemon is not running or does not respond within "
+              "5 seconds, check by itself. "
+              "See also --daemon.")
+    )
+    parser.add_argument(
+        "--check-definitions",
+        action="store",
+        dest="check_definitions",
+        metavar="<file>",
+        help=("Run the checks defined in the file, reading each log file "
+              "once for all the checks. Each line of the file is the "
+              "options of a check, quoted like the shell. Each check keeps "
+              "its own seek files and cache file, and the message of each "
+              "check is printed on its own line. The worst state of the "
+              "checks is returned.")
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        dest="watch",
+        default=False,
+        help=("Run as a watcher which scans the log files as they grow, "
+              "by inotify on Linux. The found lines are kept in the state "
+              "directory for the checks with the same options, so that the "
+              "checks only collect them. "
+              "The watcher is not forwarded to the daemon.")
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        dest="timing",
+        default=False,
+        help=("Print the wall and CPU time of each phase, and the bytes and "
+              "lines read from each log file to stderr. "
+              "The check is not forwarded to the daemon.")
+    )
+    parser.add_argument(
+        "--profile",
+        action="store",
+        dest="profile",
+        metavar="<file>",
+        help=("Dump the profile of the check by cProfile to the file, "
+              "which can be read by the pstats module. "
+              "The check is not forwarded to the daemon.")
+    )
+    parser.add_argument(
+        "--trace",
+        action="store",
+        dest="trace",
+        metavar="<file>",
+        help=("Append the trace events of the check to the file as JSON "
+              "lines, such as the offsets of each line, the matched lines "
+              "with the patterns found, and the decisions on the cache, "
+              "the lock and the seek positions. "
+              "While tracing, every line is decoded, split into the header "
+              "and the message, and matched one by one, even with "
+              "--byte-scan, so the matched lines are the same but the scan "
+              "is slower. "
+              "The check is not forwarded to the daemon.")
+    )
     return parser
 
 
-def _check_parser_args(parser):
-    args = parser.parse_args()
+def _check_parser_args(parser, argv=None, check_patterns=True):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
 
-    if len(sys.argv) == 1:
+    if not argv:
         parser.print_help()
         sys.exit(LogChecker.STATE_UNKNOWN)
 
+    if args.daemon or args.check_definitions:
+        return args
+
     # check args
     if not args.logfile_pattern:
         parser.exit(
@@ -1325,6 +4660,9 @@ def _check_parser_args(parser):
                     "the log file is not found: {0}".format(
                         args.logfile_pattern))
 
+    # The daemon checks the patterns when the pattern files are changed.
+    if not check_patterns:
+        return args
     pattern_list = LogChecker.get_pattern_list(args.pattern, args.patternfile)
     critical_pattern_list = LogChecker.get_pattern_list(
         args.critical_pattern, args.critical_patternfile)
@@ -1367,31 +4705,406 @@ def _generate_config(args):
         "critical": args.critical,
         "trace_inode": args.trace_inode,
         "multiline": args.multiline,
+        "multiline_max_lines": args.multiline_max_lines,
+        "multiline_max_size": args.multiline_max_size,
         "scantime": args.scantime,
         "expiration": args.expiration,
         "cachetime": args.cachetime,
         "lock_timeout": args.lock_timeout,
         "output_header": args.output_header,
-        "output_quiet": args.output_quiet
+        "output_quiet": args.output_quiet,
+        "byte_scan": args.byte_scan,
+        "jobs": args.jobs,
+        "state_backend": args.state_backend,
+        "output_limit": args.output_limit,
+        "perfdata": args.perfdata,
+        "seek_by_time": args.seek_by_time,
+        "listing_cache": args.listing_cache,
+        "trace": args.trace
     }
     return config
 
 
+def _get_checker(args, checkers):
+    """Get the instance of LogChecker to be reused for the arguments.
+
+    The instances are keyed by the arguments, the working directory and the
+    stats of the pattern files, so that the pattern files are not read
+    again until they are changed.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        checkers (dict): The instances of LogChecker to be reused.
+
+    Returns:
+        The instance of LogChecker. If any valid patterns are not found,
+        return None to let the client report it.
+
+    """
+    patternfile_stats = []
+    for patternfile in [args.patternfile, args.critical_patternfile,
+                        args.negpatternfile, args.critical_negpatternfile]:
+        try:
+            patternfile_stat = os.stat(patternfile)
+            patternfile_stats.append([
+                patternfile_stat.st_ino, patternfile_stat.st_size,
+                patternfile_stat.st_mtime])
+        except (TypeError, OSError):
+            patternfile_stats.append(None)
+    key = LogChecker.get_digest(json.dumps(
+        [vars(args), os.getcwd(), patternfile_stats], sort_keys=True))
+    log = checkers.get(key)
+    if log is None:
+        config = _generate_config(args)
+        if not config['pattern_list'] and not config['critical_pattern_list']:
+            return None
+        if len(checkers) >= _DAEMON_MAX_CHECKERS:
+            _close_checkers(checkers)
+        log = LogChecker(config)
+        checkers[key] = log
+    return log
+
+
+def _run_check(args, log=None):
+    """Run the check.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        log (LogChecker, optional): The instance of LogChecker to be reused.
+
+    Returns:
+        The tuple of the state and the message.
+
+    """
+    reused = log is not None
+    if reused:
+        log.clear_state()
+    else:
+        log = LogChecker(_generate_config(args))
+    try:
+        log.check(
+            args.logfile_pattern, seekfile=args.seekfile,
+            remove_seekfile=args.remove_seekfile, tag=args.tag)
+    finally:
+        # The instance reused is closed by its owner.
+        if not reused:
+            log.close()
+    if args.timing:
+        print(log.get_stats().format(), file=sys.stderr)
+    state = log.get_state()
+    message = log.get_message()
+    if args.dry_run:
+        message = "[DRY RUN] {0}".format(message)
+    return state, message
+
+
+def _run_check_definitions(filename):
+    """Run the checks defined in the file, reading each log file once.
+
+    Each line of the file is the options of a check, split like the shell.
+    The empty lines and the comments starting with '#' are ignored.
+
+    Returns:
+        The tuple of the worst state and the list of the messages of the
+        checks.
+
+    """
+    try:
+        with io.open(filename, mode='r', encoding='utf-8') as fileobj:
+            definitions = fileobj.readlines()
+            fileobj.close()
+    except EnvironmentError:
+        LogChecker.print_message(
+            "Unable to read the check definitions: {0}".format(filename))
+        sys.exit(LogChecker.STATE_UNKNOWN)
+
+    parser = _make_parser()
+    checks = []
+    results = []
+    timings = []
+    for lineno, definition in enumerate(definitions, 1):
+        argv = shlex.split(definition, comments=True)
+        if not argv:
+            continue
+        name = "line {0}".format(lineno)
+        try:
+            args = _check_parser_args(parser, argv)
+            if args.daemon or args.watch or args.check_definitions:
+                raise SystemExit(LogChecker.STATE_UNKNOWN)
+        except SystemExit:
+            results.append((name, None, LogChecker.STATE_UNKNOWN,
+                            "UNKNOWN: Invalid check definition."))
+            continue
+        if args.tag:
+            name = args.tag
+        try:
+            log = LogChecker(_generate_config(args))
+        except SystemExit:
+            results.append((name, None, LogChecker.STATE_UNKNOWN,
+                            "UNKNOWN: The check is aborted by the error."))
+            continue
+        checks.append((log, args.logfile_pattern, args.seekfile,
+                       args.remove_seekfile, args.tag))
+        results.append((name, log, None, None))
+        if args.timing:
+            timings.append((name, log))
+    try:
+        LogChecker.check_shared(checks)
+    finally:
+        for log, _, _, _, _ in checks:
+            log.close()
+
+    for name, log in timings:
+        print("{0}:\n{1}".format(name, log.get_stats().format()),
+              file=sys.stderr)
+    state = LogChecker.STATE_OK
+    messages = []
+    for name, log, check_state, message in results:
+        if log is not None:
+            check_state = log.get_state()
+            message = log.get_message()
+        if _STATE_SEVERITY.index(check_state) > _STATE_SEVERITY.index(state):
+            state = check_state
+        messages.append("{0}: {1}".format(name, message))
+    return state, messages
+
+
+def _serve_daemon(socket_path):
+    """Serve checks on the UNIX domain socket.
+
+    A request is a JSON line of the arguments and the working directory of
+    the client, and a response is a JSON line of the state and the message.
+    Each check runs in a forked child process with the instance of
+    LogChecker kept by the daemon, so that the slow checks do not block the
+    others. The concurrent checks of the same log files are serialized by
+    the lock files as the checks of the other processes.
+    """
+    if os.path.exists(socket_path):
+        if _request_daemon(socket_path, None) is not None:
+            LogChecker.print_message(
+                "The daemon is already running: {0}".format(socket_path))
+            sys.exit(LogChecker.STATE_UNKNOWN)
+        os.unlink(socket_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(LogChecker.STATE_OK))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(128)
+    parser = _make_parser()
+    checkers = {}
+    cwd = os.getcwd()
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                _serve_request(conn, parser, checkers)
+            except Exception:  # pylint: disable=broad-except
+                # The client checks by itself if no response.
+                pass
+            finally:
+                conn.close()
+                os.chdir(cwd)
+                _reap_children()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        _close_checkers(checkers)
+
+
+def _serve_request(conn, parser, checkers):
+    """Serve a request of the daemon.
+
+    The check runs in a forked child process, which sends the response.
+    The errors exiting the check are sent as the response with the messages
+    printed by them.
+    """
+    conn.settimeout(_DAEMON_TIMEOUT)
+    fileobj = conn.makefile('rb')
+    line = fileobj.readline()
+    fileobj.close()
+    request = json.loads(LogChecker.to_unicode(line))
+    if request.get('argv') is None:
+        # ping
+        _send_response(conn, {})
+        return
+
+    os.chdir(request['cwd'])
+    try:
+        args = _check_parser_args(
+            parser, request['argv'], check_patterns=False)
+    except SystemExit:
+        # Let the client check by itself to report the usage error.
+        _send_response(conn, {"fallback": True})
+        return
+    if (args.timing or args.profile or args.trace or
+            args.check_definitions or args.watch):
+        # Let the client check by itself to measure it, or to run the
+        # watcher.
+        _send_response(conn, {"fallback": True})
+        return
+
+    messages = []
+    try:
+        with _capture_stdout(messages):
+            log = _get_checker(args, checkers)
+    except SystemExit as ex:
+        _send_response(conn, _create_exit_response(ex, messages))
+        return
+    if log is None:
+        _send_response(conn, {"fallback": True})
+        return
+
+    if os.fork() != 0:
+        return
+    # child process
+    try:
+        try:
+            with _capture_stdout(messages):
+                state, message = _run_check(args, log)
+            response = {"state": state, "message": message}
+        except SystemExit as ex:
+            response = _create_exit_response(ex, messages)
+        _send_response(conn, response)
+    finally:
+        os._exit(0)  # pylint: disable=protected-access
+
+
+def _close_checkers(checkers):
+    """Close and remove the instances of LogChecker kept by the daemon."""
+    for log in checkers.values():
+        log.close()
+    checkers.clear()
+
+
+def _send_response(conn, response):
+    """Send the response of the daemon as a JSON line."""
+    conn.sendall(LogChecker.to_bytes(json.dumps(response) + "\n"))
+
+
+def _create_exit_response(ex, messages):
+    """Create the response of the daemon for the check exiting by the error,
+    with the messages printed before exiting."""
+    state = ex.code
+    if state not in _STATE_SEVERITY:
+        state = LogChecker.STATE_UNKNOWN
+    message = "\n".join([message for message in messages if message])
+    if not message:
+        message = "UNKNOWN: The check is aborted by the error."
+    return {"state": state, "message": message}
+
+
+@contextlib.contextmanager
+def _capture_stdout(messages):
+    """Capture the messages written to stdout, such as the errors printed
+    by `LogChecker.print_message` before exiting, and append them to the
+    list."""
+    sys.stdout.flush()
+    capture = tempfile.TemporaryFile()
+    saved_fd = os.dup(1)
+    os.dup2(capture.fileno(), 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+        capture.seek(0)
+        messages.append(LogChecker.to_unicode(capture.read()).rstrip('\n'))
+        capture.close()
+
+
+def _reap_children():
+    """Reap the child processes of the daemon which have exited."""
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            # no child processes
+            return
+        if pid == 0:
+            return
+
+
+def _request_daemon(socket_path, argv, timeout=_DAEMON_TIMEOUT):
+    """Request the check to the daemon.
+
+    Args:
+        socket_path (str): The file name of the UNIX domain socket.
+        argv (list): The arguments of the check. If None, only ping.
+        timeout (float, optional): The seconds to wait for the response.
+
+    Returns:
+        The tuple of the state and the message.
+        If the daemon is not available or does not respond within the
+        timeout, return None.
+
+    """
+    request = {"argv": argv, "cwd": os.getcwd()}
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # socket.timeout is also an EnvironmentError.
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall(LogChecker.to_bytes(json.dumps(request) + "\n"))
+        fileobj = client.makefile('rb')
+        line = fileobj.readline()
+        fileobj.close()
+    except EnvironmentError:
+        return None
+    finally:
+        client.close()
+    try:
+        response = json.loads(LogChecker.to_unicode(line))
+    except ValueError:
+        return None
+    if argv is None:
+        return (None, None)
+    if 'state' not in response:
+        return None
+    return response['state'], response['message']
+
+
+def _find_socket_option(argv):
+    """Find the value of --socket option without building the parser."""
+    for index, arg in enumerate(argv):
+        if arg == '--socket' and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith('--socket='):
+            return arg[len('--socket='):]
+    return None
+
+
 def main():
     """Run check_log_ng."""
+    socket_path = _find_socket_option(sys.argv[1:])
+    if socket_path:
+        result = _request_daemon(socket_path, sys.argv[1:])
+        if result is not None:
+            state, message = result
+            LogChecker.print_message(message)
+            sys.exit(state)
+
     parser = _make_parser()
     args = _check_parser_args(parser)
-    config = _generate_config(args)
-    log = LogChecker(config)
-    log.check(
-        args.logfile_pattern, seekfile=args.seekfile,
-        remove_seekfile=args.remove_seekfile, tag=args.tag)
-    state = log.get_state()
-    message = log.get_message()
-    if args.dry_run:
-        LogChecker.print_message("[DRY RUN] {0}".format(message))
+    if args.daemon:
+        _serve_daemon(args.daemon)
+        sys.exit(LogChecker.STATE_OK)
+    if args.watch:
+        _serve_watch(args)
+        sys.exit(LogChecker.STATE_OK)
+    if args.check_definitions:
+        state, messages = _run_check_definitions(args.check_definitions)
+        LogChecker.print_message("\n".join(messages))
+        sys.exit(state)
+    if args.profile:
+        profiler = cProfile.Profile()
+        try:
+            state, message = profiler.runcall(_run_check, args)
+        finally:
+            profiler.dump_stats(args.profile)
     else:
-        LogChecker.print_message(message)
+        state, message = _run_check(args)
+    LogChecker.print_message(message)
     sys.exit(state)
 
 
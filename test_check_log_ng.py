@@ -10,11 +10,33 @@ import unittest
 import warnings
 import os
 import glob
+import gzip
 import io
+import json
 import time
 import datetime
+import re
+import sqlite3
+import socket
 import subprocess
+import sys
+import fcntl
+import signal
+import check_log_ng
 from check_log_ng import LogChecker
+from check_log_ng import _Inotify
+from check_log_ng import _LineReader
+from check_log_ng import _SeekDatabase
+from check_log_ng import _generate_config
+from check_log_ng import _make_parser
+from check_log_ng import _request_daemon
+from check_log_ng import _run_check_definitions
+
+try:
+    # argparse of python 2 writes str to stderr.
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 
 class LogCheckerTestCase(unittest.TestCase):
@@ -121,6 +143,13 @@ class LogCheckerTestCase(unittest.TestCase):
             if os.path.exists(cachefile):
                 os.unlink(cachefile)
 
+        # remove a manifest file.
+        manifestfiles = glob.glob(
+            os.path.join(self.STATEDIR, '*' + LogChecker._SUFFIX_MANIFEST))
+        for manifestfile in manifestfiles:
+            if os.path.exists(manifestfile):
+                os.unlink(manifestfile)
+
         # remove a lock file.
         lockfiles = glob.glob(
             os.path.join(self.STATEDIR, '*' + LogChecker._SUFFIX_LOCK))
@@ -186,6 +215,64 @@ class LogCheckerTestCase(unittest.TestCase):
             log.get_message(),
             self.MESSAGE_WARNING_ONE.format(line, self.logfile))
 
+    def test_named_format(self):
+        """--format option with the names of the built-in formats
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["output_header"] = True
+        headers = {
+            "rfc5424": (
+                '<34>1 2017-12-05T12:34:50.003Z hostname app 123 ID47 '
+                '[origin ip="192.0.2.1"] '),
+            "iso8601": "2017-12-05 12:34:50,123 ",
+            "combined": "192.0.2.1 - - [05/Dec/2017:12:34:50 +0900] ",
+        }
+        for name in sorted(headers):
+            self.config["logformat"] = name
+            log = LogChecker(self.config)
+            line = headers[name] + "ERROR"
+            fileobj = io.open(self.logfile, mode='a', encoding='utf-8')
+            fileobj.write(line + "\n")
+            fileobj.close()
+            log.check(self.logfile)
+
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                log.get_message(),
+                self.MESSAGE_WARNING_ONE_WITH_HEADER.format(
+                    headers[name], self.logfile))
+
+    def test_deferred_split(self):
+        """The line is split only if matched
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["output_header"] = True
+        log = LogChecker(self.config)
+        self.assertTrue(log.deferred_split)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        line = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile, line)
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE_WITH_HEADER.format(
+                line[:-len("ERROR")], self.logfile))
+
+        # The header and the message are matched joined without the space
+        # if the log format does not cover the whole line.
+        self.config["logformat"] = r"^(\S+) (.*)$"
+        self.config["pattern_list"] = ["hostname ERROR"]
+        self.config["output_header"] = False
+        log = LogChecker(self.config)
+        self.assertFalse(log.deferred_split)
+        fileobj = io.open(self.logfile, mode='a', encoding='utf-8')
+        fileobj.write("hostname ERROR\n")
+        fileobj.close()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+
     def test_pattern(self):
         """--pattern option
         """
@@ -316,6 +403,294 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_OK)
         self.assertEqual(log.get_message(), self.MESSAGE_OK)
 
+    def test_output_limit(self):
+        """--output-limit option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["output_limit"] = 1
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR1
+        # Dec  5 12:34:50 hostname test: ERROR2
+        # Dec  5 12:34:50 hostname test: ERROR3
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR1")
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR2")
+        line3 = self._make_line(self._get_timestamp(), "test", "ERROR3")
+        self._write_logfile(self.logfile, [line1, line2, line3])
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            "WARNING: Found 3 lines (limit=1/0): {0},(1 lines omitted),{1} at {2}".format(
+                line1, line3, self.logfile))
+
+        # the seek file is updated.
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        self.assertEqual(log.get_message(), self.MESSAGE_OK)
+
+    def test_iter_matches(self):
+        """LogChecker.iter_matches()
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["critical_pattern_list"] = ["FATAL"]
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        # Dec  5 12:34:50 hostname test: FATAL
+        # Dec  5 12:34:50 hostname test: INFO
+        # Dec  5 12:34:50 hostname test: ERROR
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
+        line2 = self._make_line(self._get_timestamp(), "test", "FATAL")
+        line3 = self._make_line(self._get_timestamp(), "test", "INFO")
+        line4 = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile, [line1, line2, line3, line4])
+        log.clear_state()
+
+        # close the iterator after the first record.
+        iterator = log.iter_matches(self.logfile)
+        record = next(iterator)
+        iterator.close()
+        offset = len(self._make_line(self._get_timestamp(), "noop", "NOOP")) + 1
+        self.assertEqual(record["file"], self.logfile)
+        self.assertEqual(record["offset"], offset)
+        self.assertEqual(record["header"] + record["message"], line1)
+        self.assertEqual(record["severity"], LogChecker.STATE_WARNING)
+
+        # the rest of records are yielded next time.
+        records = list(log.iter_matches(self.logfile))
+        self.assertEqual(
+            [(r["offset"], r["message"], r["severity"]) for r in records],
+            [(offset + len(line1) + 1, "FATAL", LogChecker.STATE_CRITICAL),
+             (offset + len(line1 + line2 + line3) + 3, "ERROR",
+              LogChecker.STATE_WARNING)])
+
+        # the seek file is updated.
+        self.assertEqual(list(log.iter_matches(self.logfile)), [])
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+
+    def test_timing(self):
+        """--timing option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        line = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile, line)
+        log.clear_state()
+        log.check(self.logfile)
+
+        stats = log.get_stats()
+        self.assertEqual(len(stats.files), 1)
+        self.assertEqual(stats.bytes, os.path.getsize(self.logfile))
+        self.assertEqual(stats.lines, 3)
+        self.assertTrue(stats.phases['scan'][0] > 0)
+        summary = stats.format()
+        for phase in ['lock', 'cache', 'glob', 'stat', 'scan', 'seek']:
+            self.assertIn("\n{0} ".format(phase), summary)
+        self.assertIn(
+            "{0}: bytes={1} lines=3 ".format(self.logfile, stats.bytes),
+            summary)
+
+    def test_trace(self):
+        """--trace option
+        """
+        tracefile = os.path.join(self.STATEDIR, 'check_log_ng.trace')
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["negpattern_list"] = ["IGNORE"]
+        self.config["trace"] = tracefile
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        # Dec  5 12:34:50 hostname test: ERROR IGNORE
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR IGNORE")
+        self._write_logfile(self.logfile, [line1, line2])
+        log.clear_state()
+        log.check(self.logfile)
+        tracer = log.tracer
+        log.close()
+        self.assertTrue(tracer.fileobj.closed)
+        self.assertEqual(log.tracer, None)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line1, self.logfile))
+
+        with io.open(tracefile, mode='r', encoding='utf-8') as fileobj:
+            events = [json.loads(line) for line in fileobj]
+        os.unlink(tracefile)
+        self.assertEqual(events[0]['event'], 'logformat')
+        lock_events = [e for e in events if e['event'] == 'lock']
+        self.assertEqual(len(lock_events), 1)
+        self.assertTrue(lock_events[0]['locked'])
+        # The lines are surrounded by NOOP lines.
+        line_events = [e for e in events if e['event'] == 'line']
+        self.assertEqual(len(line_events), 4)
+        self.assertEqual(line_events[2]['offset'], line_events[1]['end'])
+        self.assertEqual(
+            line_events[2]['end'] - line_events[2]['offset'], len(line2) + 1)
+        found_events = [e for e in events if e['event'] == 'found']
+        self.assertEqual(len(found_events), 1)
+        self.assertEqual(found_events[0]['file'], self.logfile)
+        self.assertEqual(found_events[0]['offset'], line_events[1]['offset'])
+        self.assertEqual(found_events[0]['end'], line_events[1]['end'])
+        self.assertEqual(found_events[0]['message'], "ERROR")
+        self.assertEqual(found_events[0]['patterns'], {"pattern": "ERROR"})
+        scan_events = [e for e in events if e['event'] == 'scan']
+        self.assertEqual(len(scan_events), 1)
+        self.assertEqual(scan_events[0]['end'], os.path.getsize(self.logfile))
+        self.assertEqual(scan_events[0]['lines'], 4)
+
+        # The check returns without the lock if not updated.
+        log = LogChecker(self.config)
+        log.check(self.logfile)
+        log.close()
+        with io.open(tracefile, mode='r', encoding='utf-8') as fileobj:
+            events = [json.loads(line) for line in fileobj]
+        os.unlink(tracefile)
+        self.assertEqual(
+            [e['unchanged'] for e in events if e['event'] == 'manifest'],
+            [True])
+        self.assertEqual([e for e in events if e['event'] == 'lock'], [])
+
+        # The check scans again if the seek file is removed.
+        os.unlink(log._create_seek_filename(self.logfile, self.logfile))
+        log = LogChecker(self.config)
+        log.check(self.logfile)
+        log.close()
+        with io.open(tracefile, mode='r', encoding='utf-8') as fileobj:
+            events = [json.loads(line) for line in fileobj]
+        os.unlink(tracefile)
+        self.assertEqual(
+            [e['unchanged'] for e in events if e['event'] == 'manifest'],
+            [False])
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+
+    def test_perfdata(self):
+        """--perfdata option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["perfdata"] = True
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR|1
+        line = self._make_line(self._get_timestamp(), "test", "ERROR|1")
+        self._write_logfile(self.logfile, line)
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        message, perfdata = log.get_message().split(" | ")
+        self.assertEqual(
+            message,
+            self.MESSAGE_WARNING_ONE.format(
+                line.replace("|", "(pipe)"), self.logfile))
+        self.assertTrue(re.match(
+            r"^warning=1 critical=0 files=1 bytes={0}B lines=3 "
+            r"duration=\d+\.\d+s lines_per_sec=\d+$".format(
+                os.path.getsize(self.logfile)), perfdata))
+
+    def test_rotated_while_listing(self):
+        """--trace-inode option, the log file rotated after listed
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["trace_inode"] = True
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        line = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile, line)
+        targets = log._get_targets(self.logfile_pattern)
+        self.assertEqual(len(targets), 1)
+        logfile, seekfile, listed_stat = targets[0]
+
+        # rotate
+        os.rename(self.logfile, self.logfile1)
+        self._write_logfile(self.logfile, line)
+
+        # the replaced log file is skipped for the seek file of the old inode.
+        self.assertEqual(log._scan_log(logfile, seekfile, listed_stat), None)
+        self.assertFalse(os.path.exists(seekfile))
+
+    def test_listing_cache(self):
+        """--listing-cache option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["listing_cache"] = True
+        log = LogChecker(self.config)
+
+        subdir = os.path.join(self.LOGDIR, 'sub')
+        sub_logfile = os.path.join(subdir, 'testlog')
+        new_logfile = os.path.join(subdir, 'testlog.new')
+        logfile_pattern = os.path.join(self.LOGDIR, '**', 'testlog*')
+        listing_file = os.path.join(
+            self.STATEDIR,
+            LogChecker.get_digest(logfile_pattern) + LogChecker._SUFFIX_LISTING)
+        os.mkdir(subdir)
+        try:
+            # Dec  5 12:34:50 hostname test: ERROR
+            line = self._make_line(self._get_timestamp(), "test", "ERROR")
+            self._write_logfile(self.logfile, line)
+            self._write_logfile(sub_logfile, line)
+            past_time = time.time() - 60
+            os.utime(self.LOGDIR, (past_time, past_time))
+            os.utime(subdir, (past_time, past_time))
+            log.clear_state()
+            log.check(logfile_pattern)
+
+            # '**' matches zero or more directories.
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                log.get_message(),
+                self.MESSAGE_WARNING_TWO_IN_TWO_FILES.format(
+                    line, self.logfile, line, sub_logfile))
+            self.assertTrue(os.path.exists(listing_file))
+
+            # The listing is reused while the directory is not modified.
+            self._write_logfile(new_logfile, line)
+            os.utime(subdir, (past_time, past_time))
+            log.clear_state()
+            log.check(logfile_pattern)
+            self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+
+            # The directory is listed again if it is modified.
+            os.utime(subdir, (past_time + 1, past_time + 1))
+            log.clear_state()
+            log.check(logfile_pattern)
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                log.get_message(),
+                self.MESSAGE_WARNING_ONE.format(line, new_logfile))
+
+            # The log files listed for the manifest are scanned without
+            # listing them again.
+            tracefile = os.path.join(self.STATEDIR, 'check_log_ng.trace')
+            self.config["trace"] = tracefile
+            log = LogChecker(self.config)
+            self._write_logfile(new_logfile, line)
+            os.utime(subdir, None)
+            log.check(logfile_pattern)
+            log.close()
+            with io.open(tracefile, mode='r', encoding='utf-8') as fileobj:
+                events = [json.loads(entry) for entry in fileobj]
+            os.unlink(tracefile)
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                [e['directory'] for e in events if e['event'] == 'listdir'],
+                [subdir])
+        finally:
+            for filename in [sub_logfile, new_logfile, listing_file]:
+                if os.path.exists(filename):
+                    os.unlink(filename)
+            os.rmdir(subdir)
+
     def test_critical_pattern(self):
         """--critical-pattern option
         """
@@ -478,6 +853,32 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_OK)
         self.assertEqual(log.get_message(), self.MESSAGE_OK)
 
+    def test_multiple_patterns(self):
+        """--patternfile with multiple patterns
+        """
+        self.config["pattern_list"] = ["ERROR", r"(WARN)\1", "FATAL"]
+        self.config["negpattern_list"] = ["IGNORE", "SKIP"]
+        log = LogChecker(self.config)
+
+        self.assertEqual(log.matchers["pattern"].combined, None)
+        self.assertNotEqual(log.matchers["negpattern"].combined, None)
+        self.assertEqual(log.matchers["negpattern"].search("a SKIP"), "SKIP")
+
+        # Dec  5 12:34:50 hostname test: WARNWARN
+        # Dec  5 12:34:50 hostname test: FATAL SKIP
+        # Dec  5 12:34:50 hostname test: FATAL
+        line1 = self._make_line(self._get_timestamp(), "test", "WARNWARN")
+        line2 = self._make_line(self._get_timestamp(), "test", "FATAL SKIP")
+        line3 = self._make_line(self._get_timestamp(), "test", "FATAL")
+        self._write_logfile(self.logfile, [line1, line2, line3])
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_TWO.format(line1, line3, self.logfile))
+
     def test_encoding(self):
         """--pattern and --encoding
         """
@@ -496,6 +897,169 @@ class LogCheckerTestCase(unittest.TestCase):
             log.get_message(),
             self.MESSAGE_WARNING_ONE.format(line, self.logfile))
 
+    def test_literal_screen(self):
+        """Screening lines by the required literals of patterns
+        """
+        self.assertEqual(LogChecker.get_required_literal("ERRORS?"), "ERROR")
+        self.assertEqual(
+            LogChecker.get_required_literal("segfault at [0-9a-f]+"),
+            "segfault at ")
+        self.assertEqual(LogChecker.get_required_literal("Out[Oo]fMemory"), "fMemory")
+        self.assertEqual(LogChecker.get_required_literal(r"a\.b\d+"), "a.b")
+        self.assertEqual(LogChecker.get_required_literal("ERROR|FATAL"), None)
+        self.assertEqual(LogChecker.get_required_literal("(?i)error"), None)
+
+        self.config["pattern_list"] = ["ERROR", "ERRNO", "Out[Oo]fMemory"]
+        self.config["critical_pattern_list"] = ["FATAL", "PANIC|EMERG"]
+        self.config["case_insensitive"] = True
+        log = LogChecker(self.config)
+        self.assertNotEqual(log.matchers["pattern"].screen, None)
+        self.assertEqual(log.matchers["critical_pattern"].screen, None)
+
+        # Dec  5 12:34:50 hostname test: outofmemory
+        # Dec  5 12:34:50 hostname test: emerg
+        line1 = self._make_line(self._get_timestamp(), "test", "outofmemory")
+        line2 = self._make_line(self._get_timestamp(), "test", "emerg")
+        self._write_logfile(self.logfile, [line1, line2])
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
+        self.assertEqual(
+            log.get_message(),
+            "{0}, {1}".format(
+                self.MESSAGE_CRITICAL_ONE.format(line2, self.logfile),
+                "Found 1 lines (limit=1/0): {0} at {1}".format(
+                    line1, self.logfile)))
+
+    def test_byte_scan(self):
+        """--byte-scan option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["critical_pattern_list"] = ["FATAL"]
+        self.config["negpattern_list"] = ["IGNORE"]
+        self.config["encoding"] = "EUC-JP"
+        self.config["byte_scan"] = True
+        log = LogChecker(self.config)
+        self.assertNotEqual(log.byte_matcher, None)
+
+        # Dec  5 12:34:50 hostname test: エラー ERROR
+        # Dec  5 12:34:50 hostname test: エラー ERROR IGNORE
+        # Dec  5 12:34:50 hostname test: FATAL
+        line1 = self._make_line(self._get_timestamp(), "test", "エラー ERROR")
+        line2 = self._make_line(
+            self._get_timestamp(), "test", "エラー ERROR IGNORE")
+        line3 = self._make_line(self._get_timestamp(), "test", "FATAL")
+        self._write_logfile(self.logfile, [line1, line2, line3], encoding='EUC-JP')
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
+        self.assertEqual(
+            log.get_message(),
+            "{0}, {1}".format(
+                self.MESSAGE_CRITICAL_ONE.format(line3, self.logfile),
+                "Found 1 lines (limit=1/0): {0} at {1}".format(
+                    line1, self.logfile)))
+        self.assertEqual(log.get_stats().lines, 5)
+
+        # the chunk can not be searched at once.
+        self.config["pattern_list"] = ["ERROR$"]
+        self.config["critical_pattern_list"] = []
+        log = LogChecker(self.config)
+        self.assertEqual(log.byte_matcher.chunk_screen, None)
+        self._write_logfile(self.logfile, [line1, line2], encoding='EUC-JP')
+        log.clear_state()
+        log.check(self.logfile)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line1, self.logfile))
+        self.assertEqual(log.get_stats().lines, 4)
+
+        # patterns which may not match as bytes
+        self.config["encoding"] = "utf-8"
+        self.config["negpattern_list"] = []
+        for pattern, message, case_insensitive in [
+                ("Xエ?Y", "XY", False),
+                ("エ.ー", "エラー", False),
+                ("エラー\\d", "エラー1", False),
+                ("ÉCHEC", "échec", True),
+                ("E\\w", "Eé", False),
+                ("a.b", "aéb", False),
+                ("[^x]b", "éb", False),
+                ("kelvin", "\u212aelvin", True)]:
+            self.config["pattern_list"] = [pattern]
+            self.config["case_insensitive"] = case_insensitive
+            log = LogChecker(self.config)
+            self.assertEqual(log.byte_matcher, None)
+            line = self._make_line(self._get_timestamp(), "test", message)
+            self._write_logfile(self.logfile, [line])
+            log.clear_state()
+            log.check(self.logfile)
+
+            # the same as the text scan, which depends on the unicode support
+            # of re.
+            if not re.search(pattern, message, log.pattern_flags):
+                self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+                continue
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                log.get_message(),
+                self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+        self.config["case_insensitive"] = False
+
+        # not available
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["encoding"] = "UTF-16"
+        log = LogChecker(self.config)
+        self.assertEqual(log.byte_matcher, None)
+
+        self.config["encoding"] = "utf-8"
+        self.config["logformat"] = r"^(%b %e %T) \S+ (.*)$"
+        log = LogChecker(self.config)
+        self.assertEqual(log.byte_matcher, None)
+
+    def test_line_reader(self):
+        """Reading lines in chunks
+        """
+        data = b"line1\nline2 is long\n\nline4\nline5"
+        with io.open(self.logfile, mode='wb') as fileobj:
+            fileobj.write(data)
+
+        chunk_size = _LineReader.CHUNK_SIZE
+        try:
+            for size in [4, 8, 1024]:
+                _LineReader.CHUNK_SIZE = size
+                for start_position in [0, 6, len(data)]:
+                    expected = data[start_position:].split(b"\n")
+                    if not expected[-1]:
+                        expected.pop()
+
+                    # file
+                    with io.open(self.logfile, mode='rb') as fileobj:
+                        reader = _LineReader(fileobj, start_position)
+                        self.assertEqual(list(reader), expected)
+                        self.assertEqual(reader.position, len(data))
+
+                    # stream
+                    reader = _LineReader(io.BytesIO(data), start_position)
+                    self.assertEqual(list(reader), expected)
+                    self.assertEqual(reader.position, len(data))
+
+            # truncated while read, only the buffered bytes are read.
+            _LineReader.CHUNK_SIZE = 8
+            with io.open(self.logfile, mode='rb') as fileobj:
+                reader = _LineReader(fileobj)
+                chunks = reader.iter_chunks()
+                self.assertEqual(next(chunks), (0, b"line1\n"))
+                io.open(self.logfile, mode='wb').close()
+                list(chunks)
+                self.assertTrue(reader.position <= len(data))
+        finally:
+            _LineReader.CHUNK_SIZE = chunk_size
+
     def test_multiline(self):
         """--multiline
         """
@@ -539,6 +1103,44 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_OK)
         self.assertEqual(log.get_message(), self.MESSAGE_OK)
 
+    def test_multiline_max_lines(self):
+        """--multiline-max-lines
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["negpattern_list"] = ["IGNORE"]
+        self.config["multiline"] = True
+        self.config["multiline_max_lines"] = 2
+        log = LogChecker(self.config)
+
+        # The message is matched in segments of 2 lines,
+        # and only the first segment is output.
+        timestamp = self._get_timestamp()
+        lines = []
+        messages = ["INFO1", "INFO2", "INFO3", "ERROR4", "INFO5"]
+        for message in messages:
+            lines.append(self._make_line(timestamp, "test", message))
+        self._write_logfile(self.logfile, lines)
+        log.clear_state()
+        log.check(self.logfile)
+
+        # detected line: Dec  5 12:34:50 hostname test: INFO1 INFO2 ... (truncated, 5 lines)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(
+                lines[0] + " INFO2 ... (truncated, 5 lines)", self.logfile))
+
+        # The negative pattern in the other segment is also effective.
+        timestamp = self._get_timestamp()
+        lines = []
+        messages = ["ERROR1", "INFO2", "IGNORE3"]
+        for message in messages:
+            lines.append(self._make_line(timestamp, "test", message))
+        self._write_logfile(self.logfile, lines)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+
     def test_logfile(self):
         """--logfile option
         """
@@ -580,6 +1182,36 @@ class LogCheckerTestCase(unittest.TestCase):
             self.MESSAGE_WARNING_TWO_IN_TWO_FILES.format(
                 line1, self.logfile1, line2, self.logfile2))
 
+    def test_jobs(self):
+        """--jobs option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["jobs"] = 2
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile1, line1)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile2, line2)
+        log.clear_state()
+        log.check(self.logfile_pattern)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_TWO_IN_TWO_FILES.format(
+                line1, self.logfile1, line2, self.logfile2))
+
+        # the seek files are updated.
+        log.clear_state()
+        log.check(self.logfile_pattern)
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        self.assertEqual(log.get_message(), self.MESSAGE_OK)
+
     def test_trace_inode(self):
         """--trace_inode
         """
@@ -627,6 +1259,145 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertTrue(os.path.exists(seekfile_2))
         self.assertTrue(os.path.exists(seekfile1_2))
 
+    def test_compressed_logfile(self):
+        """--trace_inode option, the rotated log file compressed
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["trace_inode"] = True
+        log = LogChecker(self.config)
+
+        # The head of the log file is longer than _HEAD_SIZE.
+        # Dec  5 12:34:50 hostname test: ERROR1
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR1")
+        noop = self._make_line(self._get_timestamp(), "noop", "NOOP")
+        self._write_logfile(self.logfile, [noop] * 30 + [line1])
+        log.check(self.logfile_pattern)
+
+        # update logfile
+        # Dec  5 12:34:51 hostname test: ERROR2
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR2")
+        self._write_logfile(self.logfile, line2)
+
+        # log rotation and compression
+        os.rename(self.logfile, self.logfile1)
+        with io.open(self.logfile1, mode='rb') as fileobj:
+            data = fileobj.read()
+        gzipobj = gzip.GzipFile(self.logfile2, mode='wb')
+        gzipobj.write(data)
+        gzipobj.close()
+        os.unlink(self.logfile1)
+        line3 = self._make_line(self._get_timestamp(), "noop", "NOOP")
+        self._write_logfile(self.logfile, line3)
+
+        # The compressed log file is scanned from the position where
+        # the log file was scanned before rotated.
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line2, self.logfile2))
+
+        # The compressed log file is not scanned again.
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        self.assertEqual(log.get_stats().files, [])
+
+        # The compressed data appended is scanned from the seek position.
+        # Dec  5 12:34:52 hostname test: ERROR4
+        line4 = self._make_line(self._get_timestamp(), "test", "ERROR4")
+        gzipobj = gzip.GzipFile(self.logfile2, mode='ab')
+        gzipobj.write((line4 + "\n").encode('utf-8'))
+        gzipobj.close()
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line4, self.logfile2))
+
+        # The compressed log file being written is scanned after completed.
+        # Dec  5 12:34:53 hostname test: ERROR5
+        line5 = self._make_line(self._get_timestamp(), "test", "ERROR5")
+        gzipobj = gzip.GzipFile(self.logfile1, mode='wb')
+        gzipobj.write((line5 + "\n").encode('utf-8'))
+        gzipobj.close()
+        with io.open(self.logfile1, mode='rb') as fileobj:
+            data = fileobj.read()
+        for size in [len(data) // 2, len(data) - 4]:
+            with io.open(self.logfile1, mode='wb') as fileobj:
+                fileobj.write(data[:size])
+            log.clear_state()
+            log.check(self.logfile_pattern)
+            self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        with io.open(self.logfile1, mode='wb') as fileobj:
+            fileobj.write(data)
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line5, self.logfile1))
+
+        # The other compressed log file with the same head is scanned from
+        # the beginning, because its size is different.
+        # Dec  5 12:34:54 hostname test: ERROR6
+        line6 = self._make_line(self._get_timestamp(), "test", "ERROR6")
+        gzipobj = gzip.GzipFile(self.logfile2, mode='rb')
+        head = b''.join(gzipobj.read().splitlines(True)[:31])
+        gzipobj.close()
+        self.assertTrue(len(head) > LogChecker._HEAD_SIZE)
+        os.unlink(self.logfile1)
+        gzipobj = gzip.GzipFile(self.logfile1, mode='wb')
+        gzipobj.write(head + (line6 + "\n").encode('utf-8'))
+        gzipobj.close()
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line6, self.logfile1))
+
+    def test_truncated_or_replaced_logfile(self):
+        """The log file truncated or replaced since the last check
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        log = LogChecker(self.config)
+
+        # Dec  5 12:34:50 hostname test: ERROR1
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR1")
+        self._write_logfile(self.logfile, line1)
+        log.check(self.logfile)
+
+        # truncated and grown beyond the seek position
+        # Dec  5 12:34:51 hostname test: ERROR2
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR2")
+        io.open(self.logfile, mode='w').close()
+        self._write_logfile(self.logfile, [line2, line2])
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_TWO.format(line2, line2, self.logfile))
+
+        # replaced by the copy with a new line
+        # Dec  5 12:34:52 hostname test: ERROR3
+        line3 = self._make_line(self._get_timestamp(), "test", "ERROR3")
+        with io.open(self.logfile, mode='rb') as fileobj:
+            data = fileobj.read()
+        with io.open(self.logfile1, mode='wb') as fileobj:
+            fileobj.write(data)
+        self._write_logfile(self.logfile1, line3)
+        os.rename(self.logfile1, self.logfile)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line3, self.logfile))
+
     def test_scantime(self):
         """--scantime option
         """
@@ -676,6 +1447,43 @@ class LogCheckerTestCase(unittest.TestCase):
             log.get_message(),
             self.MESSAGE_WARNING_ONE.format(line4, self.logfile2))
 
+    def test_seek_by_time(self):
+        """--seek-by-time option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["scantime"] = 3600
+        self.config["seek_by_time"] = True
+        log = LogChecker(self.config)
+
+        # The old lines exceed the size to be searched linearly.
+        # Dec  3 12:34:50 hostname test: ERROR0
+        old_timestamp = LogChecker.to_unicode(
+            (datetime.datetime.now() - datetime.timedelta(days=2)).strftime(
+                "%b %e %T"))
+        old_lines = [
+            self._make_line(old_timestamp, "test", "ERROR{0}".format(i))
+            for i in range(3000)]
+        # Dec  5 12:34:50 hostname test: ERROR
+        line = self._make_line(self._get_timestamp(), "test", "ERROR")
+        fileobj = io.open(self.logfile, mode='w', encoding='utf-8')
+        fileobj.write("\n".join(old_lines + [line]) + "\n")
+        fileobj.close()
+
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(), self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+        self.assertTrue(log.get_stats().bytes < os.path.getsize(self.logfile))
+
+        # The seek file is used after the first check.
+        self._write_logfile(self.logfile, old_lines[0])
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(old_lines[0], self.logfile))
+
     def test_remove_seekfile(self):
         """--expiration and --remove-seekfile options
         """
@@ -734,6 +1542,109 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertFalse(os.path.exists(self.seekfile1))
         self.assertTrue(os.path.exists(self.seekfile2))
 
+    def test_state_backend_sqlite(self):
+        """--state-backend=sqlite option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["expiration"] = 1
+        self.config["state_backend"] = "sqlite"
+        log = LogChecker(self.config)
+        database = os.path.join(self.STATEDIR, LogChecker._STATE_DATABASE)
+        seekfile1 = log._create_seek_filename(self.logfile_pattern, self.logfile1)
+        seekfile2 = log._create_seek_filename(self.logfile_pattern, self.logfile2)
+
+        def get_names():
+            connection = sqlite3.connect(database)
+            names = [row[0] for row in connection.execute("SELECT name FROM seek")]
+            connection.close()
+            return sorted(names)
+
+        try:
+            # Dec  5 12:34:50 hostname test: ERROR
+            line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
+            self._write_logfile(self.logfile1, line1)
+            log.check(self.logfile_pattern, remove_seekfile=True)
+
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                log.get_message(),
+                self.MESSAGE_WARNING_ONE.format(line1, self.logfile1))
+            self.assertFalse(os.path.exists(seekfile1))
+            self.assertEqual(get_names(), [os.path.basename(seekfile1)])
+
+            # the seek position is stored.
+            log.clear_state()
+            log.check(self.logfile_pattern)
+
+            self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+
+            # the seek position of logfile1 is expired.
+            time.sleep(1.5)
+            # Dec  5 12:34:50 hostname test: ERROR
+            line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
+            self._write_logfile(self.logfile2, line2)
+            log.clear_state()
+            log.check(self.logfile_pattern, remove_seekfile=True)
+
+            self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self.assertEqual(
+                log.get_message(),
+                self.MESSAGE_WARNING_ONE.format(line2, self.logfile2))
+            self.assertEqual(get_names(), [os.path.basename(seekfile2)])
+
+            # the updates are kept in memory until commit, so that the
+            # concurrent checks can write while scanning.
+            log.clear_state()
+            log._update_seekfile(seekfile1, 5)
+            self.assertEqual(log._read_seek(seekfile1)[0], 5)
+            self.assertEqual(
+                [row[0] for row in log._find_seek(
+                    os.path.join(self.STATEDIR, '*'))],
+                [seekfile1, seekfile2])
+            self.assertEqual(get_names(), [os.path.basename(seekfile2)])
+            connection = sqlite3.connect(database, timeout=0)
+            connection.execute("BEGIN IMMEDIATE")
+
+            # the check waiting for the write lock too long is UNKNOWN.
+            timeout = _SeekDatabase._TIMEOUT
+            _SeekDatabase._TIMEOUT = 0.1
+            try:
+                # Dec  5 12:34:50 hostname test: ERROR
+                line3 = self._make_line(self._get_timestamp(), "test", "ERROR")
+                self._write_logfile(self.logfile1, line3)
+                log2 = LogChecker(self.config)
+                with self.assertRaises(SystemExit) as context:
+                    log2.check(self.logfile_pattern)
+                self.assertEqual(context.exception.code, LogChecker.STATE_UNKNOWN)
+                self.assertEqual(log2.seek_database, None)
+            finally:
+                _SeekDatabase._TIMEOUT = timeout
+                connection.rollback()
+                connection.close()
+            self.assertFalse(os.path.exists(
+                log2._create_lock_filename(self.logfile_pattern)))
+
+            # the updates discarded by the error are scanned again.
+            log2.clear_state()
+            log2.check(self.logfile_pattern)
+            self.assertEqual(log2.get_state(), LogChecker.STATE_WARNING)
+            log2.clear_state()
+            log2.check(self.logfile_pattern)
+            self.assertEqual(log2.get_state(), LogChecker.STATE_OK)
+            log2.close()
+
+            # the check scans again if the database is removed.
+            for filename in glob.glob(database + "*"):
+                os.unlink(filename)
+            log2.clear_state()
+            log2.check(self.logfile_pattern)
+            self.assertEqual(log2.get_state(), LogChecker.STATE_WARNING)
+            log2.close()
+        finally:
+            log.seek_database.connection.close()
+            for filename in glob.glob(database + "*"):
+                os.unlink(filename)
+
     def test_remove_seekfile_with_dry_run(self):
         """--expiration, --remove-seekfile, and --dry-run options
         """
@@ -1116,6 +2027,52 @@ class LogCheckerTestCase(unittest.TestCase):
 
         log._remove_cache(cachefile)
 
+    def test_unchanged_logfile(self):
+        """The check returns OK without the lock if the log files are not changed
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["lock_timeout"] = 0
+        log = LogChecker(self.config)
+        lockfile = log._create_lock_filename(self.logfile)
+
+        # Dec  5 12:34:50 hostname test: ERROR
+        line = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile, line)
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+
+        # not changed, while locked by another check
+        lockfileobj = LogChecker.lock(lockfile)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        self.assertEqual(log.get_message(), self.MESSAGE_OK)
+
+        # changed
+        self._write_logfile(self.logfile, line)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_UNKNOWN)
+        LogChecker.unlock(lockfile, lockfileobj)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+
+        # multiple log files, and a new log file
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        lockfile = log._create_lock_filename(self.logfile_pattern)
+        lockfileobj = LogChecker.lock(lockfile)
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+        self._write_logfile(self.logfile1, line)
+        log.clear_state()
+        log.check(self.logfile_pattern)
+        self.assertEqual(log.get_state(), LogChecker.STATE_UNKNOWN)
+        LogChecker.unlock(lockfile, lockfileobj)
+
     def test_lock_timeout(self):
         """--lock-timeout
         """
@@ -1198,6 +2155,418 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertTrue(elapsed_time > self.config["lock_timeout"])
         self.assertTrue(elapsed_time < locked_time)
 
+    def test_lock_waiting_for_cache(self):
+        """--lock-timeout and --cachetime
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        self.config["cachetime"] = 60
+        self.config["lock_timeout"] = 6
+        log = LogChecker(self.config)
+
+        lockfile = log._create_lock_filename(self.logfile)
+        cachefile = log._create_cache_filename(self.logfile)
+
+        # The process which has the lock publishes the cache, and the waiting
+        # process gets it as soon as the lock is released.
+        #   |time|sub               |main       |
+        #   |----|------------------|-----------|
+        #   |   0|fork              |sleep      |
+        #   |   1|lock OK           |sleep      |
+        #   |   1|                  |check      |
+        #   |   1|                  |wait lock  |
+        #   |   2|update cache      |wait lock  |
+        #   |   2|unlock OK         |wait lock  |
+        #   |   2|                  |get cache  |
+        # Dec  5 12:34:50 hostname test: ERROR
+        line = self._make_line(self._get_timestamp(), "test", "ERROR")
+        self._write_logfile(self.logfile, line)
+
+        locked_time = 2
+        wait_interval = 0.1
+        message = "WARNING: published by the another process"
+        code = (
+            "import io, time\n"
+            "from check_log_ng import LogChecker\n"
+            "lockfileobj = LogChecker.lock('{0}')\n"
+            "time.sleep({1})\n"
+            "fileobj = io.open('{2}', mode='w')\n"
+            "fileobj.write(u'1\\t{3}')\n"
+            "fileobj.close()\n"
+            "LogChecker.unlock('{0}', lockfileobj)\n"
+        ).format(lockfile, locked_time, cachefile, message)
+        proc = subprocess.Popen(['python', '-c', code])
+        for _ in range(100):
+            if os.path.isfile(lockfile):
+                break
+            time.sleep(wait_interval)
+
+        log.clear_state()
+        start_time = time.time()
+        log.check(self.logfile)
+        elapsed_time = time.time() - start_time
+        proc.wait()
+
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(log.get_message(), message)
+        self.assertTrue(elapsed_time < locked_time + 0.5)
+        self.assertFalse(os.path.exists(lockfile))
+
+    def test_daemon(self):
+        """--daemon and --socket options
+        """
+        socket_path = os.path.join(self.STATEDIR, 'check_log_ng.sock')
+        argv = [
+            '-p', 'ERROR', '-S', self.STATEDIR, '-l', self.logfile,
+            '--cachetime', '0']
+
+        # not running
+        self.assertEqual(_request_daemon(socket_path, argv), None)
+
+        # not responding
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+        try:
+            start_time = time.time()
+            self.assertEqual(
+                _request_daemon(socket_path, argv, timeout=0.5), None)
+            self.assertTrue(time.time() - start_time < 2)
+        finally:
+            server.close()
+            os.unlink(socket_path)
+
+        # The errors of the invalid arguments are written to stderr of the
+        # daemon.
+        devnull = io.open(os.devnull, mode='wb')
+        proc = subprocess.Popen(
+            ['python', 'check_log_ng.py', '--daemon', socket_path],
+            stderr=devnull)
+        try:
+            for _ in range(100):
+                if _request_daemon(socket_path, None) is not None:
+                    break
+                time.sleep(0.1)
+
+            # Dec  5 12:34:50 hostname test: ERROR
+            line = self._make_line(self._get_timestamp(), "test", "ERROR")
+            self._write_logfile(self.logfile, line)
+            state, message = _request_daemon(socket_path, argv)
+            self.assertEqual(state, LogChecker.STATE_WARNING)
+            self.assertEqual(
+                message, self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+
+            # the seek file is updated by the daemon.
+            state, message = _request_daemon(socket_path, argv)
+            self.assertEqual(state, LogChecker.STATE_OK)
+            self.assertEqual(message, self.MESSAGE_OK)
+
+            # invalid arguments are checked by the client itself.
+            self.assertEqual(_request_daemon(socket_path, ['-S', self.STATEDIR]), None)
+
+            # the watcher runs by itself.
+            self.assertEqual(_request_daemon(socket_path, argv + ['--watch']), None)
+
+            # the errors of the check are returned as UNKNOWN.
+            patternfile = os.path.join(self.STATEDIR, 'check_log_ng.pattern')
+            patternfile_argv = [
+                '-P', patternfile, '-S', self.STATEDIR, '-l', self.logfile,
+                '--cachetime', '0', '-T', self.tag1]
+            state, message = _request_daemon(socket_path, patternfile_argv)
+            self.assertEqual(state, LogChecker.STATE_UNKNOWN)
+            self.assertEqual(
+                message, "Unable to find the pattern file: {0}".format(patternfile))
+
+            # the pattern file is read again when it is changed.
+            with io.open(patternfile, mode='w', encoding='utf-8') as fileobj:
+                fileobj.write("FATAL\n")
+            state, message = _request_daemon(socket_path, patternfile_argv)
+            self.assertEqual(state, LogChecker.STATE_OK)
+            with io.open(patternfile, mode='w', encoding='utf-8') as fileobj:
+                fileobj.write("ERROR\nFATAL\n")
+            # Dec  5 12:34:50 hostname test: ERROR
+            line = self._make_line(self._get_timestamp(), "test", "ERROR")
+            self._write_logfile(self.logfile, line)
+            state, message = _request_daemon(socket_path, patternfile_argv)
+            self.assertEqual(state, LogChecker.STATE_WARNING)
+            os.unlink(patternfile)
+
+            # the check waiting for the lock does not block the others.
+            lockfile = LogChecker(_generate_config(
+                _make_parser().parse_args(argv)))._create_lock_filename(self.logfile)
+            locked_proc = self._run_locked_subprocess(lockfile, 3)
+            for _ in range(100):
+                if os.path.isfile(lockfile):
+                    break
+                time.sleep(0.1)
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                client.connect(socket_path)
+                client.sendall(LogChecker.to_bytes(json.dumps({
+                    "argv": argv + ['--lock-timeout', '2'],
+                    "cwd": os.getcwd()}) + "\n"))
+                start_time = time.time()
+                state, message = _request_daemon(
+                    socket_path, argv + ['-T', self.tag2])
+                self.assertEqual(state, LogChecker.STATE_WARNING)
+                self.assertTrue(time.time() - start_time < 1)
+                fileobj = client.makefile('rb')
+                response = json.loads(LogChecker.to_unicode(fileobj.readline()))
+                fileobj.close()
+                self.assertEqual(response["state"], LogChecker.STATE_UNKNOWN)
+                self.assertEqual(
+                    response["message"], self.MESSAGE_UNKNOWN_LOCK_TIMEOUT)
+            finally:
+                client.close()
+                locked_proc.wait()
+        finally:
+            proc.terminate()
+            proc.wait()
+            devnull.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+    def test_check_definitions(self):
+        """--check-definitions option
+        """
+        definitions = os.path.join(self.STATEDIR, 'check_log_ng.definitions')
+        common = "-S '{0}' --cachetime 0".format(self.STATEDIR)
+        with io.open(definitions, mode='w', encoding='utf-8') as fileobj:
+            fileobj.write("# The checks of the same log file\n")
+            fileobj.write("-p ERROR -l '{0}' {1} -T tag1\n".format(
+                self.logfile, common))
+            fileobj.write("\n")
+            fileobj.write(
+                "-p ERROR -n IGNORE --critical-pattern FATAL "
+                "-l '{0}' {1}\n".format(self.logfile, common))
+            fileobj.write("-p ERROR -M -l '{0}' {1} -T tag2\n".format(
+                self.logfile_pattern, common))
+            fileobj.write("-p ERROR -l '{0}' {1} -T tag1\n".format(
+                self.logfile, common))
+            fileobj.write("-p ERROR {0}\n".format(common))
+
+        # Dec  5 12:34:50 hostname test: ERROR1
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR1")
+        self._write_logfile(self.logfile, line1)
+        # tag1 has already scanned the first line.
+        config = dict(self.config, pattern_list=["ERROR"])
+        LogChecker(config).check(self.logfile, tag=self.tag1)
+
+        # Dec  5 12:34:50 hostname test: ERROR2 IGNORE
+        # Dec  5 12:34:50 hostname test: FATAL
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR2 IGNORE")
+        line3 = self._make_line(self._get_timestamp(), "test", "FATAL")
+        self._write_logfile(self.logfile, [line2, line3])
+
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            state, messages = _run_check_definitions(definitions)
+            error = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue("-l/--logfile" in error)
+        self.assertEqual(state, LogChecker.STATE_CRITICAL)
+        self.assertEqual(messages, [
+            "tag1: " + self.MESSAGE_WARNING_ONE.format(line2, self.logfile),
+            "line 4: " + self.MESSAGE_CRITICAL_ONE.format(
+                line3, self.logfile) +
+            ", " + "Found 1 lines (limit=1/0): {0} at {1}".format(
+                line1, self.logfile),
+            # The lines with the same header are joined.
+            "tag2: WARNING: Found 2 lines (limit=1/0): {0},{1} FATAL at {2}".format(
+                line1, line2, self.logfile),
+            "tag1: UNKNOWN: The same check is defined more than once.",
+            "line 7: UNKNOWN: Invalid check definition."])
+
+        # Each check keeps its own seek file.
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            state, messages = _run_check_definitions(definitions)
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(state, LogChecker.STATE_UNKNOWN)
+        self.assertEqual(messages[:3], [
+            "tag1: " + self.MESSAGE_OK, "line 4: " + self.MESSAGE_OK,
+            "tag2: " + self.MESSAGE_OK])
+
+        # The check exiting by the error does not abort the other checks,
+        # and the time to scan is added to each check.
+        with io.open(definitions, mode='w', encoding='utf-8') as fileobj:
+            fileobj.write(
+                "-p ERROR -l '{0}' {1} -T tag3 --dry-run "
+                "-F '^(\\[\\S+\\] )(.*)$'\n".format(self.logfile1, common))
+            fileobj.write("-p ERROR -l '{0}' {1} -T tag4 --perfdata --timing\n".format(
+                self.logfile1, common))
+        # Dec  5 12:34:50 hostname test: ERROR4
+        line4 = self._make_line(self._get_timestamp(), "test", "ERROR4")
+        self._write_logfile(self.logfile1, line4)
+
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            state, messages = _run_check_definitions(definitions)
+            error = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(state, LogChecker.STATE_UNKNOWN)
+        self.assertEqual(
+            messages[0], "tag3: UNKNOWN: The check is aborted by the error.")
+        message, perfdata = messages[1].split(" | ")
+        self.assertEqual(
+            message, "tag4: " + self.MESSAGE_WARNING_ONE.format(line4, self.logfile1))
+        self.assertTrue(perfdata.startswith("warning=1 "))
+        self.assertFalse("duration=0.000000s" in perfdata)
+        self.assertTrue("tag4:\nphase" in error)
+        self.assertTrue("\nscan " in error)
+        self.assertEqual(
+            glob.glob(os.path.join(self.STATEDIR, '*.lock')), [])
+        os.unlink(definitions)
+
+    def test_watch(self):
+        """--watch option
+        """
+        self.config["pattern_list"] = ["ERROR"]
+        log = LogChecker(self.config)
+        pendingfile = log._create_pending_filename(self.logfile)
+
+        # The pending file is not written without found lines.
+        self._write_logfile(self.logfile, [])
+        self.assertTrue(log.accumulate(self.logfile))
+        self.assertFalse(os.path.exists(pendingfile))
+
+        # Dec  5 12:34:50 hostname test: ERROR1
+        line1 = self._make_line(self._get_timestamp(), "test", "ERROR1")
+        self._write_logfile(self.logfile, line1)
+        self.assertTrue(log.accumulate(self.logfile))
+        self.assertTrue(os.path.exists(pendingfile))
+
+        # The check reports the found lines kept by the watcher
+        # and the lines written after that.
+        # Dec  5 12:34:50 hostname test: ERROR2
+        line2 = self._make_line(self._get_timestamp(), "test", "ERROR2")
+        self._write_logfile(self.logfile, line2)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_TWO.format(line1, line2, self.logfile))
+        self.assertFalse(os.path.exists(pendingfile))
+
+        # The found lines kept by the watcher are reported even if
+        # the log file is not updated.
+        # Dec  5 12:34:50 hostname test: ERROR3
+        line3 = self._make_line(self._get_timestamp(), "test", "ERROR3")
+        self._write_logfile(self.logfile, line3)
+        self.assertTrue(log.accumulate(self.logfile))
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line3, self.logfile))
+
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
+
+        # The pending file is merged for each log file if it grows large.
+        self.config["output_limit"] = 1
+        log = LogChecker(self.config)
+        pendingfile = log._create_pending_filename(self.logfile)
+        compact_size = LogChecker._PENDING_COMPACT_SIZE
+        LogChecker._PENDING_COMPACT_SIZE = 0
+        try:
+            for _ in range(3):
+                self._write_logfile(self.logfile, [line1, line2])
+                self.assertTrue(log.accumulate(self.logfile))
+        finally:
+            LogChecker._PENDING_COMPACT_SIZE = compact_size
+        with io.open(pendingfile, mode='r', encoding='utf-8') as fileobj:
+            entries = [json.loads(entry) for entry in fileobj]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(
+            [item['message'] for item in entries[0]['found']],
+            ["ERROR1", "ERROR2"])
+        self.assertEqual(entries[0]['found_count'], 6)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(len(log.found), 6)
+        self.assertFalse(os.path.exists(pendingfile))
+        self.config["output_limit"] = 0
+        log = LogChecker(self.config)
+        pendingfile = log._create_pending_filename(self.logfile)
+
+        # The lines omitted by merging without output_limit are counted.
+        max_lines = LogChecker._PENDING_MAX_LINES
+        LogChecker._PENDING_COMPACT_SIZE = 0
+        LogChecker._PENDING_MAX_LINES = 1
+        try:
+            for _ in range(3):
+                self._write_logfile(self.logfile, [line1, line2])
+                self.assertTrue(log.accumulate(self.logfile))
+            self._write_logfile(self.logfile, line3)
+            log.clear_state()
+            log.check(self.logfile)
+        finally:
+            LogChecker._PENDING_COMPACT_SIZE = compact_size
+            LogChecker._PENDING_MAX_LINES = max_lines
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(len(log.found), 7)
+        self.assertEqual(
+            log.get_message(),
+            "WARNING: Found 7 lines (limit=1/0): "
+            "{0},(5 lines omitted),{1} at {2}".format(
+                line1, line3, self.logfile))
+
+        # The watcher scans the log file as it grows.
+        # Dec  5 12:34:50 hostname test: ERROR4
+        line4 = self._make_line(self._get_timestamp(), "test", "ERROR4")
+        proc = subprocess.Popen([
+            'python', 'check_log_ng.py', '--watch', '-p', 'ERROR',
+            '-S', self.STATEDIR, '-l', self.logfile])
+        try:
+            time.sleep(1)
+            self._write_logfile(self.logfile, line4)
+            for _ in range(100):
+                if (os.path.exists(pendingfile) and
+                        os.path.getsize(pendingfile) > 0):
+                    break
+                time.sleep(0.1)
+        finally:
+            proc.terminate()
+            proc.wait()
+        self.assertTrue(os.path.getsize(pendingfile) > 0)
+        log.clear_state()
+        log.check(self.logfile)
+        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+        self.assertEqual(
+            log.get_message(),
+            self.MESSAGE_WARNING_ONE.format(line4, self.logfile))
+
+    def test_inotify(self):
+        """The events of the watched directories
+        """
+        try:
+            inotify = _Inotify()
+        except OSError:
+            # inotify is not available on this platform.
+            return
+        try:
+            self.assertTrue(inotify.watch(self.LOGDIR))
+            self.assertFalse(inotify.watch(os.path.join(self.LOGDIR, 'none')))
+            self.assertFalse(inotify.wait(0))
+
+            # Dec  5 12:34:50 hostname test: ERROR
+            line = self._make_line(self._get_timestamp(), "test", "ERROR")
+            self._write_logfile(self.logfile, line)
+            self.assertTrue(inotify.wait(1))
+            self.assertFalse(inotify.wait(0))
+        finally:
+            inotify.close()
+
     def test_lock(self):
         """LogChecker.lock()
         """
@@ -1221,6 +2590,28 @@ class LogCheckerTestCase(unittest.TestCase):
         proc.wait()
         self.assertEqual(lockfileobj, None)
 
+        # SIGALRM is delivered just after the lock is acquired.
+        class AlarmedFcntl(object):
+            def __getattr__(self, name):
+                return getattr(fcntl, name)
+
+            @staticmethod
+            def flock(fileobj, operation):
+                fcntl.flock(fileobj, operation)
+                if operation == fcntl.LOCK_EX:
+                    os.kill(os.getpid(), signal.SIGALRM)
+
+        check_log_ng.fcntl = AlarmedFcntl()
+        try:
+            lockfileobj = LogChecker.lock(self.lockfile, timeout=5)
+        finally:
+            check_log_ng.fcntl = fcntl
+        self.assertNotEqual(lockfileobj, None)
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL)[0], 0)
+        self.assertNotEqual(
+            signal.getsignal(signal.SIGALRM), check_log_ng._raise_lock_timeout)
+        LogChecker.unlock(self.lockfile, lockfileobj)
+
     def test_unlock(self):
         """LogChecker.unlock()
         """